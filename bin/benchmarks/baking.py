@@ -0,0 +1,75 @@
+#!/usr/bin/env python3.4
+
+import os
+import timeit
+import random
+import array
+
+def relative_path(*segments):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', *segments)
+
+import sys
+sys.path.append(relative_path('..', 'src'))
+
+from sensationdriver import pattern
+from sensationdriver.pattern import Track, BezierSegments, sample_bezier_paths
+
+
+class Point(object):
+    def __init__(self, time, value):
+        self.time = time
+        self.value = value
+
+class Keyframe(object):
+    def __init__(self, control_point, out_tangent_end, in_tangent_start):
+        self.control_point = control_point
+        self.out_tangent_end = out_tangent_end
+        self.in_tangent_start = in_tangent_start
+
+
+random.seed(15)
+
+def random_keyframes(count=6, duration=2.0):
+    keyframes = []
+    for i in range(count):
+        time = duration * i / (count - 1)
+        value = random.random()
+        keyframes.append(Keyframe(Point(time, value),
+                                  out_tangent_end=Point(time + 0.1, random.random()),
+                                  in_tangent_start=Point(time - 0.1, random.random())))
+    return keyframes
+
+tracks = [random_keyframes() for _ in range(100)]
+sampling_frequency = 100
+
+
+def bake_with_tracks():
+    result = []
+    for keyframes in tracks:
+        track = Track(target_region=0, actor_index=0, priority=0, keyframes=keyframes)
+        samples = array.array('f', [track.value])
+        while not track.is_finished:
+            samples.append(track.advance(1 / sampling_frequency))
+        result.append(samples)
+    return result
+
+def bake(use_numpy, time_correct):
+    return sample_bezier_paths([BezierSegments(keyframes) for keyframes in tracks], sampling_frequency, use_numpy=use_numpy, time_correct=time_correct)
+
+
+runs = 20
+warmups = 2
+
+candidates = [('Track.advance', bake_with_tracks),
+              ('pure Python', lambda: bake(False, False)),
+              ('pure Python, time correct', lambda: bake(False, True))]
+if pattern.numpy is not None:
+    candidates.append(('NumPy', lambda: bake(True, False)))
+    candidates.append(('NumPy, time correct', lambda: bake(True, True)))
+else:
+    print('NumPy not installed - skipping vectorized baking')
+
+for name, function in candidates:
+    t = timeit.Timer(function)
+    t.timeit(warmups)
+    print('bake 100 tracks, %s:' % name, t.timeit(runs) / runs)
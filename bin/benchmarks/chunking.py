@@ -1,8 +1,15 @@
 #!/usr/bin/env python3.4
 
+import os
+import sys
 import time
+import struct
 import line_profiler
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'src'))
+
+from sensationdriver import message
+
 # @profile
 def do_stuff():
     counter = 0
@@ -136,3 +143,73 @@ splitter = Splitter()
 for run in range(0, 95):
     splitter.process(data)
 
+
+
+# bytes copied per message: bytes concatenation (old message.Splitter) vs. preallocated buffer with memoryview slices (message.Splitter itself)
+
+class ConcatenatingSplitter():
+    def __init__(self):
+        self.buffer = bytes()
+        self.start_index = 0
+        self.message_size = None
+        self.copied = 0
+
+    def process(self, new_data):
+        remaining = self.buffer[self.start_index:]
+        buffer = remaining + new_data
+        self.copied += len(remaining) + len(buffer)
+        start_index = 0
+        message_size = self.message_size
+        messages = []
+        while True:
+            if message_size is None and len(buffer) - start_index >= 4:
+                message_size = int.from_bytes(buffer[start_index:start_index + 4], byteorder='big')
+                self.copied += 4
+                start_index += 4
+            elif message_size and len(buffer) - start_index >= message_size:
+                messages.append(buffer[start_index:start_index + message_size])
+                self.copied += message_size
+                start_index += message_size
+                message_size = None
+            else:
+                break
+        self.buffer = buffer
+        self.start_index = start_index
+        self.message_size = message_size
+        return messages
+
+
+class CountingSplitter(message.Splitter):
+    """message.Splitter, counting the bytes it copies"""
+
+    def __init__(self):
+        super().__init__()
+        self.copied = 0
+
+    def _make_room(self, new_data_length):
+        self.copied += self.buffer_length - self.start_index       # the unprocessed remainder is moved
+        super()._make_room(new_data_length)
+
+    def _process_sync(self, new_data):
+        self.copied += len(new_data)                                # the new data is copied into the buffer
+        return super()._process_sync(new_data)
+
+    def process(self, new_data):
+        return self.process_sync(new_data)
+
+
+def bytes_copied_per_message(splitter, stream, read_size):
+    message_counter = 0
+    start = time.time()
+    for index in range(0, len(stream), read_size):
+        message_counter += len(splitter.process(stream[index:index + read_size]))
+    duration = (time.time() - start) * 1000
+    return splitter.copied / message_counter, message_counter, duration
+
+payload = bytes(i % 255 for i in range(15))
+stream = b''.join(struct.pack('!i', len(payload)) + payload for _ in range(5000))
+
+for read_size in [512, 4096]:
+    for splitter_class in [ConcatenatingSplitter, CountingSplitter]:
+        per_message, message_counter, duration = bytes_copied_per_message(splitter_class(), stream, read_size)
+        print("%s (%d byte reads): %.1f bytes copied per message (%d msg in %.0f ms)" % (splitter_class.__name__, read_size, per_message, message_counter, duration))
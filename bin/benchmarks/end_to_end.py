@@ -0,0 +1,177 @@
+#!/usr/bin/env python3.4
+
+"""Replays a seeded stream of vibration messages against a server running the handler graph of run-server.py.
+
+The drivers are simulated (dummy.pca9685.SimulatedDriver) with a fixed latency per bus transaction, the
+client runs in a separate process. Reports the throughput, the latency from the client to the bus and
+the number of bus transactions per message as JSON.
+
+    end_to_end.py [--messages 5000] [--rate 0] [--seed 15] [--transaction-latency 0.0002] [--output results.json]
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import functools
+import contextlib
+import multiprocessing
+import yaml
+
+def relative_path(*segments):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', *segments)
+
+sys.path.append(relative_path('..', 'src'))
+
+import sensationdriver
+from sensationdriver import pipeline
+from sensationdriver import message
+from sensationdriver import handler
+from sensationdriver import actor
+from sensationdriver import protocol
+from sensationdriver.dummy import pca9685
+
+
+class ReceivedBytes(pipeline.Element):
+    """Counts the bytes received by the server"""
+
+    def __init__(self, downstream=None, logger=None):
+        super().__init__(downstream=downstream, logger=logger)
+        self.counter = 0
+
+    def _process_sync(self, data):
+        self.counter += len(data)
+        return data
+
+
+def vibrations(raw_actor_config, count, seed, min_intensity):
+    region_actors = [(protocol.Vibration.Region.Value(region['name']), [actor_config['index'] for actor_config in region['actors']]) for region in raw_actor_config['vibration']['regions']]
+    generator = random.Random(seed)
+    for i in range(count):
+        region, actor_indices = generator.choice(region_actors)
+        yield (region, generator.choice(actor_indices), generator.uniform(min_intensity, 1), 100)
+
+
+def send(port, stream, rate, connection):
+    """Runs in the client process. Sends back the wall clock time the stream started and the number of bytes sent"""
+    client = sensationdriver.Client()
+    client.connect('127.0.0.1', port)
+
+    sent = 0
+    start = time.time()
+    for index, (region, actor_index, intensity, priority) in enumerate(stream):
+        if rate:
+            delay = start + index / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        container = protocol.Message()
+        container.type = protocol.Message.VIBRATION
+        vibration = container.vibration
+        vibration.target_region, vibration.actor_index, vibration.intensity, vibration.priority = region, actor_index, intensity, priority
+        vibration.client_timestamp = int(time.time() * 1000000)
+        serialized = container.SerializeToString()
+        client.send(serialized)
+        sent += 4 + len(serialized)
+
+    client.disconnect()
+    connection.send((start, sent))
+
+
+@asyncio.coroutine
+def wait_until_processed(received, coalescer, connection, loop):
+    start, sent = yield from loop.run_in_executor(None, connection.recv)
+    while received.counter < sent:
+        yield from asyncio.sleep(0.001, loop=loop)
+    yield from coalescer.flush()
+    return start
+
+
+def milliseconds(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def run(arguments):
+    with open(relative_path('..', 'conf', 'actor_conf.json')) as f:
+        raw_actor_config = yaml.load(f)
+
+    loop = asyncio.get_event_loop()
+    driver_class = functools.partial(pca9685.SimulatedDriver, transaction_latency=arguments.transaction_latency)
+    actor_config = actor.parse_config(raw_actor_config, loop=loop, driver_class=driver_class)
+    update_frequency = raw_actor_config['vibration'].get('update_frequency', 200)
+
+    server = sensationdriver.Server(ip='127.0.0.1', loop=loop)
+    server.port = arguments.port
+    received = ReceivedBytes()
+    server.handler = received >> handler.server_graph(actor_config, update_frequency, loop=loop)
+    coalescer = next(element for element in server.handler if isinstance(element, message.Coalescer))
+
+    tracer = sensationdriver.Tracer(capacity=arguments.messages)
+    server.tracer = tracer
+    for element in server.handler:
+        element.tracer = tracer
+    for driver in actor_config['drivers']:
+        driver.tracer = tracer
+
+    pipeline.compile(server.handler)
+
+    context = multiprocessing.get_context('spawn')      # the server already runs the I2C worker threads
+    connection, client_connection = context.Pipe()
+    stream = list(vibrations(raw_actor_config, arguments.messages, arguments.seed, arguments.min_intensity))
+    client = context.Process(target=send, args=(arguments.port, stream, arguments.rate, client_connection))
+
+    with server, contextlib.redirect_stdout(sys.stderr):        # keeps the Splitter's progress output out of the results
+        for driver in actor_config['drivers']:
+            driver.transaction_counter = 0      # only count the transactions for the stream
+        client.start()
+        start = loop.run_until_complete(wait_until_processed(received, coalescer, connection, loop))
+        duration = time.time() - start
+    client.join()
+    loop.close()
+
+    transactions = sum(driver.transaction_counter for driver in actor_config['drivers'])
+    total = tracer.histograms['total']
+    return {
+        'configuration': {
+            'messages': arguments.messages,
+            'rate': arguments.rate,
+            'seed': arguments.seed,
+            'min_intensity': arguments.min_intensity,
+            'transaction_latency_ms': milliseconds(arguments.transaction_latency),
+            'i2c_worker_threads': bool(actor_config['workers']),
+            'python': sys.version.split()[0],
+        },
+        'messages_per_second': arguments.messages / duration,
+        'duration_s': duration,
+        'latency_ms': { 'count': total.count, 'p50': milliseconds(total.percentile(50)), 'p99': milliseconds(total.percentile(99)), 'max': milliseconds(total.max) },
+        'hop_latency_ms': { hop: { 'p50': milliseconds(histogram.percentile(50)), 'p99': milliseconds(histogram.percentile(99)) } for hop, histogram in tracer.histograms.items() },
+        'coalesced': coalescer.dropped_counter,
+        'i2c_transactions': transactions,
+        'i2c_transactions_per_message': transactions / arguments.messages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=0, help="messages per second, 0 sends as fast as possible")
+    parser.add_argument('--seed', type=int, default=15)
+    parser.add_argument('--min-intensity', type=float, default=0.5, help="weaker vibrations wait for the motor warmup")
+    parser.add_argument('--transaction-latency', type=float, default=0.0002, help="seconds per simulated I2C transaction")
+    parser.add_argument('--port', type=int, default=10001)
+    parser.add_argument('--output', help="JSON file to write the results to, printed if omitted")
+    arguments = parser.parse_args()
+
+    results = json.dumps(run(arguments), indent=4, sort_keys=True)
+    if arguments.output is None:
+        print(results)
+    else:
+        with open(arguments.output, 'w') as f:
+            f.write(results)
+
+
+if __name__ == '__main__':
+    main()
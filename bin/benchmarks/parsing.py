@@ -47,3 +47,19 @@ serialized = serialize()
 t = timeit.Timer(lambda: parse(serialized))
 t.timeit(warmups)
 print('parse:', t.timeit(runs) / runs / len(raw))
+
+
+batch = protocol.VibrationBatch()
+for vibration in raw:
+    batch.target_regions.append(vibration.target_region)
+    batch.actor_indices.append(vibration.actor_index)
+    batch.priorities.append(vibration.priority)
+    batch.intensities.append(vibration.intensity)
+serialized_batch = batch.SerializeToString()
+
+def parse_batch(data):
+    protocol.VibrationBatch().ParseFromString(data)
+
+t = timeit.Timer(lambda: parse_batch(serialized_batch))
+t.timeit(warmups)
+print('parse batch:', t.timeit(runs) / runs / len(raw))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3.4
+
+import os
+import time
+import random
+import asyncio
+import yaml
+
+def relative_path(*segments):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', *segments)
+
+import sys
+sys.path.append(relative_path('..', 'src'))
+
+import sensationdriver
+from sensationdriver import pipeline
+from sensationdriver import message
+from sensationdriver import handler
+from sensationdriver import actor
+from sensationdriver import protocol
+
+
+loop = asyncio.get_event_loop()
+
+with open(relative_path('..', 'conf', 'actor_conf.json')) as f:
+    raw_actor_config = yaml.load(f)
+
+
+def graph():
+    """The handler graph of run-server.py"""
+    actor_config = actor.parse_config(raw_actor_config, loop=loop)
+    root = handler.server_graph(actor_config, loop=loop)
+    coalescer = next(element for element in root if isinstance(element, message.Coalescer))
+    return root, coalescer
+
+
+random.seed(15)
+
+region_actors = [(protocol.Vibration.Region.Value(region['name']), len(region['actors'])) for region in raw_actor_config['vibration']['regions']]
+message_count = 5000
+
+def random_vibration():
+    region, actor_count = random.choice(region_actors)
+    return (region, random.randrange(actor_count), random.uniform(0.5, 1), 100)     # weaker ones wait for the motor warmup
+
+def protocol_frame(vibration):
+    container = protocol.Message()
+    container.type = protocol.Message.VIBRATION
+    container.vibration.target_region, container.vibration.actor_index, container.vibration.intensity, container.vibration.priority = vibration
+    serialized = container.SerializeToString()
+    return len(serialized).to_bytes(4, byteorder='big') + serialized
+
+def compact_frame(vibration):
+    packed = message.pack_compact_vibrations([vibration])
+    return (len(packed) | message.COMPACT_FRAME_FLAG).to_bytes(4, byteorder='big') + packed
+
+def chunks(frame, chunk_size=4096):
+    stream = b''.join(frame(random_vibration()) for i in range(message_count))
+    return [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+@asyncio.coroutine
+def run(root, coalescer, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        yield from root.process(chunk)
+        yield from coalescer.flush()        # once per chunk instead of on the coalescer's own tick
+    return time.perf_counter() - start
+
+
+def measure(chunks, compile, profiler=None, runs=10, seconds=None):
+    """The shortest duration of `runs` replays of the stream. If `seconds` is given, the stream is replayed
+    for at least that long and the mean duration returned instead - profiling with a budget only settles
+    over several of the sampler's intervals."""
+    root, coalescer = graph()
+    for element in root:
+        element.profiler = profiler     # before set_up - the vibration handler passes it on to the actors
+    loop.run_until_complete(root.set_up())
+    coalescer._flush_task.cancel()
+    if compile:
+        pipeline.compile(root)
+
+    loop.run_until_complete(run(root, coalescer, chunks))       # warm up
+    if seconds is None:
+        duration = min(loop.run_until_complete(run(root, coalescer, chunks)) for _ in range(runs))
+    else:
+        durations = []
+        while sum(durations) < seconds:
+            durations.append(loop.run_until_complete(run(root, coalescer, chunks)))
+        duration = sum(durations) / len(durations)
+    loop.run_until_complete(root.tear_down())
+    return duration
+
+
+for stream_name, frame in [('protocol messages', protocol_frame), ('compact frames', compact_frame)]:
+    stream_chunks = chunks(frame)
+    for name, compile, profiler, seconds in [('elements', False, None, None),
+                                             ('compiled', True, None, None),
+                                             ('compiled, profiled', True, sensationdriver.BinaryProfiler(), None),
+                                             ('compiled, profiled 1 in 100', True, sensationdriver.BinaryProfiler(sampler=sensationdriver.Sampler(every=100)), None),
+                                             ('compiled, mean over 5 s', True, None, 5),
+                                             ('compiled, profiled like run-server.py, mean over 5 s', True, sensationdriver.BinaryProfiler(sampler=sensationdriver.Sampler(budget=0.02)), 5)]:
+        duration = measure(stream_chunks, compile, profiler, seconds=seconds)
+        print('%s, %s: %.1f ms per %d vibrations (%.1f us per vibration)' % (stream_name, name, duration * 1000, message_count, duration / message_count * 1000000))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3.4
+
+import os
+import timeit
+import random
+
+def relative_path(*segments):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', *segments)
+
+import sys
+sys.path.append(relative_path('..', 'src'))
+
+from sortedcontainers import SortedDict
+
+from sensationdriver.actor import PrioritizedIntensity
+
+
+class SortedDictPrioritizedIntensity(object):
+    _MIN_VALUE = 0.005
+
+    def __init__(self):
+        self._values = SortedDict()
+
+    def set(self, value, priority=100):
+        value = float(value)
+        if value < self._MIN_VALUE and priority in self._values:
+            del self._values[priority]
+        else:
+            self._values[priority] = value
+
+    def eval(self):
+        if not self._values:
+            return 0.0
+        return self._values[self._values.iloc[- 1]]
+
+    def top_priority(self):
+        if not self._values:
+            return 0
+        return self._values.keys()[len(self._values) - 1]
+
+    def reset(self):
+        self._values.clear()
+
+
+random.seed(15)
+
+def updates(priority_count, count=1000):
+    priorities = [80 + 10 * i for i in range(priority_count)]
+    return [(random.random(), random.choice(priorities)) for _ in range(count)]
+
+def run(cls, updates):
+    intensity = cls()
+    for value, priority in updates:
+        intensity.set(value, priority)
+        intensity.eval()
+    for value, priority in updates[:8]:
+        intensity.set(0, priority)
+        intensity.eval()
+
+
+runs = 100
+warmups = 10
+
+for priority_count in range(1, 9):
+    data = updates(priority_count)
+    for cls in [SortedDictPrioritizedIntensity, PrioritizedIntensity]:
+        t = timeit.Timer(lambda: run(cls, data))
+        t.timeit(warmups)
+        print('%d priorities, %s:' % (priority_count, cls.__name__), t.timeit(runs) / runs / len(data))
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3.4
+
+import project
+import os
+import sys
+
+sys.path.append(project.relative_path('src'))
+
+from sensationdriver import profiler
+
+if len(sys.argv) < 2:
+    raise IndexError("Not enough parameters. Usage: convert-profile.py <binary profile:path> [<text profile:path>]")
+
+binary_path = sys.argv[1]
+if len(sys.argv) >= 3:
+    text_path = sys.argv[2]
+else:       # sensation_binary_profile_<date>.bin -> sensation_server_profile_<date>.txt, as picked up by profile_parser.rb
+    directory, name = os.path.split(binary_path)
+    text_path = os.path.join(directory, os.path.splitext(name)[0].replace('binary_profile', 'server_profile') + '.txt')
+
+profiler.convert(binary_path, text_path)
+print("converted %s to %s" % (binary_path, text_path))
@@ -26,12 +26,24 @@ def send(client, target_region, actor_index, priority, intensity, silent=False):
     vibration.actor_index = actor_index
     vibration.priority = priority
     vibration.intensity = intensity
+    vibration.client_timestamp = int(time.time() * 1000000)    # lets the server trace the latency
 
     message = protocol.Message()
     message.type = protocol.Message.VIBRATION    
     message.vibration.CopyFrom(vibration)
     client.send(message.SerializeToString())
 
+def send_batch(client, vibrations):
+    message = protocol.Message()
+    message.type = protocol.Message.VIBRATION_BATCH
+    batch = message.vibration_batch
+    for target_region, actor_index, priority, intensity in vibrations:
+        batch.target_regions.append(target_region)
+        batch.actor_indices.append(actor_index)
+        batch.priorities.append(priority)
+        batch.intensities.append(intensity)
+    client.send(message.SerializeToString())
+
 def test(client, region, index, priority, intensity):
     print("testing actor %d ..." % index)
     print("...", end="", flush=True)
@@ -90,6 +102,8 @@ else:                       # interactive mode
     print()
     print("profiling:       `profile`                    short: `pro`")
     print("profiling cont.: `profile_cont`               short: `proc`")
+    print("profiling batch: `profile_batch`              short: `prob`")
+    print("prof. compact:   `profile_compact`            short: `proco`")
     print()
     print("reconnect:       `reconnect`")
     print()
@@ -173,6 +187,30 @@ else:                       # interactive mode
                         send(client, region, i, priority, 0, True)
                     end = time.time() * 1000
                     print("Finished sending %d messages: %.0f ms" % (counter, end - start))
+                elif line == "profile_batch" or line == "prob":
+                    random.seed(42)
+                    number_of_messages = 5000
+                    batch_size = 40
+                    counter = 0
+                    start = time.time() * 1000
+                    for i in range(0, number_of_messages // batch_size):
+                        counter += batch_size
+                        send_batch(client, [(random.randint(0, 1), random.randint(0, 11), priority, random.random()) for j in range(0, batch_size)])
+                    send_batch(client, [(region, i, priority, 0) for i in range(0, 5)])
+                    end = time.time() * 1000
+                    print("Finished sending %d vibrations in batches of %d: %.0f ms" % (counter, batch_size, end - start))
+                elif line == "profile_compact" or line == "proco":
+                    random.seed(42)
+                    number_of_messages = 5000
+                    batch_size = 40
+                    counter = 0
+                    start = time.time() * 1000
+                    for i in range(0, number_of_messages // batch_size):
+                        counter += batch_size
+                        client.send_compact([(random.randint(0, 1), random.randint(0, 11), random.random(), priority) for j in range(0, batch_size)])
+                    client.send_compact([(region, i, 0, priority) for i in range(0, 5)])
+                    end = time.time() * 1000
+                    print("Finished sending %d vibrations in compact frames of %d: %.0f ms" % (counter, batch_size, end - start))
                 elif line == "profile_cont" or line == "proc":
                     random.seed(42)
                     counter = 0
@@ -18,11 +18,10 @@ sys.path.append(project.relative_path('src'))
 
 import sensationdriver
 from sensationdriver import pipeline
-from sensationdriver import message
 from sensationdriver import handler
 from sensationdriver import actor
-from sensationdriver import protocol
 from sensationdriver import platform
+from sensationdriver import metrics
 
 if platform.is_raspberry():
     from adafruit import wirebus
@@ -40,6 +39,23 @@ def excepthook(logger, *args):
   logger.critical('Uncaught exception:', exc_info=args)
 
 
+def log_metrics(logger, handler, workers):
+    for index, (element, snapshot) in enumerate(pipeline.metrics_snapshot(handler)):
+        logger.info(metrics.format_snapshot("%d %s" % (index, element.__class__.__name__), snapshot))
+    for worker in workers:
+        logger.info(metrics.format_snapshot("I2C bus %d" % worker.bus_number, worker.metrics.snapshot()))
+
+
+def log_statistics(logger, handler, workers, tracer):     # on SIGUSR1, while the server keeps running
+    lines = tracer.report()
+    if logger is None:
+        print('\n'.join(lines))
+        return
+    for line in lines:
+        logger.info(line)
+    log_metrics(logger, handler, workers)
+
+
 def protobuf_implementation():
     from google.protobuf.internal import api_implementation
     return api_implementation._default_implementation_type
@@ -47,7 +63,7 @@ def protobuf_implementation():
 
 def main():
     mode = None
-    if sys.argv[-1] in ["profile", "debug", "production"]:
+    if sys.argv[-1] in ["profile", "debug", "production", "statistics"]:
         mode = sys.argv[-1]
 
     if (len(sys.argv) >= 2 and mode is None) or len(sys.argv) >= 3:
@@ -76,8 +92,11 @@ def main():
         logger.warning("Not using C++ Protocol Buffer implementation. Things will be slow!")
 
 
+    with open(project.relative_path('conf', 'actor_conf.json')) as f:
+        raw_actor_config = yaml.load(f)
+
     wirebus.I2C.configurePinouts(logger)
-    pca9685.Driver.softwareReset()
+    pca9685.Driver.softwareReset(backend=raw_actor_config['vibration'].get('i2c_backend', 'smbus'))
 
 
     loop = asyncio.get_event_loop()
@@ -87,30 +106,43 @@ def main():
         loop.add_signal_handler(sig, loop.stop)
 
 
-    with open(project.relative_path('conf', 'actor_conf.json')) as f:
-        actor_config = actor.parse_config(yaml.load(f), loop=loop, logger=logger)
+    actor_config = actor.parse_config(raw_actor_config, loop=loop, logger=logger)
+    update_frequency = raw_actor_config['vibration'].get('update_frequency', 200)    # actuation ticks per second
 
 
     server = sensationdriver.Server(ip=ip, loop=loop, logger=logger)
 
-    noop_inlet = pipeline.Element()
-    patter_handler = handler.Pattern(inlet=noop_inlet, loop=loop, logger=logger)
-
-    server.handler = message.Splitter() >> message.Parser() >> noop_inlet >> pipeline.Logger(logger=logger) >> [message.TypeFilter(protocol.Message.VIBRATION) >> pipeline.Counter(5000) >> message.DeprecatedFilter() >> handler.Vibration(actor_config),
-                                                                                                                message.TypeFilter(protocol.Message.LOAD_PATTERN) >> pipeline.Dispatcher(patter_handler.load),
-                                                                                                                message.TypeFilter(protocol.Message.PLAY_PATTERN) >> pipeline.Dispatcher(patter_handler.play)]
+    server.handler = handler.server_graph(actor_config, update_frequency, loop=loop, logger=logger)
     
     for element in server.handler:
         element.logger = logger
 
+    statistics = mode in ["statistics", "debug"]      # metrics and latency tracing cost time on every message
+    if statistics:
+        pipeline.enable_metrics(server.handler)
+        for worker in actor_config.get('workers', []):
+            worker.metrics = metrics.Metrics()
+
+        tracer = sensationdriver.Tracer()       # latency of vibrations stamped with a client_timestamp
+        server.tracer = tracer
+        for element in server.handler:
+            element.tracer = tracer
+        for driver in actor_config['drivers']:
+            driver.tracer = tracer
+        loop.add_signal_handler(signal.SIGUSR1, log_statistics, logger, server.handler, actor_config.get('workers', []), tracer)
+
     profiler = None
     if mode == "profile":
-        profiler = sensationdriver.Profiler()
+        profile_data_path = project.relative_path('log', "sensation_binary_profile_{:%Y%m%d_%H%M}.bin".format(datetime.datetime.now()))
+        sampler = sensationdriver.Sampler(budget=0.02)     # everything, as long as profiling takes less than 2% of the time. Thin out single actions with rates={'set_pwm': 10}
+        profiler = sensationdriver.BinaryProfiler(path=profile_data_path, sampler=sampler)      # convert with bin/convert-profile.py
 
         if server.handler is not None:
             for element in server.handler:
                 element.profiler = profiler
 
+    pipeline.compile(server.handler)    # flattens the synchronous elements into plain function calls
+
     try:
         with server:
             up_and_running = "Server running with configuration %s on interface '%s'" % (mode, ip)
@@ -122,11 +154,12 @@ def main():
             loop.run_forever()
     finally:
         loop.close()
+        if statistics and logger is not None:
+            log_metrics(logger, server.handler, actor_config.get('workers', []))
         if profiler is not None:
             if logger is not None:
                 logger.info("Saving profiling data...")
-            profile_data_path = project.relative_path('log', "sensation_server_profile_{:%Y%m%d_%H%M}.txt".format(datetime.datetime.now()))
-            profiler.save_data(profile_data_path)
+            profiler.close()
 
 
 
@@ -0,0 +1,276 @@
+import os
+import fcntl
+import ctypes
+import threading
+
+# ===========================================================================
+# I2C access through the I2C_RDWR ioctl of /dev/i2c-N (see linux/i2c-dev.h)
+# Unlike smbus, one ioctl transfers several messages - to different devices, too - and block
+# writes are not limited to 32 bytes.
+# ===========================================================================
+
+class _I2CMessage(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_uint16),
+                ('flags', ctypes.c_uint16),
+                ('len', ctypes.c_uint16),
+                ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    _fields_ = [('msgs', ctypes.POINTER(_I2CMessage)),
+                ('nmsgs', ctypes.c_uint32)]
+
+
+class Bus(object):
+    "A /dev/i2c-N device, opened once and shared by all I2C objects on the bus"
+
+    I2C_RDWR             = 0x0707
+    I2C_M_RD             = 0x0001
+    MAX_MESSAGES         = 42                   # I2C_RDWR_IOCTL_MAX_MSGS
+
+    _buses = {}                                 # busnum -> Bus
+
+    @classmethod
+    def forNumber(cls, busnum):
+        if busnum not in cls._buses:
+            cls._buses[busnum] = cls(busnum)
+        return cls._buses[busnum]
+
+    def __init__(self, busnum, logger=None):
+        self.busnum = busnum
+        self.logger = logger
+        self._fd = None
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._batched = []                      # (address, data) writes waiting for the end of the batch
+        self.transfer_counter = 0               # number of ioctl calls
+
+    def _open(self):
+        self._fd = os.open("/dev/i2c-%d" % self.busnum, os.O_RDWR)
+
+    def _ioctl(self, data):
+        fcntl.ioctl(self._fd, self.I2C_RDWR, data)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def transfer(self, messages):
+        "Transfers (address, flags, ctypes.c_uint8 array) messages with as few ioctl calls as possible"
+        with self._lock:
+            if self._fd is None:
+                self._open()
+            for start in range(0, len(messages), self.MAX_MESSAGES):
+                chunk = messages[start:start + self.MAX_MESSAGES]
+                i2c_messages = (_I2CMessage * len(chunk))()
+                for i2c_message, (address, flags, buf) in zip(i2c_messages, chunk):
+                    i2c_message.addr = address
+                    i2c_message.flags = flags
+                    i2c_message.len = len(buf)
+                    i2c_message.buf = buf
+                self._ioctl(_I2CRdwrIoctlData(i2c_messages, len(chunk)))
+                self.transfer_counter += 1
+
+    def write(self, address, data):
+        "Writes the bytes to the device - at the end of the current batch, if there is one"
+        with self._lock:
+            if self._batch_depth:
+                self._batched.append((address, data))
+            else:
+                self.transfer([(address, 0, (ctypes.c_uint8 * len(data))(*data))])
+
+    def writeRead(self, address, data, length):
+        "Writes the bytes, reads length bytes with a repeated start and returns them as list"
+        result = (ctypes.c_uint8 * length)()
+        with self._lock:
+            self._flushBatch()
+            self.transfer([(address, 0, (ctypes.c_uint8 * len(data))(*data)),
+                           (address, self.I2C_M_RD, result)])
+        return list(result)
+
+    def _flushBatch(self):
+        batched = self._batched
+        if not batched:
+            return
+        self._batched = []
+        self.transfer([(address, 0, (ctypes.c_uint8 * len(data))(*data)) for address, data in batched])
+
+    def batch(self):
+        "Context manager collecting all writes on the bus to be sent with as few ioctl calls as possible"
+        return _Batch(self)
+
+
+class _Batch(object):
+    def __init__(self, bus):
+        self.bus = bus
+
+    def __enter__(self):
+        self.bus._lock.acquire()
+        self.bus._batch_depth += 1
+        return self.bus
+
+    def __exit__(self, type, value, traceback):
+        bus = self.bus
+        try:
+            bus._batch_depth -= 1
+            if bus._batch_depth == 0:
+                bus._flushBatch()
+        finally:
+            bus._lock.release()
+        return False
+
+
+class FakeBus(Bus):
+    """Bus without a /dev/i2c-N device for testing off the Pi.
+
+    Records every ioctl in `transfers` and emulates register based devices: a write sets the register
+    pointer to its first byte and stores the remaining bytes auto-incrementing, a read returns the
+    bytes starting at the register pointer.
+    """
+
+    def __init__(self, busnum=1, logger=None):
+        super().__init__(busnum, logger=logger)
+        self.transfers = []                     # [[(address, flags, bytes)]]
+        self.registers = {}                     # address -> bytearray(256)
+        self._pointers = {}                     # address -> register pointer
+
+    def _open(self):
+        self._fd = -1
+
+    def close(self):
+        self._fd = None
+
+    def _ioctl(self, data):
+        messages = []
+        for index in range(data.nmsgs):
+            message = data.msgs[index]
+            address = message.addr
+            registers = self.registers.setdefault(address, bytearray(256))
+            if message.flags & self.I2C_M_RD:
+                pointer = self._pointers.get(address, 0)
+                for offset in range(message.len):
+                    message.buf[offset] = registers[(pointer + offset) % 256]
+            else:
+                written = bytes(message.buf[offset] for offset in range(message.len))
+                if written:
+                    self._pointers[address] = written[0]
+                    for offset, value in enumerate(written[1:]):
+                        registers[(written[0] + offset) % 256] = value
+            messages.append((address, message.flags, bytes(message.buf[offset] for offset in range(message.len))))
+        self.transfers.append(messages)
+
+
+class I2C(object):
+    "Drop-in replacement for wirebus.I2C using the I2C_RDWR ioctl"
+
+    def __init__(self, address, busnum=-1, logger=None, bus=None):
+        self.logger = logger
+        self.address = address
+        if bus is None:
+            if busnum < 0:
+                from .wirebus import I2C as SMBusI2C        # imports smbus, which only exists on the Pi
+                busnum = SMBusI2C.defaultBusNumber()
+            bus = Bus.forNumber(busnum)
+        self.bus = bus
+
+    @classmethod
+    def isDeviceAnswering(cls, address, busnum=-1, bus=None):
+        "Checks if a device is answering on the given address - with a zero length write like smbus' write_quick"
+        if bus is None:
+            if busnum < 0:
+                from .wirebus import I2C as SMBusI2C
+                busnum = SMBusI2C.defaultBusNumber()
+            bus = Bus.forNumber(busnum)
+        try:
+            bus.transfer([(address, 0, (ctypes.c_uint8 * 0)())])
+            return True
+        except IOError as err:
+            return False
+
+    def errMsg(self):
+        if self.logger is not None:
+            self.logger.error("Error accessing 0x%02X: Check your I2C address", self.address)
+        return -1
+
+    def batch(self):
+        return self.bus.batch()
+
+    def write8(self, reg, value):
+        "Writes an 8-bit value to the specified register/address"
+        try:
+            self.bus.write(self.address, [reg, value & 0xFF])
+            if self.logger is not None:
+                self.logger.debug("I2C: Wrote 0x%02X to register 0x%02X", value, reg)
+        except IOError as err:
+            return self.errMsg()
+
+    def write16(self, reg, value):
+        "Writes a 16-bit value to the specified register/address pair"
+        try:
+            self.bus.write(self.address, [reg, value & 0xFF, (value >> 8) & 0xFF])
+            if self.logger is not None:
+                self.logger.debug("I2C: Wrote 0x%02X to register pair 0x%02X,0x%02X", value, reg, reg+1)
+        except IOError as err:
+            return self.errMsg()
+
+    def writeRaw8(self, value):
+        "Writes an 8-bit value on the bus"
+        try:
+            self.bus.write(self.address, [value & 0xFF])
+            if self.logger is not None:
+                self.logger.debug("I2C: Wrote 0x%02X", value)
+        except IOError as err:
+            return self.errMsg()
+
+    def writeList(self, reg, list):
+        "Writes an array of bytes using I2C format"
+        try:
+            if self.logger is not None:
+                self.logger.debug("I2C: Writing list to register 0x%02X:\n%s", reg, list)
+            self.bus.write(self.address, [reg] + list)
+        except IOError as err:
+            return self.errMsg()
+
+    def readList(self, reg, length):
+        "Read a list of bytes from the I2C device"
+        try:
+            results = self.bus.writeRead(self.address, [reg], length)
+            if self.logger is not None:
+                self.logger.debug("I2C: Device 0x%02X returned the following from reg 0x%02X:\n%s", self.address, reg, results)
+            return results
+        except IOError as err:
+            return self.errMsg()
+
+    def readU8(self, reg):
+        "Read an unsigned byte from the I2C device"
+        try:
+            result = self.bus.writeRead(self.address, [reg], 1)[0]
+            if self.logger is not None:
+                self.logger.debug("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X", self.address, result & 0xFF, reg)
+            return result
+        except IOError as err:
+            return self.errMsg()
+
+    def readS8(self, reg):
+        "Reads a signed byte from the I2C device"
+        result = self.readU8(reg)
+        if result > 127: result -= 256
+        return result
+
+    def readU16(self, reg):
+        "Reads an unsigned 16-bit value from the I2C device"
+        try:
+            low, high = self.bus.writeRead(self.address, [reg], 2)
+            result = (high << 8) | low
+            if self.logger is not None:
+                self.logger.debug("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X", self.address, result & 0xFFFF, reg)
+            return result
+        except IOError as err:
+            return self.errMsg()
+
+    def readS16(self, reg):
+        "Reads a signed 16-bit value from the I2C device"
+        result = self.readU16(reg)
+        if result > 32767: result -= 65536
+        return result
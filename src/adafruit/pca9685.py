@@ -1,6 +1,7 @@
 import time
 import math
-from .wirebus import I2C
+import threading
+from . import i2cdev
 
 # ===========================================================================
 # Based on https://github.com/adafruit/Adafruit-Raspberry-Pi-Python-Code
@@ -33,20 +34,52 @@ class Driver(object):
     __INVRT              = 1 << 4
     __OUTDRV             = 1 << 2
 
+    __CHANNELS           = 16
+    __MAX_SMBUS_BURST_CHANNELS = 8          # smbus block transfers are limited to 32 bytes
+
+
+    @classmethod
+    def _i2cClass(cls, backend):
+        if backend == 'rdwr':
+            return i2cdev.I2C
+        elif backend == 'smbus':
+            from .wirebus import I2C                            # imports smbus, which only exists on the Pi
+            return I2C
+        raise ValueError('Unknown I2C backend: %s' % backend)
 
     @classmethod
-    def softwareReset(cls):
+    def isDeviceAnswering(cls, address, busnum=-1, backend='smbus'):
+        "Checks if a device is answering on the given address, using the I2C backend"
+        return cls._i2cClass(backend).isDeviceAnswering(address, busnum)
+
+    @classmethod
+    def softwareReset(cls, backend='smbus'):
         "Sends a software reset (SWRST) command to all the servo drivers on the bus"
-        bus_numbers = I2C.pinoutConfiguredBuses()
+        from .wirebus import I2C as SMBusI2C
+        I2C = cls._i2cClass(backend)
+        bus_numbers = SMBusI2C.pinoutConfiguredBuses()
         for bus_number in bus_numbers:
             if I2C.isDeviceAnswering(0x00, bus_number):
                 general_call = I2C(0x00, bus_number)
                 general_call.writeRaw8(0x06)            # SWRST
 
-    def __init__(self, address=0x40, busnum=-1, logger=None):
+    def __init__(self, address=0x40, busnum=-1, logger=None, backend='smbus', i2c=None):
         self.logger = logger
-        self.i2c = I2C(address, busnum=busnum, logger=self.logger)
+        if i2c is not None:                                     # e.g. a recording stub for testing
+            self.i2c = i2c
+        else:
+            self.i2c = self._i2cClass(backend)(address, busnum=busnum, logger=self.logger)
+        self._burst_channels = self.__CHANNELS if backend == 'rdwr' else self.__MAX_SMBUS_BURST_CHANNELS
         self.address = address
+        self._registers = bytearray(4 * self.__CHANNELS)          # shadow copy of the LEDn_ON_L..LEDn_OFF_H registers
+        self._dirty = 0                                         # bit mask of channels changed since the last flush
+        self._device_registers = bytearray(4 * self.__CHANNELS)   # LEDn_ON_L..LEDn_OFF_H values last written to the device
+        self._cached = 0                                        # bit mask of channels whose _device_registers are valid
+        self.cache_hits = 0                                     # channel writes skipped, because the device already had the value
+        self.cache_misses = 0                                   # channel writes sent to the device
+        self.executor = None                                    # bus.Worker (or anything with a submit(key, command)) to perform flushes on
+        self._lock = threading.Lock()                           # guards the registers - flushes may run on the executor's thread
+        self.tracer = None                                      # sensationdriver.tracing.Tracer, told about every completed write
         if self.logger is not None:
             self.logger.debug("Reseting PCA9685 MODE1 (without SLEEP, but with AI) and MODE2")
         self.setAllPWM(0, 0)
@@ -94,14 +127,146 @@ class Driver(object):
         if value < 0 or value > 1: raise ValueError('PWM value not in interval [0, 1]: %s' % value)
         return int(value * 4095)
 
-    def setPWM(self, channel, on, off):
-        "Sets a single PWM channel"
+    def _pwm_bytes(self, on, off):
         on = self._scale_value(on)
         off = self._scale_value(off)
-        self.i2c.writeList(self.__LED0_ON_L+4*channel, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+        return bytes((on & 0xFF, on >> 8, off & 0xFF, off >> 8))
+
+    def _channelWrite(self, channel, data):
+        "Returns the (register, bytes) write needed to set a channel to data or None if the device already has the value"
+        index = 4*channel
+        device_registers = self._device_registers
+        if self._cached & (1 << channel):
+            if device_registers[index:index+4] == data:
+                self.cache_hits += 1
+                return None
+            if device_registers[index:index+2] == data[:2]:     # ON unchanged - only write OFF
+                self.cache_misses += 1
+                device_registers[index+2:index+4] = data[2:]
+                return (self.__LED0_OFF_L+index, list(data[2:]))
+
+        self.cache_misses += 1
+        device_registers[index:index+4] = data
+        self._cached |= 1 << channel
+        return (self.__LED0_ON_L+index, list(data))
+
+    def _pendingWrites(self):
+        "Returns the (register, bytes) writes for all queued channels, adjacent channels combined to one auto-increment block"
+        dirty = self._dirty
+        if not dirty:
+            return []
+        self._dirty = 0
+
+        registers = self._registers
+        device_registers = self._device_registers
+
+        # drop channels the device already has the value for
+        cached = self._cached & dirty
+        channel = 0
+        while cached:
+            if cached & 1:
+                index = 4*channel
+                if device_registers[index:index+4] == registers[index:index+4]:
+                    dirty &= ~(1 << channel)
+                    self.cache_hits += 1
+            cached >>= 1
+            channel += 1
+
+        writes = []
+        channel = 0
+        while dirty:
+            while not dirty & 1:                                # skip unchanged channels
+                dirty >>= 1
+                channel += 1
+            first = channel
+            while dirty & 1 and channel - first < self._burst_channels:
+                dirty >>= 1
+                channel += 1
+
+            if channel - first == 1:
+                writes.append(self._channelWrite(first, registers[4*first:4*channel]))
+            else:
+                self.cache_misses += channel - first
+                device_registers[4*first:4*channel] = registers[4*first:4*channel]
+                self._cached |= ((1 << (channel - first)) - 1) << first
+                writes.append((self.__LED0_ON_L+4*first, list(registers[4*first:4*channel])))
+        return writes
+
+    def _writeFailed(self, register, data):
+        "Invalidates the cache for the channels of a failed (register, bytes) write, as the device may not have the values"
+        first = (register - self.__LED0_ON_L) // 4
+        last = (register - self.__LED0_ON_L + len(data) - 1) // 4
+        with self._lock:
+            self._cached &= ~(((1 << (last - first + 1)) - 1) << first)
+
+    def setPWM(self, channel, on, off):
+        "Sets a single PWM channel"
+        if self.executor is not None:
+            self.queuePWM(channel, on, off)
+            self.flush()
+            return
+
+        data = self._pwm_bytes(on, off)
+        with self._lock:
+            self._registers[4*channel:4*channel+4] = data
+            self._dirty &= ~(1 << channel)
+            write = self._channelWrite(channel, data)
+        if write is not None and self.i2c.writeList(*write) == -1:
+            self._writeFailed(*write)
+        if self.tracer is not None:
+            self.tracer.written(self)
+
+    def queuePWM(self, channel, on, off):
+        "Sets a single PWM channel in the shadow registers only. The change is sent with the next flush()"
+        data = self._pwm_bytes(on, off)
+        with self._lock:
+            self._registers[4*channel:4*channel+4] = data
+            self._dirty |= 1 << channel
+
+    def flush(self):
+        "Writes all queued PWM channels - on the executor's thread, if there is one"
+        if self.executor is not None:
+            if self._dirty:
+                self.executor.submit(self, self.writePending)
+            return
+        self.writePending()
+
+    def writePending(self):
+        "Writes all queued PWM channels, adjacent channels in one auto-increment block transfer"
+        with self._lock:
+            writes = self._pendingWrites()
+        try:
+            with self.i2c.batch():
+                for register, data in writes:
+                    if self.i2c.writeList(register, data) == -1:
+                        self._writeFailed(register, data)
+        except IOError:                                           # the batched writes failed - like a failed smbus write
+            for register, data in writes:                         # it's unknown which writes reached the device
+                self._writeFailed(register, data)
+            if self.logger is not None:
+                self.logger.error("Error writing to PCA9685 0x%02X", self.address)
+            return -1
+        except Exception:
+            for register, data in writes:
+                self._writeFailed(register, data)
+            raise
+        if self.tracer is not None:
+            self.tracer.written(self)
+
+    def invalidateCache(self):
+        "Forgets which values the device has, e.g. after a batch containing this driver's writes failed"
+        with self._lock:
+            self._cached = 0
+
+    def batch(self):
+        "Context manager collecting the writes to all devices on this driver's bus, if the I2C backend supports it"
+        return self.i2c.batch()
 
     def setAllPWM(self, on, off):
         "Sets a all PWM channels"
-        on = self._scale_value(on)
-        off = self._scale_value(off)
-        self.i2c.writeList(self.__ALL_LED_ON_L, [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+        data = self._pwm_bytes(on, off)
+        with self._lock:
+            self._registers[:] = data * self.__CHANNELS
+            self._dirty = 0
+            self._cached = 0                                    # invalidate the register cache
+        self.i2c.writeList(self.__ALL_LED_ON_L, list(data))
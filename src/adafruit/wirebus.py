@@ -3,7 +3,6 @@
 import os
 import mmap
 import time
-import smbus
 
 # ===========================================================================
 # Based on https://github.com/adafruit/Adafruit-Raspberry-Pi-Python-Code
@@ -153,6 +152,7 @@ class I2C(object):
     @classmethod
     def isDeviceAnswering(cls, address, busnum=-1):
         "Checks if a device is answering on the given address"
+        import smbus                # only the smbus backend needs the module - the rest works with i2cdev, too
         try:
             bus = smbus.SMBus(busnum if busnum >= 0 else cls.defaultBusNumber())
             bus.write_quick(address)
@@ -167,6 +167,7 @@ class I2C(object):
         # Alternatively, you can hard-code the bus version below:
         # self.bus = smbus.SMBus(0); # Force I2C0 (early 256MB Pi's)
         # self.bus = smbus.SMBus(1); # Force I2C1 (512MB Pi's)
+        import smbus
         self.bus = smbus.SMBus(busnum if busnum >= 0 else I2C.defaultBusNumber())
 
     def reverseByteOrder(self, data):
@@ -184,6 +185,10 @@ class I2C(object):
             self.logger.error("Error accessing 0x%02X: Check your I2C address", self.address)
         return -1
 
+    def batch(self):
+        "Context manager for API compatibility with i2cdev.I2C - smbus transfers every write immediately"
+        return _NO_BATCH
+
     def write8(self, reg, value):
         "Writes an 8-bit value to the specified register/address"
         try:
@@ -271,6 +276,15 @@ class I2C(object):
         except IOError as err:
             return self.errMsg()
 
+class _NoBatch(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+_NO_BATCH = _NoBatch()
+
 if __name__ == '__main__':
     try:
         bus = I2C(address=0)
@@ -1,4 +1,7 @@
+from .protocol import sensationprotocol_pb2 as protocol
 from .server import Server
 from .client import Client
-from .protocol import sensationprotocol_pb2 as protocol
 from .profiler import Profiler
+from .profiler import BinaryProfiler
+from .profiler import Sampler
+from .tracing import Tracer
@@ -1,44 +1,57 @@
 import asyncio
 import time
 import traceback
-
-from sortedcontainers import SortedDict
+import bisect
 
 from . import platform
 from . import helper
+from . import bus
 
 if platform.is_raspberry():
     from adafruit import pca9685
-    from adafruit import wirebus
 else:
     from .dummy import pca9685
-    from .dummy import wirebus
 
-def parse_config(config, loop=None, logger=None):
+def parse_config(config, loop=None, logger=None, driver_class=None):
     # { 
     #     "drivers": [<Driver>],
     #     "regions": {
     #         "LEFT_HAND": [<Actor>]
-    #     }
+    #     },
+    #     "workers": [<bus.Worker>]
     # }
 
     def driver_for_address(drivers, address, i2c_bus_number):
         if address not in drivers:
-            if not wirebus.I2C.isDeviceAnswering(address, i2c_bus_number):
+            if not driver_class.isDeviceAnswering(address, i2c_bus_number, backend=i2c_backend):
                 return None
 
-            driver = pca9685.Driver(address, i2c_bus_number, logger=logger)
+            driver = driver_class(address, i2c_bus_number, logger=logger, backend=i2c_backend)
+            if use_worker_threads:
+                if i2c_bus_number not in workers:
+                    workers[i2c_bus_number] = bus.Worker(i2c_bus_number, batch=driver.batch, failed=invalidate_caches, logger=logger)
+                driver.executor = workers[i2c_bus_number]
             drivers[address] = driver
         return drivers[address]
 
+    def invalidate_caches(failed_drivers):
+        for driver in failed_drivers:
+            invalidate_cache = getattr(driver, 'invalidateCache', None)     # drivers without a register cache have none
+            if invalidate_cache is not None:
+                invalidate_cache()
+
     loop = loop if loop is not None else asyncio.get_event_loop()
+    driver_class = driver_class if driver_class is not None else pca9685.Driver     # e.g. dummy.pca9685.SimulatedDriver
 
     vibration_config = config['vibration']
     global_actor_mapping_curve_degree = vibration_config.get('actor_mapping_curve_degree', None)
     global_actor_min_intensity = vibration_config.get('actor_min_intensity', None)
     global_actor_min_intensity_warmup = vibration_config.get('actor_min_intensity_warmup', None)
     global_actor_min_instant_intensity = vibration_config.get('actor_min_instant_intensity', None)
+    use_worker_threads = vibration_config.get('i2c_worker_threads', False)
+    i2c_backend = vibration_config.get('i2c_backend', 'smbus')
 
+    workers = {}    # i2c_bus_number -> bus.Worker
     drivers = {}    # driver_address -> driver
     regions = {}    # region_name -> actor_index -> actor
     for region_config in vibration_config['regions']:
@@ -87,34 +100,65 @@ def parse_config(config, loop=None, logger=None):
 
     for region_name in regions:
         regions[region_name] = list(regions[region_name].values())
-    return { "drivers": list(drivers.values()), "regions": regions }
+    return { "drivers": list(drivers.values()), "regions": regions, "workers": list(workers.values()) }
 
 
 class PrioritizedIntensity(object):
+    # Only a handful of priorities are active per motor, so two small parallel lists sorted by priority are
+    # cheaper than a SortedDict. The value of the top priority is cached for eval().
+    __slots__ = ('_priorities', '_values', '_top_priority', '_top_value')
+
     _MIN_VALUE = 0.005
 
     def __init__(self):
-        self._values = SortedDict()
+        self._priorities = []
+        self._values = []
+        self._top_priority = 0
+        self._top_value = 0.0
 
     def set(self, value, priority=100):
         value = float(value)
-        if value < self._MIN_VALUE and priority in self._values:
-            del self._values[priority]
+        priorities = self._priorities
+        if priorities and priority == self._top_priority:
+            if value < self._MIN_VALUE:
+                del priorities[-1]
+                del self._values[-1]
+                self._update_top()
+            else:
+                self._values[-1] = value
+                self._top_value = value
+            return
+
+        index = bisect.bisect_left(priorities, priority)
+        if index < len(priorities) and priorities[index] == priority:
+            if value < self._MIN_VALUE:
+                del priorities[index]
+                del self._values[index]
+            else:
+                self._values[index] = value
+        else:
+            priorities.insert(index, priority)
+            self._values.insert(index, value)
+            self._update_top()
+
+    def _update_top(self):
+        if self._priorities:
+            self._top_priority = self._priorities[-1]
+            self._top_value = self._values[-1]
         else:
-            self._values[priority] = value
+            self._top_priority = 0
+            self._top_value = 0.0
 
     def eval(self):
-        if not self._values:
-            return 0.0
-        return self._values[self._values.iloc[- 1]]
+        return self._top_value
 
     def top_priority(self):
-        if not self._values:
-            return 0
-        return self._values.keys()[len(self._values) - 1]
+        return self._top_priority
 
     def reset(self):
-        self._values.clear()
+        del self._priorities[:]
+        del self._values[:]
+        self._update_top()
 
 
 class VibrationMotor(object):
@@ -133,6 +177,7 @@ class VibrationMotor(object):
         self.min_intensity = 0.3              # minimum intensity at which the motor will keep running (maybe after being startet at a higher intensity)
         self.min_instant_intensity = 0.5      # minimum intensity that can be applied to the motor directly
         self.min_intensity_warmup = 0.2       # how long does the motor need to be run at _MOTOR_MIN_INSTANT_INTENSITY before it's okay to switch down to _MOTOR_MIN_INTENSITY
+        self.deferred = False                 # only queue changes on the driver - whoever sets the intensity has to call driver.flush()
 
         self._intensity = PrioritizedIntensity()
         self._target_intensity = self._intensity.eval()
@@ -140,8 +185,11 @@ class VibrationMotor(object):
         self._running_since = None
 
     def _profile(self, action, *args):
-        if self.profiler is not None: 
-            self.profiler.log(action, *args)
+        profiler = self.profiler
+        if profiler is not None:
+            sampler = profiler.sampler
+            if sampler is None or not sampler.exhausted:
+                profiler.log(action, *args)
 
     def _map_intensity(self, intensity):
         return self.min_intensity + (1 - self.min_intensity) * intensity ** self.mapping_curve_degree
@@ -175,7 +223,10 @@ class VibrationMotor(object):
         
         self._profile("set_pwm", self.index_in_region, self.__current_intensity)
 
-        self.driver.setPWM(self.outlet, 0, self.__current_intensity)
+        if self.deferred:
+            self.driver.queuePWM(self.outlet, 0, self.__current_intensity)
+        else:
+            self.driver.setPWM(self.outlet, 0, self.__current_intensity)
         if value < self._SENSITIVITY:
             self._running_since = None
         elif self._running_since is None:
@@ -186,6 +237,10 @@ class VibrationMotor(object):
 
     @asyncio.coroutine
     def set_intensity(self, intensity, priority=100):
+        return self.apply_intensity(intensity, priority)
+
+    def apply_intensity(self, intensity, priority=100):
+        """Synchronous variant of set_intensity. Returns a future, which is done once the motor runs at the intensity"""
         intensity = float(intensity)
         if (intensity < 0 or intensity > 1) and self.logger:
             self.logger.warning('clamping intensity - not in interval [0, 1]: %s' % intensity)
@@ -218,7 +273,11 @@ class VibrationMotor(object):
     def set_intensity_delayed(self):
         if self._current_intensity < self.min_intensity:
             self._current_intensity = self.min_instant_intensity
+            if self.deferred:
+                self.driver.flush()
         delay = self.min_intensity_warmup - self._running_time()        
 
         yield from asyncio.sleep(delay)
         self._current_intensity = self._target_intensity
+        if self.deferred:
+            self.driver.flush()
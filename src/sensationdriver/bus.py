@@ -0,0 +1,121 @@
+import time
+import threading
+import collections
+import traceback
+
+
+class Worker(object):
+    """Runs the commands for one I2C bus on a dedicated thread, so the event loop never blocks on a bus transfer.
+
+    Commands are queued by key. Submitting a command for a key which is still waiting replaces it (the
+    latest flush of a driver covers all earlier ones), which bounds the queue by the number of keys.
+    If more than `capacity` keys are waiting, the oldest command is dropped.
+
+    If `batch` is given, it has to return a context manager. All commands waiting at once are executed
+    within one such context, which lets the I2C backend combine their transfers. If the context fails
+    (the combined transfer raised), `failed` is called with the keys of the commands executed within it.
+
+    Setting `metrics` to a metrics.Metrics records the execution time of the commands and how long they
+    waited for the thread.
+    """
+
+    def __init__(self, bus_number, capacity=16, batch=None, failed=None, logger=None):
+        self.bus_number = bus_number
+        self.capacity = capacity
+        self.batch = batch
+        self.failed = failed
+        self.logger = logger
+
+        self._commands = collections.OrderedDict()     # key -> command, oldest first
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._first_submitted = None   # perf_counter time the oldest waiting command was submitted
+        self.metrics = None
+
+        self.executed_counter = 0
+        self.coalesced_counter = 0
+        self.dropped_counter = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="i2c-%d" % self.bus_number, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        """Executes all waiting commands and stops the thread"""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive() and self.logger is not None:
+            self.logger.error("I2C worker for bus %d did not stop", self.bus_number)
+        self._thread = None
+
+    def submit(self, key, command):
+        with self._condition:
+            commands = self._commands
+            if not commands:
+                self._first_submitted = time.perf_counter()
+            if key in commands:
+                self.coalesced_counter += 1
+            elif len(commands) >= self.capacity:
+                commands.popitem(last=False)
+                self.dropped_counter += 1
+                if self.logger is not None:
+                    self.logger.warning("I2C worker queue for bus %d full - dropping oldest command", self.bus_number)
+            commands[key] = command
+            self._condition.notify()
+
+    def _run(self):
+        commands = self._commands
+        condition = self._condition
+        while True:
+            with condition:
+                while not commands and self._running:
+                    condition.wait()
+                if not commands:        # stopped and drained
+                    return
+                if self.batch is None:
+                    waiting = [commands.popitem(last=False)]
+                else:
+                    waiting = list(commands.items())
+                    commands.clear()
+                first_submitted = self._first_submitted       # kept for the remaining commands, overestimating their wait
+
+            metrics = self.metrics
+            if metrics is not None:
+                start = time.perf_counter()
+                metrics.queue_wait.record(start - first_submitted)
+                executed_counter = self.executed_counter
+
+            if self.batch is None:
+                self._execute(waiting)
+            else:
+                try:
+                    with self.batch():
+                        self._execute(waiting)
+                except Exception as ex:
+                    self._log_exception(ex)
+                    if self.failed is not None:
+                        self.failed([key for key, command in waiting])
+
+            if metrics is not None:
+                metrics.record(len(waiting), self.executed_counter - executed_counter, time.perf_counter() - start)
+
+    def _execute(self, commands):
+        for key, command in commands:
+            try:
+                command()
+                self.executed_counter += 1
+            except Exception as ex:
+                self._log_exception(ex)
+
+    def _log_exception(self, ex):
+        if self.logger is not None:
+            output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+            self.logger.critical(''.join(output))
@@ -2,6 +2,9 @@ import socket
 import struct
 import sys
 
+from .message import COMPACT_FRAME_FLAG
+from .message import pack_compact_vibrations
+
 class Client:
     def __init__(self):
         self.host = None
@@ -23,8 +26,19 @@ class Client:
         self.socket.connect((self.host, self.port))
 
     def send(self, message):
+        message_length = struct.pack('!i', len(message))  # message length as network formatted (big-endian) byte array
+        self._send(message_length, message)
+
+    def send_compact(self, vibrations):
+        """Sends (target_region, actor_index, intensity, priority) tuples as compact frame, bypassing protobuf"""
+        frame = pack_compact_vibrations(vibrations)
+        if not frame:
+            raise ValueError('A compact frame needs at least one vibration')
+        message_length = struct.pack('!I', len(frame) | COMPACT_FRAME_FLAG)
+        self._send(message_length, frame)
+
+    def _send(self, message_length, message):
         try:
-            message_length = struct.pack('!i', len(message))  # message length as network formatted (big-endian) byte array
             self.socket.sendall(message_length)
             self.socket.sendall(message)
         except BrokenPipeError as error:
@@ -33,4 +47,3 @@ class Client:
             self.reconnect()
             self.socket.sendall(message_length)
             self.socket.sendall(message)
-
@@ -0,0 +1,129 @@
+import asyncio
+import functools
+import traceback
+
+
+class Clock(object):
+    """Calls its subscribers once per tick, on absolute deadlines derived from loop.time().
+
+    Processing time doesn't shift the following ticks, so playback doesn't stretch under load. Ticks
+    which are missed entirely are skipped - or, with catch_up, run back-to-back as long as no more than
+    max_catch_up ticks are missed. Ticks starting more than late_tolerance intervals after their
+    deadline are counted as late.
+
+    Subscribers are coroutine functions taking the tick number. Returning False unsubscribes them.
+    One task drives all subscribers and only runs while there are any.
+
+    `time` (returning seconds) and the coroutine function `sleep` replace loop.time() and asyncio.sleep,
+    e.g. to test the clock on simulated time.
+    """
+
+    def __init__(self, frequency, loop=None, logger=None, catch_up=False, max_catch_up=5, late_tolerance=0.25, time=None, sleep=None):
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._time = time if time is not None else self._loop.time
+        self._sleep = sleep if sleep is not None else functools.partial(asyncio.sleep, loop=self._loop)
+        self.logger = logger
+        self.catch_up = catch_up
+        self.max_catch_up = max_catch_up
+        self.late_tolerance = late_tolerance
+
+        self._interval = 1 / frequency
+        self._start_time = None         # time() of tick 0
+        self._next_tick = 0
+        self._subscribers = []
+        self._task = None
+
+        self.tick_counter = 0
+        self.late_counter = 0
+        self.skipped_counter = 0
+        self.max_lateness = 0           # seconds
+
+    @property
+    def frequency(self):
+        return 1 / self._interval
+
+    @frequency.setter
+    def frequency(self, frequency):
+        self._interval = 1 / frequency
+        self._start_time = None         # re-anchored at the next tick
+
+    @property
+    def next_tick(self):
+        return self._next_tick
+
+    @property
+    def is_running(self):
+        return self._task is not None
+
+    def subscribe(self, callback):
+        """Subscribes the callback and returns the number of the first tick it will receive"""
+        self._subscribers.append(callback)
+        if self._task is None:
+            self._start_time = None
+            self._task = asyncio.Task(self._run(), loop=self._loop)
+        return self._next_tick
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def stop(self):
+        del self._subscribers[:]
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _deadline(self, tick):
+        if self._start_time is None:    # next tick is due now
+            self._start_time = self._time() - tick * self._interval
+        return self._start_time + tick * self._interval
+
+    @asyncio.coroutine
+    def _run(self):
+        loop = self._loop
+        time = self._time
+        try:
+            while self._subscribers:
+                deadline = self._deadline(self._next_tick)
+                now = time()
+                if now < deadline:
+                    yield from self._sleep(deadline - now)
+                    now = time()
+
+                lateness = now - deadline
+                missed = int(lateness / self._interval)
+                if missed and (not self.catch_up or missed > self.max_catch_up):
+                    self._next_tick += missed
+                    self.skipped_counter += missed
+                    lateness -= missed * self._interval
+                    if self.logger is not None:
+                        self.logger.warning("Clock skipped %d ticks", missed)
+
+                if lateness > self.late_tolerance * self._interval:
+                    self.late_counter += 1
+                    self.max_lateness = max(self.max_lateness, lateness)
+                    if self.logger is not None:
+                        self.logger.debug("Clock tick %d late by %.1f ms", self._next_tick, lateness * 1000)
+
+                tick = self._next_tick
+                self._next_tick += 1
+                self.tick_counter += 1
+                yield from self._tick(tick)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._task is asyncio.Task.current_task(loop=loop):
+                self._task = None
+
+    @asyncio.coroutine
+    def _tick(self, tick):
+        for callback in list(self._subscribers):
+            try:
+                keep = yield from callback(tick)
+            except Exception as ex:
+                keep = False
+                if self.logger is not None:
+                    output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+                    self.logger.critical(''.join(output))
+            if keep is False:
+                self.unsubscribe(callback)
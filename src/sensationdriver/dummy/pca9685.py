@@ -1,11 +1,22 @@
+import time
+import threading
+import contextlib
+
+
 class Driver(object):
     @classmethod
-    def softwareReset(cls):
-        pass
+    def isDeviceAnswering(cls, address, busnum=-1, backend='smbus'):
+        return True
 
-    def __init__(self, address=0x40, busnum=-1, logger=None):
+    @classmethod
+    def softwareReset(cls, backend='smbus'):
         pass
 
+    def __init__(self, address=0x40, busnum=-1, logger=None, backend='smbus'):
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.tracer = None
+
     def wakeUp(self):
         pass
 
@@ -16,7 +27,76 @@ class Driver(object):
         pass
 
     def setPWM(self, channel, on, off):
+        if self.tracer is not None:
+            self.tracer.written(self)
+
+    def queuePWM(self, channel, on, off):
         pass
 
+    def flush(self):
+        if self.tracer is not None:
+            self.tracer.written(self)
+
     def setAllPWM(self, on, off):
         pass
+
+    def batch(self):
+        return contextlib.ExitStack()
+
+
+class SimulatedDriver(Driver):
+    """Simulates the bus transfers of a PCA9685 - every transaction blocks for `transaction_latency` seconds.
+
+    Like adafruit.pca9685.Driver, it writes the channels queued for a flush in one transaction per
+    block of adjacent channels (at most 8 channels with smbus) and uses the executor, if there is one.
+    Only PWM channel writes are counted in `transaction_counter`.
+    """
+
+    def __init__(self, address=0x40, busnum=-1, logger=None, backend='smbus', transaction_latency=0.0002):
+        super().__init__(address, busnum, logger=logger, backend=backend)
+        self.transaction_latency = transaction_latency
+        self.executor = None
+        self.transaction_counter = 0
+        self._burst_channels = 16 if backend == 'rdwr' else 8
+        self._dirty = 0             # bit mask of channels changed since the last flush
+        self._lock = threading.Lock()
+
+    def _transfer(self, transactions):
+        self.transaction_counter += transactions
+        time.sleep(self.transaction_latency * transactions)
+        if self.tracer is not None:
+            self.tracer.written(self)
+
+    def setPWM(self, channel, on, off):
+        if self.executor is not None:
+            self.queuePWM(channel, on, off)
+            self.flush()
+            return
+        self._transfer(1)
+
+    def queuePWM(self, channel, on, off):
+        with self._lock:
+            self._dirty |= 1 << channel
+
+    def flush(self):
+        if self.executor is not None:
+            if self._dirty:
+                self.executor.submit(self, self.writePending)
+            return
+        self.writePending()
+
+    def writePending(self):
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = 0
+
+        transactions = 0
+        while dirty:
+            while not dirty & 1:
+                dirty >>= 1
+            channels = 0
+            while dirty & 1 and channels < self._burst_channels:
+                dirty >>= 1
+                channels += 1
+            transactions += 1
+        self._transfer(transactions)
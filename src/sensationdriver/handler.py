@@ -4,8 +4,14 @@ import asyncio
 from . import pipeline
 from . import protocol
 from . import helper
+from . import message
+from .clock import Clock
 from .actor import VibrationMotor
-from .pattern import Track
+from .pattern import SampleTable
+from .pattern import BezierSegments
+from .pattern import sample_bezier_paths
+from .pattern import SampleTableCache
+from .pattern import Sequencer
 
 
 class Vibration(pipeline.Element):
@@ -15,6 +21,7 @@ class Vibration(pipeline.Element):
         self._actor_config = actor_config
 
     def process_actor_config(self):
+        self.workers = self._actor_config.get('workers', [])
         self.drivers = self._actor_config['drivers']
         for driver in self.drivers:
             # TODO use ALLCALL address to set PWM frequency
@@ -41,55 +48,121 @@ class Vibration(pipeline.Element):
 
         for driver in self.drivers:
             driver.setAllPWM(0, 0)
+
+        for worker in self.workers:
+            worker.start()
         # TODO reset all actor objects to match the driver value
 
+        # actors only queue their changes, _process flushes all drivers once per batch
+        for region_index, region_actors in self.actors.items():
+            for index, actor in region_actors.items():
+                actor.deferred = True
+
         if self.profiler is not None:
             for region_index, region_actors in self.actors.items():
                 for index, actor in region_actors.items():
                     actor.profiler = self.profiler
 
     def _tear_down(self):
+        for worker in self.workers:
+            worker.stop()
+
         for driver in self.drivers:
             driver.setAllPWM(0, 0)
 
+    def actor(self, region, actor_index):
+        """Returns the actor with the index in the region or None if there is none"""
+        region_actors = self.actors.get(region)
+        if region_actors is None or actor_index not in region_actors:
+            if self.logger is not None:
+                self.logger.warning("No actor configured with index %d in region %s", actor_index, protocol.Vibration.Region.Name(region))
+            return None
+        return region_actors[actor_index]
+
+    def flush(self):
+        """Sends the changes queued by the actors to the drivers"""
+        for driver in self.drivers:
+            driver.flush()
+
+    @asyncio.coroutine
+    def _process(self, vibrations):
+        result = yield from super()._process(vibrations)
+
+        self.flush()
+
+        return result
+
     @asyncio.coroutine
     def _process_single(self, vibration):
         self._profile("process", vibration)
 
-        region = vibration.target_region
-        actor_index = vibration.actor_index
-
-        if region not in self.actors or actor_index not in self.actors[region]:
-            if self.logger is not None:
-                self.logger.warning("No actor configured with index %d in region %s", actor_index, protocol.Vibration.Region.Name(region))
+        actor = self.actor(vibration.target_region, vibration.actor_index)
+        if actor is None:
             return vibration
+        if self.tracer is not None:
+            self.tracer.dispatched(vibration, actor.driver)
 
-        actor = self.actors[vibration.target_region][vibration.actor_index]
-        
         yield from actor.set_intensity(vibration.intensity, vibration.priority)
 
         return vibration
 
 
 class Pattern(object):
-    def __init__(self, inlet, loop=None, logger=None):
+    def __init__(self, inlet, loop=None, logger=None, cache_size=4*1024*1024, vibration_handler=None, clock=None):
         self.logger = logger
         self._loop = loop if loop is not None else asyncio.get_event_loop()
 
         self.inlet = inlet
-        self.patterns = {}      # identifier -> [Tracks]
-        self.samling_frequency = 10
+        self.vibration_handler = vibration_handler      # if set, patterns are played directly on its actors instead of through the inlet
+        self.patterns = {}      # identifier -> [Tracks], kept to bake patterns again once evicted from the cache
+        self.sample_tables = SampleTableCache(cache_size)     # identifier -> [SampleTable] at samling_frequency
+        self.clock = clock if clock is not None else Clock(10, loop=self._loop, logger=logger)
+        self.sequencer = Sequencer(self.clock, self._emit, loop=self._loop, logger=logger)     # plays all patterns with one batch per tick
+
+    @property
+    def samling_frequency(self):
+        return self.clock.frequency
+
+    @samling_frequency.setter
+    def samling_frequency(self, frequency):
+        self.clock.frequency = frequency
+        self.sample_tables.clear()                      # baked for the old frequency
 
     def load(self, pattern):
         if self.logger is not None:
             self.logger.info("loaded pattern %s", pattern.identifier)
         self.patterns[pattern.identifier] = pattern.tracks
+        self._cache_sample_tables(pattern.identifier)
         return pattern
 
+    def _bake(self, identifier):
+        track_configs = []
+        paths = []
+        for track_config in self.patterns[identifier]:
+            try:
+                paths.append(BezierSegments(track_config.keyframes))
+                track_configs.append(track_config)
+            except:
+                if self.logger is not None:
+                    self.logger.error("Failed to parse track for actor %d in region %s. This track will be ignored.", track_config.actor_index, track_config.target_region)
+
+        # all tracks of the pattern in one (vectorized, if possible) pass
+        samples = sample_bezier_paths(paths, self.samling_frequency)
+        return [SampleTable(track_config.target_region, track_config.actor_index, track_samples) for track_config, track_samples in zip(track_configs, samples)]
+
+    def _cache_sample_tables(self, identifier):
+        tables = self._bake(identifier)
+        if not self.sample_tables.put(identifier, tables) and self.logger is not None:
+            self.logger.warning("Pattern %s exceeds the sample table cache size - it will be sampled on every play", identifier)
+        return tables
+
     def play(self, pattern):
-        def pattern_finished(task):
+        def pattern_finished(future):
             if self.logger is not None:
-                self.logger.info("finished playing pattern %s", pattern.identifier)
+                if future.cancelled():
+                    self.logger.info("stopped playing pattern %s", pattern.identifier)
+                else:
+                    self.logger.info("finished playing pattern %s", pattern.identifier)
 
         if self.logger is not None:
             self.logger.info("play pattern %s", pattern.identifier)
@@ -98,39 +171,53 @@ class Pattern(object):
                 self.logger.warning("Unknown pattern to play: %s", pattern.identifier)
             return pattern
 
-        tracks = []
-        for track_config in self.patterns[pattern.identifier]:
-            try:
-                track = Track(target_region=track_config.target_region, actor_index=track_config.actor_index, priority=pattern.priority, keyframes=track_config.keyframes)
-                tracks.append(track)
-            except:
-                if self.logger is not None:
-                    self.logger.error("Failed to parse track for actor %d in region %s. This track will be ignored.", track_config.actor_index, track_config.target_region)
+        tables = self.sample_tables.get(pattern.identifier)
+        if tables is None:
+            tables = self._cache_sample_tables(pattern.identifier)
 
-        task = helper.create_exception_reporting_task(self._sample_tracks(tracks), loop=self._loop, logger=self.logger)
-        task.add_done_callback(pattern_finished)
-        return task
+        if self.vibration_handler is None:
+            tracks = [(table, table.samples) for table in tables]
+        else:
+            # resolve the actors once - every tick then only passes floats to them
+            tracks = []
+            for table in tables:
+                actor = self.vibration_handler.actor(table.target_region, table.actor_index)
+                if actor is not None:
+                    tracks.append((actor, table.samples))
 
-    @asyncio.coroutine    
-    def _sample_tracks(self, tracks):
         if self.logger is not None:
-            self.logger.info("playing %d tracks", len(tracks))
-        delta_time = 0
-        loop = self._loop
-        while tracks:
-            messages = []
-            for track in tracks:
-                track.advance(delta_time)
+            self.logger.info("playing %d tracks%s", len(tracks), " in a loop" if pattern.loop else "")
+        playback = self.sequencer.play(pattern.identifier, tracks, pattern.priority, loop=pattern.loop)
+        playback.finished.add_done_callback(pattern_finished)
+        return playback.finished
 
-                messages.append(track.create_message())
-
-            yield from self.inlet.process(messages)
-
-            tracks = [t for t in tracks if not t.is_finished]
-            sleep_start = loop.time()
-            yield from self._sleep_for_sampling_interval()      # TODO: improve this: measure the time needed to reduce sleeping time
-            delta_time = loop.time() - sleep_start
+    def stop(self, pattern):
+        """Stops all playbacks of the pattern - looping ones included. Their futures are cancelled"""
+        if self.logger is not None:
+            self.logger.info("stop pattern %s", pattern.identifier)
+        stopped = self.sequencer.stop(pattern.identifier)
+        if stopped == 0 and self.logger is not None:
+            self.logger.warning("Pattern to stop is not playing: %s", pattern.identifier)
+        return stopped
 
     @asyncio.coroutine
-    def _sleep_for_sampling_interval(self):
-        yield from asyncio.sleep(1 / self.samling_frequency)
+    def _emit(self, samples):
+        if self.vibration_handler is None:
+            vibrations = [message.VibrationRecord(table.target_region, table.actor_index, intensity, priority) for table, intensity, priority in samples]
+            yield from self.inlet.process([message.CompactVibrations(message.COMPACT_VIBRATIONS, vibrations)])
+        else:
+            for actor, intensity, priority in samples:
+                actor.apply_intensity(intensity, priority)
+            self.vibration_handler.flush()
+
+
+def server_graph(actor_config, update_frequency=200, loop=None, logger=None):
+    """Returns the handler graph of the server: parses the received data and passes the messages on to the vibration and pattern handlers"""
+    noop_inlet = pipeline.Element()
+    vibration_handler = Vibration(actor_config)
+    pattern_handler = Pattern(inlet=noop_inlet, loop=loop, logger=logger, vibration_handler=vibration_handler)     # plays patterns directly on the actors
+
+    return message.Splitter() >> message.Parser() >> noop_inlet >> pipeline.Logger(logger=logger) >> [message.TypeFilter(protocol.Message.VIBRATION) >> pipeline.Counter(5000) >> message.Coalescer(update_frequency, loop=loop) >> vibration_handler,
+                                                                                                     message.TypeFilter(protocol.Message.LOAD_PATTERN) >> pipeline.Dispatcher(pattern_handler.load),
+                                                                                                     message.TypeFilter(protocol.Message.PLAY_PATTERN) >> pipeline.Dispatcher(pattern_handler.play),
+                                                                                                     message.TypeFilter(protocol.Message.STOP_PATTERN) >> pipeline.Dispatcher(pattern_handler.stop)]
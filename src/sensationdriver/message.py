@@ -1,53 +1,142 @@
 import asyncio
 import time
+import traceback
 import itertools
+import struct
+import collections
 
 from . import pipeline
 from . import protocol
+from . import helper
+
+
+unpack_message_size = struct.Struct('!I').unpack_from
+
+# The highest bit of the length prefix flags a compact frame instead of a protocol.Message.
+# A compact frame is a sequence of fixed size vibration records:
+#   target_region:uint8, actor_index:uint8, priority:uint16, intensity:uint16 (scaled to [0, COMPACT_INTENSITY_SCALE])
+COMPACT_FRAME_FLAG = 1 << 31
+COMPACT_INTENSITY_SCALE = 0xFFFF
+compact_vibration = struct.Struct('!BBHH')
+
+# Pseudo message type of the containers the Parser creates for compact frames
+COMPACT_VIBRATIONS = -1
+
+
+# Lightweight stand-in for protocol.Vibration, accepted by everything downstream of the TypeFilter
+VibrationRecord = collections.namedtuple('VibrationRecord', ['target_region', 'actor_index', 'intensity', 'priority'])
+
+# Splitter output for compact frames
+CompactFrame = collections.namedtuple('CompactFrame', ['data'])
+
+# Parser output for compact frames, standing in for protocol.Message
+CompactVibrations = collections.namedtuple('CompactVibrations', ['type', 'vibrations'])
+
+_DEFAULT_VIBRATION_PRIORITY = protocol.Vibration.DESCRIPTOR.fields_by_name['priority'].default_value
+
+
+def unpack_vibration_batch(batch):
+    """Returns the VibrationRecords of the batch. Raises ValueError if its fields differ in length"""
+    count = len(batch.target_regions)
+    if len(batch.actor_indices) != count or len(batch.intensities) != count or len(batch.priorities) not in (0, count):
+        raise ValueError("Malformed vibration batch: %d target regions, %d actor indices, %d intensities, %d priorities" % (count, len(batch.actor_indices), len(batch.intensities), len(batch.priorities)))
+    priorities = batch.priorities if batch.priorities else itertools.repeat(_DEFAULT_VIBRATION_PRIORITY)
+    return itertools.starmap(VibrationRecord, zip(batch.target_regions, batch.actor_indices, batch.intensities, priorities))
+
+
+def pack_compact_vibrations(vibrations):
+    """Packs (target_region, actor_index, intensity, priority) tuples into a compact frame (without length prefix)"""
+    pack = compact_vibration.pack
+    return b''.join(pack(target_region, actor_index, priority, int(intensity * COMPACT_INTENSITY_SCALE + 0.5)) for target_region, actor_index, intensity, priority in vibrations)
+
+
+def unpack_compact_vibrations(data):
+    scale = COMPACT_INTENSITY_SCALE
+    return [VibrationRecord(target_region, actor_index, intensity / scale, priority) for target_region, actor_index, priority, intensity in compact_vibration.iter_unpack(data)]
 
 
 class Splitter(pipeline.Element):
+    _INITIAL_CAPACITY = 4096
+
     def __init__(self, downstream=None, logger=None):
         super().__init__(downstream=downstream, logger=logger)
-        self.buffer = bytes()
-        self.buffer_length = 0
-        self.start_index = 0
+        self.buffer = bytearray(self._INITIAL_CAPACITY)
+        self.view = memoryview(self.buffer)
+        self.buffer_length = 0      # end of the valid data in the buffer
+        self.start_index = 0        # start of the unprocessed data in the buffer
         self.message_size = None
+        self.compact = False        # whether the current message is a compact frame
 
         # only for profiling - TODO: remove
         self.counter = 0
         self.start = None
 
-    @asyncio.coroutine
-    def _process(self, new_data):
+    def _make_room(self, new_data_length):
+        # Moves the unprocessed remainder (at most one partial message) to the front of the
+        # buffer and grows the buffer if it still can't take the new data. The buffer is
+        # replaced rather than resized, because memoryviews handed downstream may still be alive.
+        remaining_length = self.buffer_length - self.start_index
+        required_capacity = remaining_length + new_data_length
+
+        if required_capacity > len(self.buffer):
+            capacity = len(self.buffer)
+            while capacity < required_capacity:
+                capacity *= 2
+            buffer = bytearray(capacity)
+            buffer[:remaining_length] = self.view[self.start_index:self.buffer_length]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        elif remaining_length:
+            self.view[:remaining_length] = self.view[self.start_index:self.buffer_length]
+
+        self.buffer_length = remaining_length
+        self.start_index = 0
+
+    def _process_sync(self, new_data):
         # This could be written much shorter, but the Pi performance is very deficient. 
         # The used operations are chosen considerately.
+        #
+        # The received data is copied into a preallocated buffer exactly once. The returned
+        # messages are memoryview slices of this buffer, which are only valid until the next
+        # call - downstream elements have to copy (e.g. parse) them before yielding control
+        # to the next network read.
 
         new_data_length = len(new_data)
 
-        buffer_length = self.buffer_length
-        start_index = self.start_index
-        message_size = self.message_size
-
         # profiling only
         if self.start is None:
             self.start = time.time()
         self.counter += new_data_length
 
-        buffer = self.buffer[start_index:buffer_length] + new_data
-        buffer_length = buffer_length - start_index + new_data_length
-        start_index = 0
+        if self.buffer_length + new_data_length > len(self.buffer):
+            self._make_room(new_data_length)
+
+        buffer_length = self.buffer_length
+        start_index = self.start_index
+        message_size = self.message_size
+        compact = self.compact
+        buffer = self.buffer
+        view = self.view
+
+        view[buffer_length:buffer_length + new_data_length] = new_data
+        buffer_length += new_data_length
 
         messages = []
 
         # parse everything we received
         while True:
             if message_size is None and buffer_length - start_index >= 4:            # message_size to parse
-                message_size = int.from_bytes(buffer[start_index:start_index + 4], byteorder='big')
+                message_size = unpack_message_size(buffer, start_index)[0]
+                if message_size & COMPACT_FRAME_FLAG:
+                    message_size ^= COMPACT_FRAME_FLAG
+                    compact = True
                 start_index += 4
-            elif message_size and buffer_length - start_index >= message_size:      # message to parse
-                message = buffer[start_index:start_index + message_size]
-                messages.append(message)
+            elif message_size is not None and buffer_length - start_index >= message_size:      # message to parse (possibly empty)
+                if compact:
+                    messages.append(CompactFrame(view[start_index:start_index + message_size]))
+                    compact = False
+                else:
+                    messages.append(view[start_index:start_index + message_size])
                 start_index += message_size
                 message_size = None
             else:        # neither -> need more data
@@ -59,36 +148,62 @@ class Splitter(pipeline.Element):
             self.counter = 0
             self.start = None
 
+        if start_index == buffer_length:    # everything consumed - start over at the front
+            start_index = 0
+            buffer_length = 0
+
         self.buffer_length = buffer_length
         self.start_index = start_index
         self.message_size = message_size
-        self.buffer = buffer
+        self.compact = compact
 
         return messages
 
 
 class Parser(pipeline.Element):
-    @asyncio.coroutine
-    def _process_single(self, data):
+    def _process_single_sync(self, data):
+        if data.__class__ is CompactFrame:
+            message = CompactVibrations(COMPACT_VIBRATIONS, unpack_compact_vibrations(data.data))
+            self._profile('parse', message)
+            return message
+
         message = protocol.Message()
-        message.ParseFromString(data)
+        message.ParseFromString(bytes(data))        # the pure Python protobuf before 3.8 can't parse (writable) memoryviews
+        if not message.HasField('type'):       # e.g. an empty frame - would default to a vibration of CHEST actor 0
+            if self.logger is not None:
+                self.logger.warning("Dropping message without type (%d bytes)", len(data))
+            raise pipeline.TerminateProcessing()
         self._profile('parse', message)
+        if self.tracer is not None and message.type == protocol.Message.VIBRATION:
+            self.tracer.parsed(message.vibration)
 
         return message
 
 
 class TypeFilter(pipeline.Element):
+    # message type -> [(batch message type, batch attribute name, unpack function)]
+    # The entries of these batches are unpacked into the filtered stream.
+    _BATCH_TYPES = {
+        protocol.Message.VIBRATION: [(protocol.Message.VIBRATION_BATCH, 'vibration_batch', unpack_vibration_batch),
+                                     (COMPACT_VIBRATIONS, 'vibrations', iter)]
+    }
+
     def __init__(self, message_type, downstream=None, logger=None):
         super().__init__(downstream=downstream, logger=logger)
         self.message_type = message_type
         self.attribute_name = protocol.Message.MessageType.Name(self.message_type).lower()
 
+        self.batch_types = {}       # batch message type -> (attribute name, unpack function)
+        for batch_type, batch_attribute_name, unpack in self._BATCH_TYPES.get(message_type, []):
+            self.batch_types[batch_type] = (batch_attribute_name, unpack)
 
-    @asyncio.coroutine
-    def _process(self, messages):
+    def _process_sync(self, messages):
         message_type = self.message_type
         attribute_name = self.attribute_name
 
+        if self.batch_types:
+            return self._unpack_batches(messages)
+
         def should_include(container):
             return container.type == message_type
 
@@ -97,13 +212,30 @@ class TypeFilter(pipeline.Element):
 
         return map(extract_message, filter(should_include, messages))
 
+    def _unpack_batches(self, messages):
+        message_type = self.message_type
+        attribute_name = self.attribute_name
+        batch_types = self.batch_types
+
+        result = []
+        for container in messages:
+            if container.type == message_type:
+                result.append(getattr(container, attribute_name))
+            elif container.type in batch_types:
+                batch_attribute_name, unpack = batch_types[container.type]
+                try:
+                    result.extend(unpack(getattr(container, batch_attribute_name)))
+                except ValueError as ex:
+                    if self.logger is not None:
+                        self.logger.warning("Dropping batch: %s", ex)
+        return result
+
 
 class DeprecatedFilter(pipeline.Element):
     def __init__(self, downstream=None, logger=None):
         super().__init__(downstream=downstream, logger=logger)
 
-    @asyncio.coroutine
-    def _process(self, vibration_messages):
+    def _process_sync(self, vibration_messages):
         result = {}
         for vibration in vibration_messages:
             key = vibration.priority * 10000 + vibration.target_region * 100 + vibration.actor_index
@@ -111,3 +243,79 @@ class DeprecatedFilter(pipeline.Element):
         
         result = result.values()
         return result
+
+
+class Coalescer(pipeline.Element):
+    """Keeps only the latest vibration per priority, region and actor and passes them on once per tick"""
+
+    def __init__(self, frequency=200, loop=None, downstream=None, logger=None):
+        super().__init__(downstream=downstream, logger=logger)
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self.frequency = frequency
+
+        self._pending = {}          # key -> vibration
+        self._first_pending = None  # perf_counter time the oldest pending vibration was received
+        self._flush_task = None     # asyncio.Task
+
+        self.received_counter = 0
+        self.dropped_counter = 0    # vibrations superseded before being flushed
+
+    def _set_up(self):
+        self._flush_task = helper.create_exception_reporting_task(self._flush_periodically(), loop=self._loop, logger=self.logger)
+
+    @asyncio.coroutine
+    def tear_down(self):
+        # stop flushing before the successors are torn down
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            yield from asyncio.wait([self._flush_task], loop=self._loop)
+            self._flush_task = None
+        self._pending = {}
+
+        yield from super().tear_down()
+
+    @asyncio.coroutine
+    def _flush_periodically(self):
+        interval = 1 / self.frequency
+        try:
+            while True:
+                yield from asyncio.sleep(interval, loop=self._loop)
+                try:
+                    yield from self.flush()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:     # e.g. a failing driver - keep flushing the following vibrations
+                    if self.logger is not None:
+                        output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+                        self.logger.critical(''.join(output))
+        except asyncio.CancelledError:
+            pass
+
+    @asyncio.coroutine
+    def flush(self):
+        if not self._pending:
+            return
+
+        vibrations = list(self._pending.values())
+        self._pending = {}
+        if self.metrics is not None:
+            self.metrics.queue_wait.record(time.perf_counter() - self._first_pending)
+
+        for successor in self._successors():
+            yield from successor.process(vibrations)
+
+    def _process_sync(self, vibration_messages):
+        pending = self._pending
+        pending_length = len(pending)
+        if not pending_length:
+            self._first_pending = time.perf_counter()
+        received = 0
+        for vibration in vibration_messages:
+            key = vibration.priority * 10000 + vibration.target_region * 100 + vibration.actor_index
+            pending[key] = vibration
+            received += 1
+
+        self.received_counter += received
+        self.dropped_counter += received - (len(pending) - pending_length)
+
+        raise pipeline.TerminateProcessing()
@@ -0,0 +1,114 @@
+class Histogram(object):
+    """Records durations in a fixed number of buckets with a bounded relative error (like HdrHistogram).
+
+    Values are counted in microseconds. Values below 2 ** precision_bits microseconds are exact, larger
+    ones fall into buckets which are 2 ** -(precision_bits - 1) of their value wide. Values above
+    max_seconds are counted in the last bucket. Recording costs the same no matter how many values
+    were recorded.
+    """
+
+    __slots__ = ('precision_bits', '_half', '_counts', '_max_index', 'count', 'total', 'min', 'max')
+
+    def __init__(self, max_seconds=60, precision_bits=5):
+        self.precision_bits = precision_bits
+        self._half = 1 << (precision_bits - 1)
+        self._max_index = self._index(int(max_seconds * 1000000))
+        self._counts = [0] * (self._max_index + 1)
+        self.reset()
+
+    def reset(self):
+        for index in range(len(self._counts)):
+            self._counts[index] = 0
+        self.count = 0
+        self.total = 0.0            # seconds
+        self.min = None
+        self.max = None
+
+    def _index(self, microseconds):
+        exponent = microseconds.bit_length() - self.precision_bits
+        if exponent <= 0:
+            return microseconds
+        return exponent * self._half + (microseconds >> exponent)
+
+    def _lower_bound(self, index):
+        """Smallest value (in microseconds) counted in the bucket"""
+        if index < 2 * self._half:
+            return index
+        exponent = index // self._half - 1
+        return (index - exponent * self._half) << exponent
+
+    def record(self, seconds):
+        index = self._index(int(seconds * 1000000))
+        self._counts[index if index < self._max_index else self._max_index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """Returns the upper bound (in seconds) of the bucket holding the given percentile"""
+        if not self.count:
+            return None
+        rank = max(1, int(self.count * percent / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                break
+        if index == self._max_index:
+            return self.max
+        return min(self._lower_bound(index + 1) / 1000000, self.max)
+
+    def snapshot(self, percentiles=(50, 90, 99, 99.9)):
+        result = { 'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean }
+        for percent in percentiles:
+            result['p%g' % percent] = self.percentile(percent)
+        return result
+
+
+class Metrics(object):
+    """Throughput and latency of one processing stage (a pipeline element, an I2C worker...)"""
+
+    __slots__ = ('in_counter', 'out_counter', 'process_time', 'queue_wait')
+
+    def __init__(self, max_seconds=60, precision_bits=5):
+        self.in_counter = 0         # items received
+        self.out_counter = 0        # items passed on
+        self.process_time = Histogram(max_seconds, precision_bits)      # per batch
+        self.queue_wait = Histogram(max_seconds, precision_bits)        # time items waited before being processed
+
+    def record(self, items_in, items_out, seconds):
+        self.in_counter += items_in
+        self.out_counter += items_out
+        self.process_time.record(seconds)
+
+    def reset(self):
+        self.in_counter = 0
+        self.out_counter = 0
+        self.process_time.reset()
+        self.queue_wait.reset()
+
+    def snapshot(self):
+        return { 'in': self.in_counter,
+                 'out': self.out_counter,
+                 'process_time': self.process_time.snapshot(),
+                 'queue_wait': self.queue_wait.snapshot() }
+
+
+def format_snapshot(name, snapshot):
+    """One log line for a Metrics snapshot"""
+    def milliseconds(value):
+        return '-' if value is None else '%.3f' % (value * 1000)
+
+    process_time = snapshot['process_time']
+    queue_wait = snapshot['queue_wait']
+    line = "%s: in %d, out %d, process ms p50 %s p99 %s max %s" % (name, snapshot['in'], snapshot['out'], milliseconds(process_time['p50']), milliseconds(process_time['p99']), milliseconds(process_time['max']))
+    if queue_wait['count']:
+        line += ", queue wait ms p50 %s p99 %s max %s" % (milliseconds(queue_wait['p50']), milliseconds(queue_wait['p99']), milliseconds(queue_wait['max']))
+    return line
@@ -1,4 +1,15 @@
 import math
+import array
+import bisect
+import asyncio
+import itertools
+import collections
+import traceback
+
+try:
+    import numpy
+except ImportError:         # not installed on the Pi - sample_bezier_paths falls back to pure Python
+    numpy = None
 
 from . import protocol
 
@@ -50,6 +61,467 @@ class Track(object):
         return message
 
 
+class SampleTable(object):
+    """Intensities of a track sampled at a fixed frequency, scaled to [0, 1] like Track.value.
+
+    samples[i] is the intensity i / sampling_frequency seconds into the track, the last sample is the final value.
+    """
+    __slots__ = ('target_region', 'actor_index', 'samples')
+
+    def __init__(self, target_region, actor_index, samples):
+        self.target_region = target_region
+        self.actor_index = actor_index
+        self.samples = samples
+
+    @classmethod
+    def from_keyframes(cls, target_region, actor_index, keyframes, sampling_frequency, time_correct=True):
+        samples = sample_bezier_paths([BezierSegments(keyframes)], sampling_frequency, time_correct=time_correct)[0]
+        return cls(target_region, actor_index, samples)
+
+    @property
+    def nbytes(self):
+        return len(self.samples) * self.samples.itemsize
+
+
+class BezierSegments(object):
+    """The cubic segments of a keyframe path as flat lists, prepared for sample_bezier_paths"""
+    __slots__ = ('start_times', 'end_times', 'x1', 'x2', 'p0', 'p1', 'p2', 'p3', 'min_value', 'max_value', '_inverse_tables')
+
+    INVERSE_TABLE_RESOLUTION = 16       # intervals of the per segment lookup tables for t(x)
+
+    def __init__(self, keyframes):
+        if len(keyframes) < 2:
+            raise ValueError('At least two keyframes required')
+
+        self.start_times = []
+        self.end_times = []
+        self.x1 = []                    # times of the tangent handles
+        self.x2 = []
+        self.p0 = []
+        self.p1 = []
+        self.p2 = []
+        self.p3 = []
+        for start, end in zip(keyframes, keyframes[1:]):
+            self.start_times.append(start.control_point.time)
+            self.end_times.append(end.control_point.time)
+            self.x1.append(start.out_tangent_end.time)
+            self.x2.append(end.in_tangent_start.time)
+            self.p0.append(start.control_point.value)
+            self.p1.append(start.out_tangent_end.value)
+            self.p2.append(end.in_tangent_start.value)
+            self.p3.append(end.control_point.value)
+        self._inverse_tables = None
+
+        path = BezierPath(keyframes)
+        self.min_value = path.min_value
+        self.max_value = path.max_value
+        if self.max_value == self.min_value:
+            raise ValueError('Constant path can\'t be scaled')
+
+    @property
+    def duration(self):
+        return self.end_times[-1]
+
+    @property
+    def final_value(self):
+        return self.p3[-1]
+
+    def sample_count(self, interval):
+        "Number of samples at interval before the final value - the samples at 0, interval, 2 * interval, ... up to the duration"
+        count = int(self.duration / interval) + 1
+        while count > 0 and (count - 1) * interval > self.duration:
+            count -= 1
+        while count * interval <= self.duration:
+            count += 1
+        return count
+
+    @property
+    def inverse_tables(self):
+        """Per segment: x(t) - x0 at t = 0, 1/n, 2/n ... 1, to look up estimates of the inverse t(x)"""
+        if self._inverse_tables is None:
+            resolution = self.INVERSE_TABLE_RESOLUTION
+            tables = []
+            for x0, x1, x2, x3 in zip(self.start_times, self.x1, self.x2, self.end_times):
+                a, b, c = _power_basis(x0, x1, x2, x3)
+                tables.append(array.array('d', (((a * t + b) * t + c) * t for t in (i / resolution for i in range(resolution + 1)))))
+            self._inverse_tables = tables
+        return self._inverse_tables
+
+
+def _power_basis(p0, p1, p2, p3):
+    "Returns (a, b, c) with the cubic Bezier being ((a * t + b) * t + c) * t + p0"
+    return (p3 - p0 + 3 * (p1 - p2), 3 * (p2 - 2 * p1 + p0), 3 * (p1 - p0))
+
+
+def solve_bezier_parameter(x, x0, x1, x2, x3, t=None, epsilon=1e-9, iterations=8):
+    """Returns the t in [0, 1] at which the cubic Bezier x(t) with the control points x0..x3 equals x.
+
+    Newton's method, starting at t or the linear estimate, within a bracket around the solution - steps
+    leaving the bracket (or on a flat slope) are replaced by bisection, which also continues once the
+    Newton iterations are used up.
+    """
+    if x3 == x0:
+        return 0.0
+    if t is None:
+        t = min(max((x - x0) / (x3 - x0), 0.0), 1.0)
+    return _solve_power_basis(x - x0, _power_basis(x0, x1, x2, x3), t, epsilon, iterations)
+
+
+def _solve_power_basis(x, coefficients, t, epsilon=1e-9, iterations=8):
+    """solve_bezier_parameter for x relative to x0 and the coefficients of _power_basis"""
+    a, b, c = coefficients
+    increasing = a + b + c > 0          # x3 > x0
+    low, high = 0.0, 1.0
+    for _ in range(iterations + 64):
+        error = ((a * t + b) * t + c) * t - x
+        if -epsilon < error < epsilon:
+            return t
+        if (error < 0) == increasing:
+            low = t
+        else:
+            high = t
+        if iterations:
+            iterations -= 1
+            slope = (3 * a * t + 2 * b) * t + c
+            if slope < -1e-12 or slope > 1e-12:
+                t -= error / slope
+                if low < t < high:
+                    continue
+        t = (low + high) / 2
+    return t
+
+
+def sample_bezier_paths(paths, sampling_frequency, use_numpy=None, time_correct=True):
+    """Samples the BezierSegments at 0, interval, 2 * interval, ... followed by the final value.
+    Returns one array('f') of values scaled to [0, 1] per path.
+
+    If time_correct, the parameter t of a sample is solved from the time axis x(t) of the segment, honoring
+    the timing of the tangent handles (estimated from the segments' inverse_tables, refined by Newton steps). Otherwise
+    t is mapped linearly from the time, like Track.advance does.
+
+    Evaluates all paths in one vectorized pass if NumPy is available (or use_numpy is True).
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    interval = 1 / sampling_frequency
+    if use_numpy:
+        return _sample_bezier_paths_numpy(paths, interval, time_correct)
+    return [_sample_bezier_path(path, interval, time_correct) for path in paths]
+
+
+def _sample_bezier_path(path, interval, time_correct):
+    start_times = path.start_times
+    end_times = path.end_times
+    p0, p1, p2, p3 = path.p0, path.p1, path.p2, path.p3
+    offset = path.min_value
+    scale = 1 / (path.max_value - path.min_value)
+    if time_correct:
+        inverse_tables = path.inverse_tables
+        resolution = BezierSegments.INVERSE_TABLE_RESOLUTION
+        x_coefficients = [_power_basis(*x) for x in zip(start_times, path.x1, path.x2, end_times)]
+
+    samples = array.array('f')
+    append = samples.append
+    segment = 0
+    for k in range(path.sample_count(interval)):
+        time = k * interval
+        if time > end_times[segment]:
+            segment = bisect.bisect_left(end_times, time, segment)
+        start_time = start_times[segment]
+        duration = end_times[segment] - start_time
+        t = (time - start_time) / duration if duration else 0.0
+        if time_correct and duration:
+            # estimate from the lookup table, refine with Newton steps
+            x = time - start_time
+            table = inverse_tables[segment]
+            i = min(max(bisect.bisect_right(table, x) - 1, 0), resolution - 1)
+            step = table[i + 1] - table[i]
+            t = (i + (x - table[i]) / step) / resolution if step > 0 else i / resolution
+            t = _solve_power_basis(x, x_coefficients[segment], t, iterations=3)
+        u = 1 - t
+        value = p0[segment] * u * u * u + 3 * u * u * t * p1[segment] + 3 * u * t * t * p2[segment] + p3[segment] * t * t * t
+        append((value - offset) * scale)
+    append((path.final_value - offset) * scale)
+    return samples
+
+
+def _sample_bezier_paths_numpy(paths, interval, time_correct):
+    # all samples of all paths in one set of arrays, path i owning sample_offsets[i]:sample_offsets[i + 1]
+    sample_counts = [path.sample_count(interval) + 1 for path in paths]    # + final value
+    sample_offsets = numpy.zeros(len(paths) + 1, dtype=numpy.int64)
+    numpy.cumsum(sample_counts, out=sample_offsets[1:])
+    total = int(sample_offsets[-1])
+    if total == 0:
+        return []
+
+    segment_counts = [len(path.end_times) for path in paths]
+    segment_offsets = numpy.zeros(len(paths) + 1, dtype=numpy.int64)
+    numpy.cumsum(segment_counts, out=segment_offsets[1:])
+
+    def concatenated(attribute):
+        return numpy.fromiter(itertools.chain.from_iterable(getattr(path, attribute) for path in paths), dtype=numpy.float64)
+
+    start_times = concatenated('start_times')
+    end_times = concatenated('end_times')
+    p0 = concatenated('p0')
+    p1 = concatenated('p1')
+    p2 = concatenated('p2')
+    p3 = concatenated('p3')
+
+    path_of_sample = numpy.repeat(numpy.arange(len(paths)), sample_counts)
+    k = numpy.arange(total) - sample_offsets[path_of_sample]
+    is_final = k == numpy.repeat(numpy.array(sample_counts) - 1, sample_counts)
+    times = k * interval
+
+    # first segment of the sample's path ending at or after its time, like BezierPath.timeline
+    segment = numpy.empty(total, dtype=numpy.int64)
+    for i, path in enumerate(paths):
+        begin, end = sample_offsets[i], sample_offsets[i + 1]
+        segment[begin:end] = numpy.minimum(numpy.searchsorted(path.end_times, times[begin:end], side='left'), len(path.end_times) - 1)
+    segment += segment_offsets[path_of_sample]
+
+    x0 = start_times[segment]
+    x3 = end_times[segment]
+    durations = x3 - x0
+    has_duration = durations != 0
+    t = numpy.divide(times - x0, durations, out=numpy.zeros(total), where=has_duration)
+
+    if time_correct:
+        resolution = BezierSegments.INVERSE_TABLE_RESOLUTION
+        inverse_tables = numpy.array([table for path in paths for table in path.inverse_tables]).reshape(-1, resolution + 1)
+        x1 = concatenated('x1')[segment]
+        x2 = concatenated('x2')[segment]
+        a = x3 - x0 + 3 * (x1 - x2)
+        b = 3 * (x2 - 2 * x1 + x0)
+        c = 3 * (x1 - x0)
+        x = times - x0
+
+        # estimate from the lookup table, refine with Newton steps
+        rows = inverse_tables[segment]
+        i = numpy.clip((rows <= x[:, numpy.newaxis]).sum(axis=1) - 1, 0, resolution - 1)
+        low = rows[numpy.arange(total), i]
+        step = rows[numpy.arange(total), i + 1] - low
+        estimate = (i + numpy.divide(x - low, step, out=numpy.zeros(total), where=step > 0)) / resolution
+        for _ in range(3):
+            error = ((a * estimate + b) * estimate + c) * estimate - x
+            slope = (3 * a * estimate + 2 * b) * estimate + c
+            estimate = estimate - numpy.divide(error, slope, out=numpy.zeros(total), where=numpy.abs(slope) > 1e-12)
+        error = ((a * estimate + b) * estimate + c) * estimate - x
+        for index in numpy.flatnonzero(has_duration & ~is_final & ((numpy.abs(error) >= 1e-9) | (estimate < 0) | (estimate > 1))):
+            estimate[index] = solve_bezier_parameter(times[index], x0[index], x1[index], x2[index], x3[index])
+        t = numpy.where(has_duration, estimate, t)
+
+    t[is_final] = 1.0           # the final value is the end of the last segment
+    u = 1 - t
+    values = p0[segment] * u * u * u + 3 * u * u * t * p1[segment] + 3 * u * t * t * p2[segment] + p3[segment] * t * t * t
+
+    min_values = numpy.array([path.min_value for path in paths])
+    max_values = numpy.array([path.max_value for path in paths])
+    values = (values - min_values[path_of_sample]) / (max_values - min_values)[path_of_sample]
+    values = values.astype(numpy.float32)
+
+    result = []
+    for i in range(len(paths)):
+        samples = array.array('f')
+        samples.frombytes(values[sample_offsets[i]:sample_offsets[i + 1]].tobytes())
+        result.append(samples)
+    return result
+
+
+class SampleTableCache(object):
+    """Least recently used cache of the SampleTables of patterns, limited to max_bytes of samples"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()      # identifier -> ([SampleTable], nbytes), least recently used first
+
+        self.hit_counter = 0
+        self.miss_counter = 0
+        self.eviction_counter = 0
+
+    def __contains__(self, identifier):
+        return identifier in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, identifier):
+        entry = self._entries.get(identifier)
+        if entry is None:
+            self.miss_counter += 1
+            return None
+        self.hit_counter += 1
+        self._entries.move_to_end(identifier)
+        return entry[0]
+
+    def put(self, identifier, tables):
+        """Caches the tables and returns whether they fit"""
+        self.remove(identifier)
+        nbytes = sum(table.nbytes for table in tables)
+        if nbytes > self.max_bytes:
+            return False
+        while self.nbytes + nbytes > self.max_bytes:
+            evicted_tables, evicted_nbytes = self._entries.popitem(last=False)[1]
+            self.nbytes -= evicted_nbytes
+            self.eviction_counter += 1
+        self._entries[identifier] = (tables, nbytes)
+        self.nbytes += nbytes
+        return True
+
+    def remove(self, identifier):
+        entry = self._entries.pop(identifier, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class Playback(object):
+    """A pattern played by the Sequencer. finished is resolved once all tracks ended and cancelled when stopped.
+    Looping playbacks never end on their own - their finished is only ever cancelled.
+    """
+    __slots__ = ('identifier', 'finished', 'remaining_tracks')
+
+    def __init__(self, identifier, track_count, loop=None):
+        self.identifier = identifier
+        self.finished = asyncio.Future(loop=loop)
+        self.remaining_tracks = track_count
+
+
+class Sequencer(object):
+    """Plays all patterns on one clock.
+
+    The cursors of all playing tracks are kept in flat parallel lists, advanced together once per tick
+    and emitted as one merged batch: emit([(target, intensity, priority)]) is a coroutine function
+    called once per tick. Tracks of stopped patterns are emitted once more with intensity 0, to release
+    their priority on the target.
+
+    Looping patterns restart all their tracks together once the longest one ended, shorter tracks hold
+    their final value until then. A loop only rewinds the cursors in place - the sample tables are
+    shared, so a looping pattern plays at constant memory until it is stopped.
+    """
+
+    def __init__(self, clock, emit, loop=None, logger=None):
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self.logger = logger
+        self.clock = clock
+        self.emit = emit
+
+        # one entry per playing track
+        self._targets = []
+        self._samples = []
+        self._priorities = []
+        self._first_ticks = []
+        self._periods = []          # loop length in ticks, 0 if not looping
+        self._playbacks = []
+
+        self._released = []         # (target, priority) of stopped tracks, turned off with the next tick
+        self._subscribed = False
+
+    def __len__(self):
+        return len(self._targets)
+
+    def is_playing(self, identifier):
+        return any(playback.identifier == identifier for playback in self._playbacks)
+
+    def play(self, identifier, tracks, priority, loop=False):
+        """Starts playing the [(target, samples)] tracks with the next tick and returns the Playback"""
+        playback = Playback(identifier, len(tracks), loop=self._loop)
+        if not tracks:
+            playback.finished.set_result(playback)
+            return playback
+
+        if not self._subscribed:
+            self._subscribed = True
+            first_tick = self.clock.subscribe(self._tick)
+        else:
+            first_tick = self.clock.next_tick
+
+        period = max(len(samples) for target, samples in tracks) if loop else 0
+        for target, samples in tracks:
+            self._targets.append(target)
+            self._samples.append(samples)
+            self._priorities.append(priority)
+            self._first_ticks.append(first_tick)
+            self._periods.append(period)
+            self._playbacks.append(playback)
+        return playback
+
+    def stop(self, identifier):
+        """Stops all playbacks of the pattern and returns how many tracks were stopped"""
+        keep = [playback.identifier != identifier for playback in self._playbacks]
+        stopped = len(keep) - sum(keep)
+        if not stopped:
+            return 0
+
+        for target, priority, playback, kept in zip(self._targets, self._priorities, self._playbacks, keep):
+            if not kept:
+                self._released.append((target, priority))
+                if not playback.finished.done():
+                    playback.finished.cancel()
+        self._compress(keep)
+        return stopped
+
+    def stop_all(self):
+        stopped = 0
+        for identifier in set(playback.identifier for playback in self._playbacks):
+            stopped += self.stop(identifier)
+        return stopped
+
+    def _compress(self, keep):
+        self._targets = list(itertools.compress(self._targets, keep))
+        self._samples = list(itertools.compress(self._samples, keep))
+        self._priorities = list(itertools.compress(self._priorities, keep))
+        self._first_ticks = list(itertools.compress(self._first_ticks, keep))
+        self._periods = list(itertools.compress(self._periods, keep))
+        self._playbacks = list(itertools.compress(self._playbacks, keep))
+
+    @asyncio.coroutine
+    def _tick(self, tick):
+        batch = [(target, 0.0, priority) for target, priority in self._released]
+        self._released = []
+
+        keep = []
+        finished = False
+        first_ticks = self._first_ticks
+        for cursor, (target, samples, priority, first_tick, period, playback) in enumerate(zip(self._targets, self._samples, self._priorities, first_ticks, self._periods, self._playbacks)):
+            index = tick - first_tick           # skipped clock ticks skip samples, so patterns keep their duration
+            if period:
+                if index >= period:             # rewind the looping cursor in place
+                    index %= period
+                    first_ticks[cursor] = tick - index
+                batch.append((target, samples[min(index, len(samples) - 1)], priority))
+                keep.append(True)
+            elif index < len(samples) - 1:
+                batch.append((target, samples[index], priority))
+                keep.append(True)
+            else:
+                batch.append((target, samples[-1], priority))
+                keep.append(False)
+                finished = True
+                playback.remaining_tracks -= 1
+                if playback.remaining_tracks == 0:
+                    playback.finished.set_result(playback)
+        if finished:
+            self._compress(keep)
+
+        if batch:
+            try:
+                yield from self.emit(batch)
+            except Exception as ex:
+                if self.logger is not None:
+                    output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+                    self.logger.critical(''.join(output))
+
+        if not self._targets and not self._released:
+            self._subscribed = False
+            return False
+        return True
+
+
 class BezierPath(object):
     def __init__(self, keyframes):
         self._keyframes = keyframes
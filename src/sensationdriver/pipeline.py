@@ -4,16 +4,32 @@ import traceback
 import collections
 import time
 
+from .metrics import Metrics
+
 
 class TerminateProcessing(Exception):
     pass
 
 
+def _sized(items):
+    return items if items is None or hasattr(items, '__len__') else list(items)
+
+
 class Element(object):
+    """Subclasses implement either the synchronous _process_sync or _process_single_sync or - if they have
+    to await - the coroutines _process or _process_single. Elements which don't override any of the
+    coroutines are synchronous and processed by plain function calls.
+
+    Setting `metrics` to a Metrics records the items in and out and the processing time of the
+    element (see enable_metrics).
+    """
+
     def __init__(self, downstream=None, logger=None):
         self.logger = logger
         self.downstream = downstream
         self.profiler = None
+        self.metrics = None
+        self.tracer = None      # tracing.Tracer, used by the elements stamping traced vibrations
 
     def __rshift__(self, rhs):
         last = self
@@ -29,8 +45,11 @@ class Element(object):
                 yield element
 
     def _profile(self, action, *args):
-        if self.profiler is not None:
-            self.profiler.log(action, *args)
+        profiler = self.profiler
+        if profiler is not None:
+            sampler = profiler.sampler
+            if sampler is None or not sampler.exhausted:
+                profiler.log(action, *args)
 
     def _successors(self):
         if isinstance(self.downstream, list):
@@ -67,12 +86,37 @@ class Element(object):
         else:
             self._tear_down()
 
+    @property
+    def synchronous(self):
+        cls = self.__class__
+        return cls._process is Element._process and cls._process_single is Element._process_single
+
+    def _process_single_sync(self, data):
+        return data
+
+    def _process_sync(self, data):
+        process_single = self._process_single_sync
+        result = []
+        for element in data:
+            try:
+                mapped = process_single(element)
+
+                assert mapped is not None, "pipeline element '{0}' single element processing result must not be None".format(self.__class__.__name__)
+
+                result.append(mapped)
+            except TerminateProcessing:
+                pass
+        return result
+
     @asyncio.coroutine
     def _process_single(self, data):
-        return data
+        return self._process_single_sync(data)
 
     @asyncio.coroutine
     def _process(self, data):
+        if self.__class__._process_single is Element._process_single:
+            return self._process_sync(data)
+
         result = []
         for element in data:
             try:
@@ -85,10 +129,50 @@ class Element(object):
                 pass
         return result
 
+    def _record_metrics(self, items_in, result, start):
+        result = _sized(result)
+        self.metrics.record(items_in, len(result), time.perf_counter() - start)
+        return result
+
+    def process_sync(self, data):
+        """Processes the data without awaiting and returns the result - successors are not called. Only for synchronous elements"""
+        if self.metrics is None:
+            result = self._process_sync(data)
+        else:
+            data = _sized(data)
+            start = time.perf_counter()
+            try:
+                result = self._record_metrics(len(data), self._process_sync(data), start)
+            except TerminateProcessing:
+                self._record_metrics(len(data), (), start)
+                raise
+        assert result is not None, "pipeline element '{0}' processing result must not be None".format(self.__class__.__name__)
+        return result
+
+    @asyncio.coroutine
+    def _process_measured(self, data):
+        """_process recording into metrics"""
+        data = _sized(data)
+        start = time.perf_counter()
+        try:
+            if self.synchronous:
+                result = self._process_sync(data)
+            else:
+                result = yield from self._process(data)
+        except TerminateProcessing:
+            self._record_metrics(len(data), (), start)
+            raise
+        return self._record_metrics(len(data), result, start)
+
     @asyncio.coroutine
     def process(self, data):
         try:
-            result = yield from self._process(data)
+            if self.metrics is not None:
+                result = yield from self._process_measured(data)
+            elif self.synchronous:
+                result = self._process_sync(data)
+            else:
+                result = yield from self._process(data)
 
             assert result is not None, "pipeline element '{0}' processing result must not be None".format(self.__class__.__name__)
             assert isinstance(result, collections.Iterable), "pipeline element '{0}' processing must return an iterable".format(self.__class__.__name__)
@@ -106,8 +190,7 @@ class Counter(Element):
         self.counter = 0
         self.start = None
 
-    @asyncio.coroutine
-    def _process_single(self, message):
+    def _process_single_sync(self, message):
         if self.start is None:
             self.start = time.time()
 
@@ -128,8 +211,7 @@ class Logger(Element):
         super().__init__(downstream=downstream, logger=logger)
         self.level = logging.INFO
 
-    @asyncio.coroutine
-    def _process_single(self, message):
+    def _process_single_sync(self, message):
         if self.logger is not None:
             self.logger.log(self.level, 'received:\n--\n%s--', message)
 
@@ -142,6 +224,13 @@ class Dispatcher(Element):
         self.target = target
         self.coroutine_target = asyncio.iscoroutinefunction(target)
 
+    @property
+    def synchronous(self):
+        return not self.coroutine_target
+
+    def _process_single_sync(self, data):
+        return self.target(data)
+
     @asyncio.coroutine
     def _process_single(self, data):
         result = self.target(data)
@@ -152,10 +241,10 @@ class Dispatcher(Element):
 
 class Numerator(Element):
     def __init__(self, downstream=None, logger=None):
+        super().__init__(downstream=downstream, logger=logger)
         self._index = -1
 
-    @asyncio.coroutine
-    def _process_single(self, element):
+    def _process_single_sync(self, element):
         self._index += 1        
         return (self._index, element)
 
@@ -174,13 +263,83 @@ class Serializer(Element):
 
 
 class Parallelizer(Element):
-    def __init__(self, loop=None, downstream=None, logger=None):
+    """Processes every element in the successors concurrently to the producer.
+
+    By default a task is started for every element and successor. With `workers`, a fixed number of
+    long-lived worker tasks take the elements from a queue holding up to `capacity` of them - the
+    producer waits if it's full. On tear down the workers either finish the queued elements first
+    (`drain`, for at most `drain_timeout` seconds) or are cancelled right away.
+    """
+
+    def __init__(self, loop=None, workers=None, capacity=1024, drain=False, drain_timeout=2, downstream=None, logger=None):
         super().__init__(downstream=downstream, logger=logger)
         self._loop = loop if loop is not None else asyncio.get_event_loop()
 
         self._workers = set()   # asyncio.Task, each running process() of a successor
         self._tearing_down = False
 
+        self.worker_count = workers
+        self.drain = drain
+        self.drain_timeout = drain_timeout
+        self._queue = asyncio.Queue(maxsize=capacity, loop=self._loop) if workers is not None else None
+        self._pool = []         # asyncio.Task, each running _work()
+
+    def _set_up(self):
+        if self._queue is not None:
+            self._start_pool()
+
+    def _start_pool(self):
+        while len(self._pool) < self.worker_count:
+            # TODO use self._loop.create_task once Python 3.4.2 is released
+            self._pool.append(asyncio.Task(self._work(), loop=self._loop))
+
+    @asyncio.coroutine
+    def _stop_pool(self):
+        queue = self._queue
+        if self.drain and self._pool:
+            try:
+                yield from asyncio.wait_for(queue.join(), self.drain_timeout, loop=self._loop)
+            except asyncio.TimeoutError:
+                if self.logger is not None:
+                    self.logger.error("could not finish processing of %d messages", queue.qsize())
+
+        for task in self._pool:
+            task.cancel()
+        if self._pool:
+            yield from asyncio.wait(self._pool, loop=self._loop, timeout=2)
+        self._pool = []
+
+        while not queue.empty():        # dropped
+            queue.get_nowait()
+            queue.task_done()
+
+    @asyncio.coroutine
+    def _work(self):
+        queue = self._queue
+        while True:
+            enqueued, data = yield from queue.get()
+            if enqueued is not None:
+                self.metrics.queue_wait.record(time.perf_counter() - enqueued)
+            try:
+                for successor in self._successors():
+                    yield from successor.process(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if self.logger is not None:
+                    output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+                    self.logger.critical(''.join(output))
+            finally:
+                queue.task_done()
+
+    @asyncio.coroutine
+    def tear_down(self):
+        # the pool processes its queue before the successors are torn down
+        if self._queue is not None:
+            yield from self._stop_pool()
+
+        yield from super().tear_down()
+
     @asyncio.coroutine
     def _tear_down(self):
         self._tearing_down = True
@@ -212,6 +371,11 @@ class Parallelizer(Element):
 
             self._workers.remove(task)
 
+        if self._queue is not None:
+            self._start_pool()
+            yield from self._queue.put((time.perf_counter() if self.metrics is not None else None, data))
+            return data
+
         for successor in self._successors():
             # start async task to process message
             # TODO use self._loop.create_task once Python 3.4.2 is released
@@ -225,3 +389,231 @@ class Parallelizer(Element):
     def _process(self, data):
         yield from super()._process(data)
         raise TerminateProcessing()
+
+
+class Queue(Element):
+    """Decouples the successors from the producer: items are queued and passed on in batches by a task of
+    their own, which is started by set_up().
+
+    Once `capacity` items are waiting, the policy decides:
+        BLOCK       - the producer waits for room, which propagates backpressure e.g. onto a socket
+        DROP_OLDEST - the oldest waiting item is dropped
+        DROP_NEWEST - the new item is dropped
+        COALESCE    - an item replaces the waiting item with the same key(item), if there is none, the
+                      oldest waiting item is dropped
+    """
+
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    COALESCE = 'coalesce'
+
+    def __init__(self, capacity=1024, policy=BLOCK, key=None, loop=None, downstream=None, logger=None):
+        super().__init__(downstream=downstream, logger=logger)
+        if policy not in (self.BLOCK, self.DROP_OLDEST, self.DROP_NEWEST, self.COALESCE):
+            raise ValueError("unknown queue policy '{0}'".format(policy))
+        if policy == self.COALESCE and key is None:
+            raise ValueError("coalescing queue needs a key function")
+        if capacity < 1:
+            raise ValueError("queue capacity must be positive")
+
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self.capacity = capacity
+        self.policy = policy
+        self.key = key
+
+        self._items = collections.OrderedDict() if policy == self.COALESCE else collections.deque()     # oldest first, by key(item) if coalescing
+        self._readable = asyncio.Event(loop=self._loop)
+        self._writable = asyncio.Event(loop=self._loop)
+        self._consumer = None       # asyncio.Task
+        self._first_enqueued = None # perf_counter time the oldest waiting item was queued
+
+        self.received_counter = 0
+        self.dropped_counter = 0
+        self.coalesced_counter = 0
+        self.blocked_counter = 0    # how often the producer had to wait for room
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    @property
+    def synchronous(self):
+        return self.policy != self.BLOCK
+
+    def _set_up(self):
+        if self._consumer is None:
+            self._consumer = asyncio.Task(self._consume(), loop=self._loop)
+
+    @asyncio.coroutine
+    def tear_down(self):
+        # stop passing on items before the successors are torn down
+        if self._consumer is not None:
+            self._consumer.cancel()
+            yield from asyncio.wait([self._consumer], loop=self._loop)
+            self._consumer = None
+        self._items.clear()
+        self._writable.set()        # release blocked producers
+
+        yield from super().tear_down()
+
+    @asyncio.coroutine
+    def _consume(self):
+        items = self._items
+        try:
+            while True:
+                if not items:
+                    self._readable.clear()
+                    yield from self._readable.wait()
+                    continue
+
+                batch = list(items.values()) if self.policy == self.COALESCE else list(items)
+                items.clear()
+                self._writable.set()
+                if self.metrics is not None:
+                    self.metrics.queue_wait.record(time.perf_counter() - self._first_enqueued)
+
+                for successor in self._successors():
+                    try:
+                        yield from successor.process(batch)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as ex:
+                        if self.logger is not None:
+                            output = traceback.format_exception(ex.__class__, ex, ex.__traceback__)
+                            self.logger.critical(''.join(output))
+        except asyncio.CancelledError:
+            pass
+
+    def _enqueue(self, item):
+        items = self._items
+        if self.policy == self.COALESCE:
+            key = self.key(item)
+            if key in items:
+                self.coalesced_counter += 1
+            elif len(items) >= self.capacity:
+                items.popitem(last=False)
+                self.dropped_counter += 1
+            items[key] = item
+        elif len(items) < self.capacity:
+            items.append(item)
+        elif self.policy == self.DROP_OLDEST:
+            items.popleft()
+            items.append(item)
+            self.dropped_counter += 1
+        else:
+            self.dropped_counter += 1
+
+    def _process_sync(self, data):
+        if not self._items:
+            self._first_enqueued = time.perf_counter()
+        received = 0
+        for item in data:
+            self._enqueue(item)
+            received += 1
+        self.received_counter += received
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._readable.set()
+        raise TerminateProcessing()
+
+    @asyncio.coroutine
+    def _process(self, data):
+        if self.policy != self.BLOCK:
+            return self._process_sync(data)
+
+        items = self._items
+        capacity = self.capacity
+        for item in data:
+            if not items:
+                self._first_enqueued = time.perf_counter()
+            while len(items) >= capacity:
+                self.max_depth = max(self.max_depth, len(items))
+                self.blocked_counter += 1
+                self._readable.set()
+                self._writable.clear()
+                yield from self._writable.wait()
+            items.append(item)
+            self.received_counter += 1
+        self.max_depth = max(self.max_depth, len(items))
+        self._readable.set()
+        raise TerminateProcessing()
+
+
+def enable_metrics(root, max_seconds=60, precision_bits=5):
+    """Records metrics for every element below root, which doesn't already do so"""
+    for element in root:
+        if element.metrics is None:
+            element.metrics = Metrics(max_seconds, precision_bits)
+    return root
+
+
+def metrics_snapshot(root):
+    """Returns [(element, metrics snapshot)] for every element below root recording metrics"""
+    return [(element, element.metrics.snapshot()) for element in root if element.metrics is not None]
+
+
+def compile(root):
+    """Replaces process() of every element below root with a flattened version and returns root.
+
+    Runs of synchronous elements are executed as plain process_sync() calls within one coroutine,
+    only elements which really await are called as coroutines. Elements which pass data to their
+    successors on their own (e.g. Coalescer, Parallelizer) call the compiled process() of them, too.
+    The tree (and which elements have metrics) must not be changed afterwards - compile it again if it is.
+    """
+    for element in root:
+        element.process = _compile(element)
+    return root
+
+
+def _is_synchronous(element):
+    return element.synchronous and element.__class__.process is Element.process
+
+
+def _compile(element):
+    """Returns a coroutine function equivalent to element.process"""
+    steps = []              # leading run of synchronous elements
+    while _is_synchronous(element):
+        steps.append(element.process_sync)
+        successors = list(element._successors())
+        if len(successors) != 1:
+            break
+        element = successors[0]
+    else:
+        if not steps:
+            return _compile_asynchronous(element)
+        successors = [element]
+
+    tails = [_compile(successor) for successor in successors]
+
+    @asyncio.coroutine
+    def process(data):
+        try:
+            for step in steps:
+                data = step(data)
+        except TerminateProcessing:
+            return
+        for tail in tails:
+            yield from tail(data)
+
+    return process
+
+
+def _compile_asynchronous(element):
+    if element.__class__.process is not Element.process:    # handles its successors on its own
+        return element.__class__.process.__get__(element)
+
+    element_process = element._process if element.metrics is None else element._process_measured
+    tails = [_compile(successor) for successor in element._successors()]
+
+    @asyncio.coroutine
+    def process(data):
+        try:
+            result = yield from element_process(data)
+        except TerminateProcessing:
+            return
+        assert result is not None, "pipeline element '{0}' processing result must not be None".format(element.__class__.__name__)
+        for tail in tails:
+            yield from tail(result)
+
+    return process
@@ -1,9 +1,81 @@
 import time
+import struct
+import threading
 import itertools
 
+from . import protocol
+from .message import VibrationRecord
+
+
+class Sampler(object):
+    """Decides which entries a profiler records, so profiling does not distort the code it measures.
+
+    Of every action only every n-th entry is recorded - n is looked up in `rates` (action -> n) and
+    defaults to `every`. A rate of 0 never records the action. If `budget` is given, the profiler
+    may spend at most that fraction of every `interval` seconds recording entries - once exhausted,
+    all entries are skipped until the interval ends.
+
+    Profilers look up the action in `patterns` and skip the entry if the next value of the pattern is
+    False - this keeps the check for skipped entries cheap. Entries passing the pattern are checked
+    against the budget with admit().
+
+    While the budget is exhausted, `exhausted` is True - callers check it before even building the
+    arguments of log(), see pipeline.Element._profile. A timer thread resets it when the interval ends.
+    """
+
+    def __init__(self, every=1, rates=None, budget=None, interval=1):
+        self.every = every
+        self.rates = dict(rates) if rates is not None else {}
+        self.budget = budget
+        self.interval = interval
+
+        self.patterns = {}          # action -> endless iterator, True for the entries to record
+        self._interval_end = 0      # perf_counter time
+        self._remaining = 0         # seconds left to spend in this interval
+        self._started = None        # perf_counter time the current entry was admitted at
+        self.exhausted = False
+
+    def pattern(self, action):
+        rate = self.rates.get(action, self.every)
+        if rate:
+            pattern = itertools.cycle([False] * (rate - 1) + [True])
+        else:
+            pattern = itertools.repeat(False)
+        self.patterns[action] = pattern
+        return pattern
+
+    def admit(self):
+        """Returns whether the budget allows recording an entry. If so, call recorded() afterwards"""
+        if self.budget is None:
+            return True
+        now = time.perf_counter()
+        if now >= self._interval_end:
+            self._interval_end = now + self.interval
+            self._remaining = self.budget * self.interval
+        elif self._remaining <= 0:
+            return False
+        self._started = now
+        return True
+
+    def recorded(self):
+        if self._started is not None:
+            now = time.perf_counter()
+            self._remaining -= now - self._started
+            self._started = None
+            if self._remaining <= 0 and not self.exhausted:
+                self.exhausted = True
+                timer = threading.Timer(self._interval_end - now, self._renew)
+                timer.daemon = True
+                timer.start()
+
+    def _renew(self):
+        self.exhausted = False      # admit() starts the next interval
+
+
 class Profiler(object):
-    def __init__(self):
+    def __init__(self, sampler=None):
         self.entries = []
+        self.sampler = sampler
 
     def save_data(self, path):
         def flatten(entry):
@@ -18,5 +90,266 @@ class Profiler(object):
             f.write("\n".join(entries))
 
     def log(self, action, *text):
+        sampler = self.sampler
+        if sampler is not None:
+            pattern = sampler.patterns.get(action)
+            if pattern is None:
+                pattern = sampler.pattern(action)
+            if not next(pattern) or not sampler.admit():
+                return
         self.entries.append((action, time.time() * 1000, text))
-        
+        if sampler is not None:
+            sampler.recorded()
+
+
+if hasattr(time, 'perf_counter_ns'):
+    _perf_counter_ns = time.perf_counter_ns
+else:       # before Python 3.7
+    def _perf_counter_ns():
+        return int(time.perf_counter() * 1000000000)
+
+
+_MAGIC = b'SDPROF1\0'
+_HEADER = struct.Struct('<8sqqH')      # magic, wall clock ns and perf counter ns at the start, record size
+_STRING = struct.Struct('<HH')         # id, length of the UTF-8 bytes following
+_RECORDS = struct.Struct('<I')         # number of records following
+
+_SLOTS = 6                              # arguments per record
+_PADDING = (0,) * _SLOTS
+_FLOAT, _INT, _STRING_ID = range(3)     # argument kinds, two bits per slot
+_KINDS = { float: _FLOAT, int: _INT, bool: _INT, str: _STRING_ID }
+_VIBRATION_FLAG = 1                     # the first four slots hold target_region, actor_index, intensity and priority
+_VIBRATION_KINDS = _INT | _INT << 2 | _FLOAT << 4 | _INT << 6
+_Message = protocol.Message
+_Vibration = protocol.Vibration
+_VIBRATION = protocol.Message.VIBRATION
+
+
+class BinaryProfiler(object):
+    """Drop-in replacement for Profiler, which records into a preallocated ring buffer of fixed-size records.
+
+    Every record holds a perf counter timestamp in nanoseconds, the interned action, and up to SLOTS
+    arguments. Numbers are stored as they are, strings are interned and vibrations (protocol messages,
+    message.VibrationRecords) are unpacked into their fields - no references to the logged objects are
+    kept. Other objects are recorded by their class name, arguments beyond SLOTS are dropped.
+
+    If a `sampler` is given, only the entries it samples are recorded.
+
+    If `path` is given, the records are streamed to that file whenever the buffer is full and on
+    flush() and close(). Otherwise the buffer keeps the latest `capacity` records and save_data()
+    writes them. Use read_profile() or convert() to read the file.
+
+    The file starts with a header, followed by chunks: b'S' defines an interned string, b'R' holds a
+    number of records.
+    """
+
+    RECORD = struct.Struct('<qHBBH6d')      # timestamp ns, action id, argument count, flags, argument kinds, arguments
+    SLOTS = _SLOTS
+
+    def __init__(self, capacity=65536, path=None, sampler=None):
+        self.capacity = capacity
+        self.sampler = sampler
+        self._record_size = self.RECORD.size
+        self._pack_into = self.RECORD.pack_into
+        self._buffer = bytearray(capacity * self._record_size)
+        self._next = 0              # index of the next record
+        self._count = 0             # records in the buffer, ending before _next
+        self._strings = {}          # action or string argument -> id
+        self._unwritten_strings = []    # interned since the last write to the file
+        self._layouts = {}          # (flags, argument classes) -> (kinds, string indices, count)
+        self.overwritten_counter = 0
+        self._start_wall = int(time.time() * 1000000000)
+        self._start_perf = _perf_counter_ns()
+        self._file = None
+        if path is not None:
+            self.open(path)
+
+    def _intern(self, string):
+        string_id = self._strings.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings[string] = string_id
+            self._unwritten_strings.append(string)
+        return string_id
+
+    def _layout(self, flags, classes):
+        """Returns the kinds, the indices of the string slots and the argument count for arguments of the classes"""
+        kinds = 0
+        string_indexes = []
+        offset = 4 if flags & _VIBRATION_FLAG else 0
+        if offset:
+            kinds = _VIBRATION_KINDS
+        key = (flags, classes)
+        classes = classes[:_SLOTS - offset]       # the rest is dropped
+        for index, cls in enumerate(classes, offset):
+            kind = _KINDS.get(cls, _STRING_ID)
+            if kind == _STRING_ID:
+                string_indexes.append(index)
+            kinds |= kind << 2 * index
+        layout = (kinds, tuple(string_indexes), offset + len(classes))
+        self._layouts[key] = layout
+        return layout
+
+    def log(self, action, *args):
+        sampler = self.sampler
+        if sampler is not None:
+            pattern = sampler.patterns.get(action)
+            if pattern is None:
+                pattern = sampler.pattern(action)
+            if not next(pattern) or not sampler.admit():
+                return
+        timestamp = _perf_counter_ns()
+        strings = self._strings
+        action_id = strings.get(action)
+        if action_id is None:
+            action_id = self._intern(action)
+
+        if self._count == self.capacity:
+            if self._file is not None:
+                self.flush()
+            else:
+                self.overwritten_counter += 1
+                self._count -= 1
+
+        flags = 0
+        values = []
+        if args:
+            first = args[0]
+            cls = first.__class__
+            if cls is VibrationRecord:
+                values = list(first)
+            elif cls is _Message and first.type == _VIBRATION:
+                first = first.vibration
+                values = [first.target_region, first.actor_index, first.intensity, first.priority]
+            elif cls is _Vibration:
+                values = [first.target_region, first.actor_index, first.intensity, first.priority]
+            if values:
+                flags = _VIBRATION_FLAG
+                args = args[1:]
+
+        classes = tuple(map(type, args))
+        layout = self._layouts.get((flags, classes))
+        if layout is None:
+            layout = self._layout(flags, classes)
+        kinds, string_indexes, count = layout
+
+        values.extend(args[:count - len(values)])
+        for index in string_indexes:
+            value = values[index]
+            string = value if value.__class__ is str else value.__class__.__name__
+            string_id = strings.get(string)
+            values[index] = string_id if string_id is not None else self._intern(string)
+        if count < _SLOTS:
+            values.extend(_PADDING[count:])
+        self._pack_into(self._buffer, self._next * self._record_size, timestamp, action_id, count, flags, kinds, *values)
+        self._next += 1
+        if self._next == self.capacity:
+            self._next = 0
+        self._count += 1
+        if sampler is not None:
+            sampler.recorded()
+
+    def _records(self):
+        """The buffered records, oldest first"""
+        record_size = self.RECORD.size
+        first = (self._next - self._count) % self.capacity
+        if first + self._count <= self.capacity:
+            return [self._buffer[first * record_size:(first + self._count) * record_size]]
+        return [self._buffer[first * record_size:], self._buffer[:self._next * record_size]]
+
+    def _write_header(self, f):
+        f.write(_HEADER.pack(_MAGIC, self._start_wall, self._start_perf, self.RECORD.size))
+
+    def _write_strings(self, f, strings):
+        for string in strings:
+            encoded = string.encode('utf-8')
+            f.write(b'S' + _STRING.pack(self._strings[string], len(encoded)) + encoded)
+
+    def _write_records(self, f):
+        f.write(b'R' + _RECORDS.pack(self._count))
+        for part in self._records():
+            f.write(part)
+
+    def open(self, path):
+        """Streams the records to the file from now on"""
+        self.close()
+        self._file = open(path, 'wb')
+        self._write_header(self._file)
+        self._write_strings(self._file, self._strings)      # interned before - possibly used by buffered records
+        self._unwritten_strings = []
+
+    def flush(self):
+        """Writes the buffered records to the file opened with open()"""
+        if self._file is None:
+            return
+        self._write_strings(self._file, self._unwritten_strings)
+        self._unwritten_strings = []
+        if self._count:
+            self._write_records(self._file)
+            self._count = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def save_data(self, path):
+        """Writes the buffered records to a new file"""
+        with open(path, 'wb') as f:
+            self._write_header(f)
+            self._write_strings(f, self._strings)
+            self._write_records(f)
+
+
+def read_profile(path):
+    """Yields the (action, wall clock milliseconds, arguments) entries of a BinaryProfiler file.
+
+    Recorded vibrations are returned as message.VibrationRecords.
+    """
+    record = BinaryProfiler.RECORD
+    strings = {}
+    with open(path, 'rb') as f:
+        magic, start_wall, start_perf, record_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or record_size != record.size:
+            raise ValueError('Not a binary profile: %s' % path)
+
+        while True:
+            chunk_type = f.read(1)
+            if not chunk_type:
+                break
+            if chunk_type == b'S':
+                string_id, length = _STRING.unpack(f.read(_STRING.size))
+                strings[string_id] = f.read(length).decode('utf-8')
+            elif chunk_type == b'R':
+                count, = _RECORDS.unpack(f.read(_RECORDS.size))
+                for timestamp, action_id, argument_count, flags, kinds, *values in record.iter_unpack(f.read(count * record_size)):
+                    arguments = []
+                    for index in range(argument_count):
+                        kind = kinds >> 2 * index & 3
+                        value = values[index]
+                        arguments.append(value if kind == _FLOAT else int(value) if kind == _INT else strings[int(value)])
+                    if flags & _VIBRATION_FLAG:
+                        arguments[:4] = [VibrationRecord(*arguments[:4])]
+                    yield (strings[action_id], (start_wall + timestamp - start_perf) / 1000000, arguments)
+            else:
+                raise ValueError('Corrupt binary profile: %s' % path)
+
+
+def _format_argument(argument):
+    if argument.__class__ is VibrationRecord:
+        try:
+            region = protocol.Vibration.Region.Name(argument.target_region)
+        except ValueError:
+            region = argument.target_region
+        return "target_region: %s;actor_index: %d;intensity: %r;priority: %d;" % (region, argument.actor_index, argument.intensity, argument.priority)
+    return str(argument)
+
+
+def convert(binary_path, text_path):
+    """Writes a BinaryProfiler file in the format of Profiler.save_data (as read by bin/profile_parser.rb)"""
+    with open(text_path, 'w') as f:
+        lines = (';'.join(itertools.chain((action, '%.3f' % milliseconds), map(_format_argument, arguments))) for action, milliseconds, arguments in read_profile(binary_path))
+        f.write("\n".join(lines))
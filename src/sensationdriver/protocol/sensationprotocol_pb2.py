@@ -36,7 +36,7 @@ from google.protobuf import descriptor_pb2
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='sensationprotocol.proto',
   package='sensation',
-  serialized_pb=b('\n\x17sensationprotocol.proto\x12\tsensation\"\xf6\x01\n\tVibration\x12\x32\n\rtarget_region\x18\x01 \x02(\x0e\x32\x1b.sensation.Vibration.Region\x12\x13\n\x0b\x61\x63tor_index\x18\x02 \x02(\x05\x12\x11\n\tintensity\x18\x03 \x02(\x02\x12\x15\n\x08priority\x18\x04 \x01(\x05:\x03\x31\x30\x30\"v\n\x06Region\x12\t\n\x05\x43HEST\x10\x00\x12\x08\n\x04\x42\x41\x43K\x10\x01\x12\x0c\n\x08LEFT_ARM\x10\x02\x12\r\n\tRIGHT_ARM\x10\x03\x12\r\n\tLEFT_HAND\x10\x04\x12\x0e\n\nRIGHT_HAND\x10\x05\x12\x0c\n\x08LEFT_LEG\x10\x06\x12\r\n\tRIGHT_LEG\x10\x07\"\x13\n\x11MuscleStimulation\"\xde\x02\n\x05Track\x12\x32\n\rtarget_region\x18\x01 \x02(\x0e\x32\x1b.sensation.Vibration.Region\x12\x13\n\x0b\x61\x63tor_index\x18\x02 \x02(\x05\x12,\n\tkeyframes\x18\x03 \x03(\x0b\x32\x19.sensation.Track.Keyframe\x1a\xdd\x01\n\x08Keyframe\x12\x36\n\rcontrol_point\x18\x01 \x02(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x12\x39\n\x10in_tangent_start\x18\x02 \x01(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x12\x38\n\x0fout_tangent_end\x18\x03 \x01(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x1a$\n\x05Point\x12\x0c\n\x04time\x18\x01 \x02(\x02\x12\r\n\x05value\x18\x02 \x02(\x02\"C\n\x0bLoadPattern\x12\x12\n\nidentifier\x18\x01 \x02(\t\x12 \n\x06tracks\x18\x02 \x03(\x0b\x32\x10.sensation.Track\"7\n\x0bPlayPattern\x12\x12\n\nidentifier\x18\x01 \x02(\t\x12\x14\n\x08priority\x18\x02 \x01(\x05:\x02\x38\x30\"\xd0\x02\n\x07Message\x12,\n\x04type\x18\x01 \x02(\x0e\x32\x1e.sensation.Message.MessageType\x12\'\n\tvibration\x18\x02 \x01(\x0b\x32\x14.sensation.Vibration\x12\x38\n\x12muscle_stimulation\x18\x03 \x01(\x0b\x32\x1c.sensation.MuscleStimulation\x12,\n\x0cload_pattern\x18\x04 \x01(\x0b\x32\x16.sensation.LoadPattern\x12,\n\x0cplay_pattern\x18\x05 \x01(\x0b\x32\x16.sensation.PlayPattern\"X\n\x0bMessageType\x12\r\n\tVIBRATION\x10\x00\x12\x16\n\x12MUSCLE_STIMULATION\x10\x01\x12\x10\n\x0cLOAD_PATTERN\x10\x02\x12\x10\n\x0cPLAY_PATTERN\x10\x03'))
+  serialized_pb=b('\n\x17sensationprotocol.proto\x12\tsensation\"\x90\x02\n\tVibration\x12\x32\n\rtarget_region\x18\x01 \x02(\x0e\x32\x1b.sensation.Vibration.Region\x12\x13\n\x0b\x61\x63tor_index\x18\x02 \x02(\x05\x12\x11\n\tintensity\x18\x03 \x02(\x02\x12\x15\n\x08priority\x18\x04 \x01(\x05:\x03\x31\x30\x30\x12\x18\n\x10\x63lient_timestamp\x18\x05 \x01(\x03\"v\n\x06Region\x12\t\n\x05\x43HEST\x10\x00\x12\x08\n\x04\x42\x41\x43K\x10\x01\x12\x0c\n\x08LEFT_ARM\x10\x02\x12\r\n\tRIGHT_ARM\x10\x03\x12\r\n\tLEFT_HAND\x10\x04\x12\x0e\n\nRIGHT_HAND\x10\x05\x12\x0c\n\x08LEFT_LEG\x10\x06\x12\r\n\tRIGHT_LEG\x10\x07\"\x95\x01\n\x0eVibrationBatch\x12\x37\n\x0etarget_regions\x18\x01 \x03(\x0e\x32\x1b.sensation.Vibration.RegionB\x02\x10\x01\x12\x19\n\ractor_indices\x18\x02 \x03(\x05\x42\x02\x10\x01\x12\x17\n\x0bintensities\x18\x03 \x03(\x02\x42\x02\x10\x01\x12\x16\n\npriorities\x18\x04 \x03(\x05\x42\x02\x10\x01\"\x13\n\x11MuscleStimulation\"\xde\x02\n\x05Track\x12\x32\n\rtarget_region\x18\x01 \x02(\x0e\x32\x1b.sensation.Vibration.Region\x12\x13\n\x0b\x61\x63tor_index\x18\x02 \x02(\x05\x12,\n\tkeyframes\x18\x03 \x03(\x0b\x32\x19.sensation.Track.Keyframe\x1a\xdd\x01\n\x08Keyframe\x12\x36\n\rcontrol_point\x18\x01 \x02(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x12\x39\n\x10in_tangent_start\x18\x02 \x01(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x12\x38\n\x0fout_tangent_end\x18\x03 \x01(\x0b\x32\x1f.sensation.Track.Keyframe.Point\x1a$\n\x05Point\x12\x0c\n\x04time\x18\x01 \x02(\x02\x12\r\n\x05value\x18\x02 \x02(\x02\"C\n\x0bLoadPattern\x12\x12\n\nidentifier\x18\x01 \x02(\t\x12 \n\x06tracks\x18\x02 \x03(\x0b\x32\x10.sensation.Track\"L\n\x0bPlayPattern\x12\x12\n\nidentifier\x18\x01 \x02(\t\x12\x14\n\x08priority\x18\x02 \x01(\x05:\x02\x38\x30\x12\x13\n\x04loop\x18\x03 \x01(\x08:\x05\x66\x61lse\"!\n\x0bStopPattern\x12\x12\n\nidentifier\x18\x01 \x02(\t\"\xd9\x03\n\x07Message\x12,\n\x04type\x18\x01 \x02(\x0e\x32\x1e.sensation.Message.MessageType\x12\'\n\tvibration\x18\x02 \x01(\x0b\x32\x14.sensation.Vibration\x12\x38\n\x12muscle_stimulation\x18\x03 \x01(\x0b\x32\x1c.sensation.MuscleStimulation\x12,\n\x0cload_pattern\x18\x04 \x01(\x0b\x32\x16.sensation.LoadPattern\x12,\n\x0cplay_pattern\x18\x05 \x01(\x0b\x32\x16.sensation.PlayPattern\x12\x32\n\x0fvibration_batch\x18\x06 \x01(\x0b\x32\x19.sensation.VibrationBatch\x12,\n\x0cstop_pattern\x18\x07 \x01(\x0b\x32\x16.sensation.StopPattern\"\x7f\n\x0bMessageType\x12\r\n\tVIBRATION\x10\x00\x12\x16\n\x12MUSCLE_STIMULATION\x10\x01\x12\x10\n\x0cLOAD_PATTERN\x10\x02\x12\x10\n\x0cPLAY_PATTERN\x10\x03\x12\x13\n\x0fVIBRATION_BATCH\x10\x04\x12\x10\n\x0cSTOP_PATTERN\x10\x05'))
 
 
 
@@ -81,8 +81,8 @@ _VIBRATION_REGION = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   options=None,
-  serialized_start=167,
-  serialized_end=285,
+  serialized_start=193,
+  serialized_end=311,
 )
 
 _MESSAGE_MESSAGETYPE = _descriptor.EnumDescriptor(
@@ -107,11 +107,19 @@ _MESSAGE_MESSAGETYPE = _descriptor.EnumDescriptor(
       name='PLAY_PATTERN', index=3, number=3,
       options=None,
       type=None),
+    _descriptor.EnumValueDescriptor(
+      name='VIBRATION_BATCH', index=4, number=4,
+      options=None,
+      type=None),
+    _descriptor.EnumValueDescriptor(
+      name='STOP_PATTERN', index=5, number=5,
+      options=None,
+      type=None),
   ],
   containing_type=None,
   options=None,
-  serialized_start=1036,
-  serialized_end=1124,
+  serialized_start=1368,
+  serialized_end=1495,
 )
 
 
@@ -150,6 +158,13 @@ _VIBRATION = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='client_timestamp', full_name='sensation.Vibration.client_timestamp', index=4,
+      number=5, type=3, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -161,7 +176,56 @@ _VIBRATION = _descriptor.Descriptor(
   is_extendable=False,
   extension_ranges=[],
   serialized_start=39,
-  serialized_end=285,
+  serialized_end=311,
+)
+
+
+_VIBRATIONBATCH = _descriptor.Descriptor(
+  name='VibrationBatch',
+  full_name='sensation.VibrationBatch',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='target_regions', full_name='sensation.VibrationBatch.target_regions', index=0,
+      number=1, type=14, cpp_type=8, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='actor_indices', full_name='sensation.VibrationBatch.actor_indices', index=1,
+      number=2, type=5, cpp_type=1, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='intensities', full_name='sensation.VibrationBatch.intensities', index=2,
+      number=3, type=2, cpp_type=6, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), b('\020\001'))),
+    _descriptor.FieldDescriptor(
+      name='priorities', full_name='sensation.VibrationBatch.priorities', index=3,
+      number=4, type=5, cpp_type=1, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=_descriptor._ParseOptions(descriptor_pb2.FieldOptions(), b('\020\001'))),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=314,
+  serialized_end=463,
 )
 
 
@@ -181,8 +245,8 @@ _MUSCLESTIMULATION = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=287,
-  serialized_end=306,
+  serialized_start=465,
+  serialized_end=484,
 )
 
 
@@ -216,8 +280,8 @@ _TRACK_KEYFRAME_POINT = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=623,
-  serialized_end=659,
+  serialized_start=801,
+  serialized_end=837,
 )
 
 _TRACK_KEYFRAME = _descriptor.Descriptor(
@@ -257,8 +321,8 @@ _TRACK_KEYFRAME = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=438,
-  serialized_end=659,
+  serialized_start=616,
+  serialized_end=837,
 )
 
 _TRACK = _descriptor.Descriptor(
@@ -298,8 +362,8 @@ _TRACK = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=309,
-  serialized_end=659,
+  serialized_start=487,
+  serialized_end=837,
 )
 
 
@@ -333,8 +397,8 @@ _LOADPATTERN = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=661,
-  serialized_end=728,
+  serialized_start=839,
+  serialized_end=906,
 )
 
 
@@ -359,6 +423,41 @@ _PLAYPATTERN = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='loop', full_name='sensation.PlayPattern.loop', index=2,
+      number=3, type=8, cpp_type=7, label=1,
+      has_default_value=True, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=908,
+  serialized_end=984,
+)
+
+
+_STOPPATTERN = _descriptor.Descriptor(
+  name='StopPattern',
+  full_name='sensation.StopPattern',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='identifier', full_name='sensation.StopPattern.identifier', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=unicode(b(""), "utf-8"),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -368,8 +467,8 @@ _PLAYPATTERN = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=730,
-  serialized_end=785,
+  serialized_start=986,
+  serialized_end=1019,
 )
 
 
@@ -415,6 +514,20 @@ _MESSAGE = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='vibration_batch', full_name='sensation.Message.vibration_batch', index=5,
+      number=6, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='stop_pattern', full_name='sensation.Message.stop_pattern', index=6,
+      number=7, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -425,12 +538,13 @@ _MESSAGE = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=788,
-  serialized_end=1124,
+  serialized_start=1022,
+  serialized_end=1495,
 )
 
 _VIBRATION.fields_by_name['target_region'].enum_type = _VIBRATION_REGION
 _VIBRATION_REGION.containing_type = _VIBRATION;
+_VIBRATIONBATCH.fields_by_name['target_regions'].enum_type = _VIBRATION_REGION
 _TRACK_KEYFRAME_POINT.containing_type = _TRACK_KEYFRAME;
 _TRACK_KEYFRAME.fields_by_name['control_point'].message_type = _TRACK_KEYFRAME_POINT
 _TRACK_KEYFRAME.fields_by_name['in_tangent_start'].message_type = _TRACK_KEYFRAME_POINT
@@ -444,12 +558,16 @@ _MESSAGE.fields_by_name['vibration'].message_type = _VIBRATION
 _MESSAGE.fields_by_name['muscle_stimulation'].message_type = _MUSCLESTIMULATION
 _MESSAGE.fields_by_name['load_pattern'].message_type = _LOADPATTERN
 _MESSAGE.fields_by_name['play_pattern'].message_type = _PLAYPATTERN
+_MESSAGE.fields_by_name['vibration_batch'].message_type = _VIBRATIONBATCH
+_MESSAGE.fields_by_name['stop_pattern'].message_type = _STOPPATTERN
 _MESSAGE_MESSAGETYPE.containing_type = _MESSAGE;
 DESCRIPTOR.message_types_by_name['Vibration'] = _VIBRATION
+DESCRIPTOR.message_types_by_name['VibrationBatch'] = _VIBRATIONBATCH
 DESCRIPTOR.message_types_by_name['MuscleStimulation'] = _MUSCLESTIMULATION
 DESCRIPTOR.message_types_by_name['Track'] = _TRACK
 DESCRIPTOR.message_types_by_name['LoadPattern'] = _LOADPATTERN
 DESCRIPTOR.message_types_by_name['PlayPattern'] = _PLAYPATTERN
+DESCRIPTOR.message_types_by_name['StopPattern'] = _STOPPATTERN
 DESCRIPTOR.message_types_by_name['Message'] = _MESSAGE
 
 Vibration = _reflection.GeneratedProtocolMessageType('Vibration', (_message.Message,),
@@ -458,6 +576,12 @@ Vibration = _reflection.GeneratedProtocolMessageType('Vibration', (_message.Mess
       # @@protoc_insertion_point(class_scope:sensation.Vibration)
     })
 
+VibrationBatch = _reflection.GeneratedProtocolMessageType('VibrationBatch', (_message.Message,),
+    {
+      'DESCRIPTOR': _VIBRATIONBATCH,
+      # @@protoc_insertion_point(class_scope:sensation.VibrationBatch)
+    })
+
 MuscleStimulation = _reflection.GeneratedProtocolMessageType('MuscleStimulation', (_message.Message,),
     {
       'DESCRIPTOR': _MUSCLESTIMULATION,
@@ -492,6 +616,12 @@ PlayPattern = _reflection.GeneratedProtocolMessageType('PlayPattern', (_message.
       # @@protoc_insertion_point(class_scope:sensation.PlayPattern)
     })
 
+StopPattern = _reflection.GeneratedProtocolMessageType('StopPattern', (_message.Message,),
+    {
+      'DESCRIPTOR': _STOPPATTERN,
+      # @@protoc_insertion_point(class_scope:sensation.StopPattern)
+    })
+
 Message = _reflection.GeneratedProtocolMessageType('Message', (_message.Message,),
     {
       'DESCRIPTOR': _MESSAGE,
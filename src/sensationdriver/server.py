@@ -12,6 +12,7 @@ class Server(object):
         self.port = 10000
 
         self.handler = None
+        self.tracer = None      # tracing.Tracer, stamped whenever data was read
         self._handler_set_up = False
         self._server = None     # asyncio.Server
         self._clients = {}      # asyncio.Task -> (asyncio.StreamReader, asyncio.StreamWriter)
@@ -60,6 +61,8 @@ class Server(object):
                         self.logger.info('client %s disconnected', client_ip)
                     break
 
+                if self.tracer is not None:
+                    self.tracer.received()
                 if self.handler is not None:
                     yield from self.handler.process(data)
         except asyncio.CancelledError:
@@ -0,0 +1,106 @@
+import time
+import threading
+import collections
+
+from .metrics import Histogram
+
+
+class Tracer(object):
+    """Traces vibrations carrying a client_timestamp from the client to the I2C write.
+
+    Every traced vibration is stamped when the server read it, when it was parsed, when the vibration
+    handler dispatched it to its actor and when its driver wrote to the device. The durations between
+    these hops are aggregated per hop. The client timestamp is compared to the server's wall clock, so
+    the 'network' hop (and with it 'total') only makes sense if both clocks are synchronized (PTP).
+
+    Traces are keyed by region, actor and client timestamp. Vibrations which never reach an actor
+    (superseded by the Coalescer, unknown actors...) are evicted once more than `capacity` traces are
+    open and counted in `dropped_counter`.
+
+    The driver hop is recorded on whichever thread writes to the bus (see bus.Worker), the other hops
+    on the event loop.
+    """
+
+    HOPS = ('network', 'parse', 'dispatch', 'actuate', 'total')
+
+    def __init__(self, capacity=4096, max_seconds=60, precision_bits=5):
+        self.capacity = capacity
+        self.read_time = None       # time.time() the server read the data currently processed
+
+        self._parsed = collections.OrderedDict()    # (region, actor index, client timestamp) -> (client time, read time, parse time), oldest first
+        self._dispatched = {}       # driver -> [(client time, read time, parse time, dispatch time)]
+        self._lock = threading.Lock()
+
+        self.histograms = collections.OrderedDict((hop, Histogram(max_seconds, precision_bits)) for hop in self.HOPS)
+        self.dropped_counter = 0
+        self.skew_counter = 0       # negative hops (clocks out of sync), recorded as 0
+
+    def received(self):
+        self.read_time = time.time()
+
+    def parsed(self, vibration):
+        client_timestamp = vibration.client_timestamp
+        if not client_timestamp:
+            return
+        parsed = self._parsed
+        if len(parsed) >= self.capacity:
+            parsed.popitem(last=False)
+            self.dropped_counter += 1
+        read_time = self.read_time
+        now = time.time()
+        parsed[(vibration.target_region, vibration.actor_index, client_timestamp)] = (client_timestamp / 1000000, read_time if read_time is not None else now, now)
+
+    def dispatched(self, vibration, driver):
+        client_timestamp = getattr(vibration, 'client_timestamp', 0)      # message.VibrationRecords carry none
+        if not client_timestamp:
+            return
+        trace = self._parsed.pop((vibration.target_region, vibration.actor_index, client_timestamp), None)
+        if trace is None:
+            return
+        with self._lock:
+            self._dispatched.setdefault(driver, []).append(trace + (time.time(),))
+
+    def written(self, driver):
+        """Completes the traces dispatched to the driver. Call after the driver wrote all changes queued so far"""
+        if not self._dispatched:
+            return
+        with self._lock:
+            traces = self._dispatched.pop(driver, None)
+            if traces is None:
+                return
+            now = time.time()
+            histograms = self.histograms
+            for client_time, read_time, parse_time, dispatch_time in traces:
+                self._record(histograms['network'], read_time - client_time)
+                self._record(histograms['parse'], parse_time - read_time)
+                self._record(histograms['dispatch'], dispatch_time - parse_time)
+                self._record(histograms['actuate'], now - dispatch_time)
+                self._record(histograms['total'], now - client_time)
+
+    def _record(self, histogram, seconds):
+        if seconds < 0:
+            self.skew_counter += 1
+            seconds = 0
+        histogram.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+            self.dropped_counter = 0
+            self.skew_counter = 0
+
+    def snapshot(self):
+        with self._lock:
+            return collections.OrderedDict((hop, histogram.snapshot()) for hop, histogram in self.histograms.items())
+
+    def report(self):
+        """Log lines with the percentiles per hop"""
+        def milliseconds(value):
+            return '-' if value is None else '%.3f' % (value * 1000)
+
+        lines = []
+        for hop, snapshot in self.snapshot().items():
+            lines.append("latency %s: count %d, ms p50 %s p90 %s p99 %s max %s" % (hop, snapshot['count'], milliseconds(snapshot['p50']), milliseconds(snapshot['p90']), milliseconds(snapshot['p99']), milliseconds(snapshot['max'])))
+        lines.append("latency traces dropped %d, negative hops %d" % (self.dropped_counter, self.skew_counter))
+        return lines
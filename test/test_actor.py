@@ -6,6 +6,7 @@ from utils import *
 from sensationdriver import actor
 from sensationdriver.actor import PrioritizedIntensity
 from sensationdriver.actor import VibrationMotor
+from sensationdriver.dummy.pca9685 import SimulatedDriver
 
 
 class TestPrioritizedIntensity(unittest.TestCase):
@@ -59,6 +60,25 @@ class TestPrioritizedIntensity(unittest.TestCase):
         self.intensity.set(2, 11)
         self.assertEqual(self.intensity.top_priority(), 11)
 
+    def test_many_priorities(self):
+        for priority in [50, 120, 80, 100, 110]:
+            self.intensity.set(priority / 1000, priority)
+        self.assertEqual(self.intensity.eval(), 0.12)
+
+        self.intensity.set(0, 120)
+        self.assertEqual(self.intensity.eval(), 0.11)
+        self.assertEqual(self.intensity.top_priority(), 110)
+
+        self.intensity.set(0, 80)
+        self.intensity.set(0.5, 100)
+        self.intensity.set(0, 110)
+        self.assertEqual(self.intensity.eval(), 0.5)
+        self.intensity.set(0, 100)
+        self.assertEqual(self.intensity.eval(), 0.05)
+        self.intensity.set(0, 50)
+        self.assertEqual(self.intensity.eval(), 0)
+        self.assertEqual(self.intensity.top_priority(), 0)
+
 
 class TestVibrationMotor(AsyncTestCase):
 
@@ -75,6 +95,12 @@ class TestVibrationMotor(AsyncTestCase):
             self.intensity = intensity
             self.calls.append(((current_time - self.start_time), self.intensity))
 
+        def queuePWM(self, outlet, start, intensity):
+            self.queued = intensity
+
+        def flush(self):
+            self.setPWM(0, 0, self.queued)
+
     def setUp(self):
         super().setUp()
 
@@ -238,6 +264,27 @@ class TestVibrationMotor(AsyncTestCase):
         self.assertEqual(len(self.driver.calls), 2)
         self.assertEqual(self.motor.intensity(), 0.8)
 
+    @async_test
+    def test_deferred_set_is_queued(self):
+        self.motor.deferred = True
+        self.driver.queued = None
+
+        yield from self.motor.set_intensity(1)
+
+        self.assertEqual(len(self.driver.calls), 0)
+        self.assertEqual(self.driver.queued, 1)
+
+    @async_test
+    def test_deferred_delayed_set_flushes(self):
+        self.motor.deferred = True
+
+        self.run_async(self.motor.set_intensity(0.1))
+
+        yield from self.wait_for_async()
+
+        self.assertEqual(len(self.driver.calls), 2)
+        self.assertAlmostEqual(self.driver.calls[1][1], self.motor._map_intensity(0.1), delta=0.01)
+
 
 class TestActorConfigParsing(unittest.TestCase):
     def test_simple_parsing(self):
@@ -368,6 +415,57 @@ class TestActorConfigParsing(unittest.TestCase):
         self.assertEqual(len(result['regions']['LEFT_HAND']), 2)
         self.assertNotEqual(result['regions']['LEFT_HAND'][0].driver, result['regions']['LEFT_HAND'][1].driver)
 
+    def test_worker_per_bus(self):
+        config = """{
+                        "vibration": {
+                            "i2c_worker_threads": true,
+                            "regions": [
+                                {
+                                    "name": "LEFT_HAND",
+                                    "i2c_bus_number": 0,
+                                    "driver_address": "0x40",
+                                    "actors": [{ "position": "thumb", "index": 0, "outlet": 0 }]
+                                },
+                                {
+                                    "name": "RIGHT_HAND",
+                                    "i2c_bus_number": 1,
+                                    "driver_address": "0x41",
+                                    "actors": [{ "position": "thumb", "index": 0, "outlet": 0 }]
+                                },
+                                {
+                                    "name": "BACK",
+                                    "i2c_bus_number": 1,
+                                    "driver_address": "0x42",
+                                    "actors": [{ "position": "center", "index": 0, "outlet": 0 }]
+                                }
+                            ]
+                        }
+                    }"""
+        config = yaml.load(config)
+
+        result = actor.parse_config(config)
+        self.assertEqual(len(result['workers']), 2)
+        self.assertEqual(result['regions']['RIGHT_HAND'][0].driver.executor, result['regions']['BACK'][0].driver.executor)
+        self.assertNotEqual(result['regions']['LEFT_HAND'][0].driver.executor, result['regions']['RIGHT_HAND'][0].driver.executor)
+
+    def test_no_workers_by_default(self):
+        config = """{
+                        "vibration": {
+                            "regions": [
+                                {
+                                    "name": "LEFT_HAND",
+                                    "i2c_bus_number": 1,
+                                    "driver_address": "0x40",
+                                    "actors": [{ "position": "thumb", "index": 0, "outlet": 0 }]
+                                }
+                            ]
+                        }
+                    }"""
+        config = yaml.load(config)
+
+        result = actor.parse_config(config)
+        self.assertEqual(result['workers'], [])
+
     def test_global_actor_settings(self):
         config = """{
                         "vibration": {
@@ -487,6 +585,78 @@ class TestActorConfigParsing(unittest.TestCase):
         self.assertEqual(a.min_intensity_warmup, 64)
         self.assertEqual(a.min_instant_intensity, 65)
 
+    def test_driver_class(self):
+        config = """{
+                        "vibration": {
+                            "regions": [
+                                {
+                                    "name": "LEFT_HAND",
+                                    "i2c_bus_number": 1,
+                                    "driver_address": "0x40",
+                                    "actors": [
+                                        {
+                                            "position": "thumb",
+                                            "index": 0,
+                                            "outlet": 0
+                                        }
+                                    ]
+                                }
+                            ]
+                        }
+                    }"""
+        config = yaml.load(config)
+
+        result = actor.parse_config(config, driver_class=SimulatedDriver)
+
+        self.assertIsInstance(result['drivers'][0], SimulatedDriver)
+        self.assertIs(result['regions']['LEFT_HAND'][0].driver, result['drivers'][0])
+
+
+class TestSimulatedDriver(unittest.TestCase):
+    def test_one_transaction_per_block_of_adjacent_channels(self):
+        driver = SimulatedDriver(transaction_latency=0)
+        for channel in [0, 1, 2, 5, 7, 8]:
+            driver.queuePWM(channel, 0, 0.5)
+        driver.flush()
+
+        self.assertEqual(driver.transaction_counter, 3)
+
+    def test_blocks_limited_to_smbus_burst(self):
+        driver = SimulatedDriver(transaction_latency=0)
+        for channel in range(16):
+            driver.queuePWM(channel, 0, 0.5)
+        driver.flush()
+        driver.flush()
+
+        self.assertEqual(driver.transaction_counter, 2)
+
+    def test_set_pwm_blocks(self):
+        driver = SimulatedDriver(transaction_latency=0.01)
+        start = time.time()
+        driver.setPWM(0, 0, 0.5)
+
+        self.assertEqual(driver.transaction_counter, 1)
+        self.assertGreaterEqual(time.time() - start, 0.01)
+
+    def test_flushes_on_executor(self):
+        class MemoryExecutor(object):
+            def __init__(self):
+                self.commands = []
+
+            def submit(self, key, command):
+                self.commands.append(command)
+
+        driver = SimulatedDriver(transaction_latency=0)
+        driver.executor = MemoryExecutor()
+        driver.flush()
+        driver.queuePWM(3, 0, 0.5)
+        driver.flush()
+
+        self.assertEqual(len(driver.executor.commands), 1)
+        self.assertEqual(driver.transaction_counter, 0)
+        driver.executor.commands[0]()
+        self.assertEqual(driver.transaction_counter, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,136 @@
+import threading
+import time
+
+from utils import *
+
+from sensationdriver.bus import Worker
+from sensationdriver.metrics import Metrics
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = Worker(1)
+        self.calls = []
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def recorder(self, name):
+        def command():
+            self.calls.append((name, threading.current_thread()))
+        return command
+
+    def test_executes_on_separate_thread(self):
+        self.worker.start()
+        self.worker.submit('a', self.recorder('a'))
+        self.worker.stop()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertNotEqual(self.calls[0][1], threading.current_thread())
+
+    def test_executes_in_submission_order(self):
+        self.worker.submit('a', self.recorder('a'))
+        self.worker.submit('b', self.recorder('b'))
+        self.worker.start()
+        self.worker.stop()
+
+        self.assertEqual([name for name, thread in self.calls], ['a', 'b'])
+
+    def test_coalesces_waiting_commands(self):
+        self.worker.submit('a', self.recorder('a1'))
+        self.worker.submit('b', self.recorder('b'))
+        self.worker.submit('a', self.recorder('a2'))
+        self.worker.start()
+        self.worker.stop()
+
+        self.assertEqual([name for name, thread in self.calls], ['a2', 'b'])
+        self.assertEqual(self.worker.coalesced_counter, 1)
+
+    def test_drops_oldest_when_full(self):
+        worker = Worker(1, capacity=2, logger=TestLogger(console=False))
+        worker.submit('a', self.recorder('a'))
+        worker.submit('b', self.recorder('b'))
+        worker.submit('c', self.recorder('c'))
+        worker.start()
+        worker.stop()
+
+        self.assertEqual([name for name, thread in self.calls], ['b', 'c'])
+        self.assertEqual(worker.dropped_counter, 1)
+
+    def test_metrics(self):
+        self.worker.metrics = Metrics()
+        self.worker.submit('a', self.recorder('a'))
+        self.worker.submit('b', self.recorder('b'))
+        time.sleep(0.01)
+        self.worker.start()
+        self.worker.stop()
+
+        self.assertEqual((self.worker.metrics.in_counter, self.worker.metrics.out_counter), (2, 2))
+        self.assertEqual(self.worker.metrics.process_time.count, 2)
+        self.assertGreater(self.worker.metrics.queue_wait.max, 0.005)
+
+    def test_stop_drains_queue(self):
+        def slow_command():
+            time.sleep(0.05)
+            self.calls.append(('slow', None))
+
+        self.worker.start()
+        self.worker.submit('a', slow_command)
+        self.worker.submit('b', self.recorder('b'))
+        self.worker.stop()
+
+        self.assertEqual([name for name, thread in self.calls], ['slow', 'b'])
+
+    def test_exceptions_are_logged(self):
+        def failing_command():
+            raise ValueError("bus error")
+
+        logger = TestLogger(console=False, capture=True)
+        worker = Worker(1, logger=logger)
+        worker.start()
+        worker.submit('a', failing_command)
+        worker.submit('b', self.recorder('b'))
+        worker.stop()
+
+        self.assertTrue(any("bus error" in line for line in logger.log))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_executes_waiting_commands_in_one_batch(self):
+        batches = []
+
+        class Batch(object):
+            def __enter__(batch):
+                batches.append(len(self.calls))
+            def __exit__(batch, type, value, traceback):
+                batches.append(len(self.calls))
+
+        worker = Worker(1, batch=Batch)
+        worker.submit('a', self.recorder('a'))
+        worker.submit('b', self.recorder('b'))
+        worker.start()
+        worker.stop()
+
+        self.assertEqual([name for name, thread in self.calls], ['a', 'b'])
+        self.assertEqual(batches, [0, 2])
+        self.assertEqual(worker.executed_counter, 2)
+
+    def test_failed_batch_reported(self):
+        failed = []
+
+        class Batch(object):
+            def __enter__(batch):
+                pass
+            def __exit__(batch, type, value, traceback):
+                raise IOError("transfer failed")
+
+        worker = Worker(1, batch=Batch, failed=failed.extend, logger=TestLogger(console=False))
+        worker.submit('a', self.recorder('a'))
+        worker.submit('b', self.recorder('b'))
+        worker.start()
+        worker.stop()
+
+        self.assertEqual(failed, ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+from utils import *
+
+from sensationdriver.clock import Clock
+
+
+class FakeTime(object):
+    """Simulated time for the clock - it only passes while the clock sleeps or a subscriber works"""
+
+    def __init__(self):
+        self.now = 100
+
+    def time(self):
+        return self.now
+
+    @asyncio.coroutine
+    def sleep(self, seconds):
+        self.now += seconds
+        yield from asyncio.sleep(0)
+
+
+class TestClock(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fake_time = FakeTime()
+        self.clock = Clock(100, logger=TestLogger(console=False), time=self.fake_time.time, sleep=self.fake_time.sleep)
+        self.ticks = []
+
+    def tearDown(self):
+        self.clock.stop()
+
+    def subscriber(self, count, work=0, ticks=None):
+        ticks = ticks if ticks is not None else self.ticks
+        @asyncio.coroutine
+        def tick(tick):
+            ticks.append((tick, self.fake_time.now))
+            self.fake_time.now += work
+            return len(ticks) < count
+        return tick
+
+    @asyncio.coroutine
+    def wait_for_clock(self):
+        while self.clock.is_running:
+            yield from asyncio.sleep(0)
+
+    @async_test
+    def test_deadlines_ignore_processing_time(self):
+        self.clock.subscribe(self.subscriber(20, work=0.005))
+        yield from self.wait_for_clock()
+
+        self.assertEqual([tick for tick, time in self.ticks], list(range(20)))
+        duration = self.ticks[-1][1] - self.ticks[0][1]
+        self.assertAlmostEqual(duration, 0.19)
+        self.assertEqual(self.clock.skipped_counter, 0)
+
+    @async_test
+    def test_skips_missed_ticks(self):
+        self.clock.subscribe(self.subscriber(3, work=0.035))
+        yield from self.wait_for_clock()
+
+        self.assertEqual(self.ticks, [(0, 100), (3, 100.035), (6, 100.07)])
+        self.assertEqual(self.clock.skipped_counter, 4)
+        self.assertEqual(self.clock.late_counter, 2)
+
+    @async_test
+    def test_catches_up_missed_ticks(self):
+        self.clock.catch_up = True
+        self.clock.subscribe(self.subscriber(3, work=0.035))
+        yield from self.wait_for_clock()
+
+        self.assertEqual([tick for tick, time in self.ticks], [0, 1, 2])
+        self.assertEqual(self.clock.skipped_counter, 0)
+        self.assertEqual(self.clock.late_counter, 2)
+
+    @async_test
+    def test_drives_all_subscribers(self):
+        other_ticks = []
+        first_ticks = []
+        subscriber = self.subscriber(5)
+        @asyncio.coroutine
+        def subscribing(tick):
+            if tick == 2:
+                first_ticks.append(self.clock.subscribe(self.subscriber(2, ticks=other_ticks)))
+            return (yield from subscriber(tick))
+
+        self.clock.subscribe(subscribing)
+        yield from self.wait_for_clock()
+
+        self.assertEqual(first_ticks, [3])
+        self.assertEqual([tick for tick, time in other_ticks], [3, 4])
+        self.assertEqual([tick for tick, time in self.ticks], [0, 1, 2, 3, 4])
+        self.assertEqual(self.clock.tick_counter, 5)
+
+    @async_test
+    def test_failing_subscriber_is_removed(self):
+        @asyncio.coroutine
+        def failing(tick):
+            raise ValueError("broken")
+
+        self.clock.subscribe(failing)
+        self.clock.subscribe(self.subscriber(3))
+        yield from self.wait_for_clock()
+
+        self.assertEqual(len(self.ticks), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,28 @@
 from utils import *
 
+import time
+
 from sensationdriver.handler import Vibration
+from sensationdriver.handler import Pattern
+from sensationdriver.handler import server_graph
 from sensationdriver import protocol
+from sensationdriver.tracing import Tracer
+from sensationdriver.pipeline import Element
+from sensationdriver.message import VibrationRecord
+from sensationdriver.message import COMPACT_VIBRATIONS
+from sensationdriver.message import Coalescer
 
 class TestVibration(AsyncTestCase):
     class MockDriver:
+        def __init__(self):
+            self.flush_counter = 0
+
         def setPWMFreq(self, frequency):
             pass
 
+        def flush(self):
+            self.flush_counter += 1
+
         def setAllPWM(self, start, stop):
             pass
 
@@ -15,10 +30,15 @@ class TestVibration(AsyncTestCase):
         def __init__(self, index_in_region):
             self.index_in_region = index_in_region
             self.intensity = 0
+            self.intensities = []
 
         @asyncio.coroutine
         def set_intensity(self, intensity, priority=100):
+            self.apply_intensity(intensity, priority)
+
+        def apply_intensity(self, intensity, priority=100):
             self.intensity = intensity
+            self.intensities.append((intensity, priority))
 
     def setUp(self):
         super().setUp()
@@ -51,6 +71,227 @@ class TestVibration(AsyncTestCase):
 
         self.assertAlmostEqual(self.actor_three.intensity, 1)
 
+    @async_test
+    def test_accepts_vibration_records(self):
+        vibration_handler = Vibration(self.actor_config)
+        yield from vibration_handler.set_up()
+
+        region = protocol.Vibration.Region.Value("LEFT_HAND")
+        yield from vibration_handler.process([VibrationRecord(region, 3, 0.5, 100), VibrationRecord(region, 4, 0.25, 100)])
+
+        self.assertAlmostEqual(self.actor_three.intensity, 0.5)
+        self.assertAlmostEqual(self.actor_four.intensity, 0.25)
+
+
+    @async_test
+    def test_traces_dispatched_vibrations(self):
+        tracer = Tracer()
+        self.actor_three.driver = self.driver
+        vibration_handler = Vibration(self.actor_config)
+        vibration_handler.tracer = tracer
+        yield from vibration_handler.set_up()
+
+        vibration = self.vibration_message(3, 1)
+        vibration.client_timestamp = int(time.time() * 1000000)
+        tracer.received()
+        tracer.parsed(vibration)
+        yield from vibration_handler.process([vibration])
+        tracer.written(self.driver)
+
+        self.assertEqual(tracer.histograms['dispatch'].count, 1)
+        self.assertEqual(tracer.histograms['actuate'].count, 1)
+
+    @async_test
+    def test_flushes_drivers_once_per_batch(self):
+        vibration_handler = Vibration(self.actor_config)
+        yield from vibration_handler.set_up()
+
+        yield from vibration_handler.process([self.vibration_message(3, 1), self.vibration_message(4, 1)])
+
+        self.assertEqual(self.driver.flush_counter, 1)
+        self.assertTrue(self.actor_three.deferred)
+
+
+class TestPattern(AsyncTestCase):
+    class MemoryElement(Element):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+
+        @asyncio.coroutine
+        def _process(self, messages):
+            self.messages.extend(messages)
+            return messages
+
+    def setUp(self):
+        super().setUp()
+        self.inlet = self.MemoryElement()
+        self.handler = Pattern(self.inlet)
+        self.handler.samling_frequency = 100
+
+    def load_pattern(self, identifier, duration=0.05, actor_indices=[3]):
+        load = protocol.LoadPattern()
+        load.identifier = identifier
+        for actor_index in actor_indices:
+            track = load.tracks.add()
+            track.target_region = protocol.Vibration.Region.Value("LEFT_HAND")
+            track.actor_index = actor_index
+            start = track.keyframes.add()
+            start.control_point.time = 0
+            start.control_point.value = 0
+            start.out_tangent_end.time = duration / 3
+            start.out_tangent_end.value = 1 / 3
+            end = track.keyframes.add()
+            end.control_point.time = duration
+            end.control_point.value = 1
+            end.in_tangent_start.time = 2 * duration / 3
+            end.in_tangent_start.value = 2 / 3
+        return self.handler.load(load)
+
+    def play_message(self, identifier, priority=80, loop=False):
+        play = protocol.PlayPattern()
+        play.identifier = identifier
+        play.priority = priority
+        play.loop = loop
+        return play
+
+    def stop_message(self, identifier):
+        stop = protocol.StopPattern()
+        stop.identifier = identifier
+        return stop
+
+    def test_load_bakes_sample_tables(self):
+        self.load_pattern('wave', actor_indices=[3, 4])
+
+        tables = self.handler.sample_tables.get('wave')
+        self.assertEqual(len(tables), 2)
+        self.assertAlmostEqual(tables[0].samples[0], 0)
+        self.assertAlmostEqual(tables[0].samples[-1], 1, delta=0.00001)
+
+    @async_test
+    def test_play_emits_records(self):
+        self.load_pattern('wave', actor_indices=[3, 4])
+
+        yield from self.handler.play(self.play_message('wave', priority=90))
+
+        self.assertTrue(self.inlet.messages)
+        for container in self.inlet.messages:
+            self.assertEqual(container.type, COMPACT_VIBRATIONS)
+            self.assertEqual([vibration.actor_index for vibration in container.vibrations], [3, 4])
+            self.assertTrue(all(vibration.priority == 90 for vibration in container.vibrations))
+        self.assertAlmostEqual(self.inlet.messages[0].vibrations[0].intensity, 0)
+        self.assertAlmostEqual(self.inlet.messages[-1].vibrations[0].intensity, 1, delta=0.00001)
+
+    @async_test
+    def test_patterns_are_merged_into_one_batch(self):
+        self.load_pattern('wave', actor_indices=[3])
+        self.load_pattern('other', actor_indices=[4])
+
+        yield from asyncio.gather(self.handler.play(self.play_message('wave')), self.handler.play(self.play_message('other')))
+
+        self.assertEqual(len(self.inlet.messages), self.handler.clock.tick_counter)
+        for container in self.inlet.messages:
+            self.assertEqual([vibration.actor_index for vibration in container.vibrations], [3, 4])
+        self.assertFalse(self.handler.clock.is_running)
+
+    @async_test
+    def test_stop(self):
+        self.load_pattern('wave', duration=1)
+        finished = self.handler.play(self.play_message('wave'))
+        yield from asyncio.sleep(0.05)
+
+        self.assertEqual(self.handler.stop(self.stop_message('wave')), 1)
+        yield from asyncio.sleep(0.02)
+
+        self.assertTrue(finished.cancelled())
+        self.assertEqual(self.inlet.messages[-1].vibrations[0].intensity, 0)
+        self.assertFalse(self.handler.clock.is_running)
+
+    @async_test
+    def test_loop_until_stopped(self):
+        self.load_pattern('wave')
+        sample_count = len(self.handler.sample_tables.get('wave')[0].samples)
+        finished = self.handler.play(self.play_message('wave', loop=True))
+        yield from asyncio.sleep(2.5 * sample_count / 100)
+
+        self.assertFalse(finished.done())
+        self.assertGreater(len(self.inlet.messages), sample_count)
+        intensities = [container.vibrations[0].intensity for container in self.inlet.messages]
+        self.assertTrue(any(intensity < 0.5 for intensity in intensities[sample_count:]))     # started over
+
+        self.assertEqual(self.handler.stop(self.stop_message('wave')), 1)
+        yield from asyncio.sleep(0.02)
+
+        self.assertTrue(finished.cancelled())
+        self.assertEqual(self.inlet.messages[-1].vibrations[0].intensity, 0)
+        self.assertFalse(self.handler.clock.is_running)
+
+    @async_test
+    def test_play_bakes_evicted_pattern(self):
+        self.handler.sample_tables.max_bytes = 0
+        self.handler.logger = TestLogger(console=False)
+        self.load_pattern('wave')
+        self.assertNotIn('wave', self.handler.sample_tables)
+
+        yield from self.handler.play(self.play_message('wave'))
+
+        self.assertAlmostEqual(self.inlet.messages[-1].vibrations[0].intensity, 1, delta=0.00001)
+
+    @async_test
+    def test_plays_directly_on_actors(self):
+        driver = TestVibration.MockDriver()
+        actor = TestVibration.MockActor(3)
+        vibration_handler = Vibration({ "drivers": [driver], "regions": { "LEFT_HAND": [actor] } })
+        yield from vibration_handler.set_up()
+        self.handler.vibration_handler = vibration_handler
+        self.load_pattern('wave', actor_indices=[3, 5])
+        self.handler.logger = TestLogger(console=False)
+
+        yield from self.handler.play(self.play_message('wave', priority=90))
+
+        self.assertEqual(self.inlet.messages, [])
+        self.assertEqual(driver.flush_counter, len(actor.intensities))
+        self.assertAlmostEqual(actor.intensities[0][0], 0)
+        self.assertAlmostEqual(actor.intensities[-1][0], 1, delta=0.00001)
+        self.assertTrue(all(priority == 90 for intensity, priority in actor.intensities))
+
+
+
+class TestServerGraph(AsyncTestCase):
+    @async_test
+    def test_vibration_reaches_actor(self):
+        driver = TestVibration.MockDriver()
+        actor_three = TestVibration.MockActor(3)
+        root = server_graph({ "drivers": [driver], "regions": { "LEFT_HAND": [actor_three] } }, loop=self.loop)
+        coalescer = next(element for element in root if isinstance(element, Coalescer))
+        yield from root.set_up()
+
+        container = protocol.Message()
+        container.type = protocol.Message.VIBRATION
+        container.vibration.target_region = protocol.Vibration.Region.Value("LEFT_HAND")
+        container.vibration.actor_index = 3
+        container.vibration.intensity = 0.75
+        serialized = container.SerializeToString()
+        yield from root.process(len(serialized).to_bytes(4, byteorder='big') + serialized)
+        yield from coalescer.flush()
+        yield from root.tear_down()
+
+        self.assertAlmostEqual(actor_three.intensity, 0.75)
+        self.assertEqual(driver.flush_counter, 1)
+
+    @async_test
+    def test_empty_frame_reaches_no_actor(self):
+        driver = TestVibration.MockDriver()
+        actor_zero = TestVibration.MockActor(0)
+        root = server_graph({ "drivers": [driver], "regions": { "CHEST": [actor_zero] } }, loop=self.loop)
+        coalescer = next(element for element in root if isinstance(element, Coalescer))
+        yield from root.set_up()
+
+        yield from root.process((0).to_bytes(4, byteorder='big'))
+        yield from coalescer.flush()
+        yield from root.tear_down()
+
+        self.assertEqual(actor_zero.intensities, [])
 
 
 if __name__ == '__main__':
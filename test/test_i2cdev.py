@@ -0,0 +1,68 @@
+from utils import *
+
+from adafruit.i2cdev import FakeBus, I2C
+
+
+class TestI2C(unittest.TestCase):
+    def setUp(self):
+        self.bus = FakeBus()
+        self.first = I2C(0x40, bus=self.bus)
+        self.second = I2C(0x41, bus=self.bus)
+
+    def test_write_is_one_transfer(self):
+        self.first.writeList(0x06, [1, 2, 3, 4])
+
+        self.assertEqual(self.bus.transfers, [[(0x40, 0, bytes([0x06, 1, 2, 3, 4]))]])
+        self.assertEqual(list(self.bus.registers[0x40][0x06:0x0A]), [1, 2, 3, 4])
+
+    def test_read_after_write(self):
+        self.first.write16(0x10, 0x1234)
+
+        self.assertEqual(self.first.readU8(0x10), 0x34)
+        self.assertEqual(self.first.readU16(0x10), 0x1234)
+        self.assertEqual(self.first.readList(0x10, 2), [0x34, 0x12])
+
+    def test_batch_combines_devices(self):
+        with self.first.batch():
+            self.first.writeList(0x06, [1, 2])
+            self.second.write8(0x00, 0x21)
+            self.assertEqual(self.bus.transfers, [])
+
+        self.assertEqual(self.bus.transfer_counter, 1)
+        self.assertEqual(self.bus.transfers, [[(0x40, 0, bytes([0x06, 1, 2])), (0x41, 0, bytes([0x00, 0x21]))]])
+
+    def test_nested_batches(self):
+        with self.bus.batch():
+            with self.first.batch():
+                self.first.write8(0x00, 1)
+            self.second.write8(0x00, 2)
+            self.assertEqual(self.bus.transfer_counter, 0)
+
+        self.assertEqual(self.bus.transfer_counter, 1)
+
+    def test_read_flushes_batch(self):
+        with self.first.batch():
+            self.first.write8(0x00, 7)
+            self.assertEqual(self.first.readU8(0x00), 7)
+
+        self.assertEqual(self.bus.transfer_counter, 2)
+
+    def test_large_batches_are_split(self):
+        with self.bus.batch():
+            for i in range(FakeBus.MAX_MESSAGES + 1):
+                self.first.write8(0x00, i)
+
+        self.assertEqual([len(transfer) for transfer in self.bus.transfers], [FakeBus.MAX_MESSAGES, 1])
+
+    def test_device_answering(self):
+        class FailingBus(FakeBus):
+            def _ioctl(self, data):
+                raise OSError(121, "Remote I/O error")
+
+        self.assertTrue(I2C.isDeviceAnswering(0x40, bus=self.bus))
+        self.assertEqual(self.bus.transfers, [[(0x40, 0, b'')]])
+        self.assertFalse(I2C.isDeviceAnswering(0x40, bus=FailingBus()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,12 @@ from utils import *
 
 from sensationdriver import protocol
 from sensationdriver.message import DeprecatedFilter
+from sensationdriver.message import Coalescer
+from sensationdriver.pipeline import Element
+from sensationdriver import message
 from sensationdriver.message import Splitter
+from sensationdriver.message import Parser
+from sensationdriver.message import TypeFilter
 
 
 class TestSplitter(AsyncTestCase):
@@ -36,6 +41,191 @@ class TestSplitter(AsyncTestCase):
         self.assertEqual(second_batch[0], b'message 2')
 
 
+    @async_test
+    def test_splits_length_prefix_across_chunks(self):
+        data = self.pack_message(b'message 1') + self.pack_message(b'message 2')
+
+        splitter = Splitter()
+        first_batch = yield from splitter._process(data[:15])
+        second_batch = yield from splitter._process(data[15:17])
+        third_batch = yield from splitter._process(data[17:])
+
+        self.assertEqual(len(first_batch), 1)
+        self.assertEqual(len(second_batch), 0)
+        self.assertEqual(len(third_batch), 1)
+        self.assertEqual(third_batch[0], b'message 2')
+
+    @async_test
+    def test_grows_buffer_for_large_messages(self):
+        large_message = bytes(i % 256 for i in range(3 * Splitter._INITIAL_CAPACITY))
+        data = self.pack_message(b'message 1') + self.pack_message(large_message) + self.pack_message(b'message 3')
+
+        splitter = Splitter()
+        messages = []
+        for i in range(0, len(data), 1000):
+            batch = yield from splitter._process(data[i:i + 1000])
+            messages.extend(bytes(message) for message in batch)
+
+        self.assertEqual(messages, [b'message 1', large_message, b'message 3'])
+
+    @async_test
+    def test_marks_compact_frames(self):
+        compact = message.pack_compact_vibrations([(4, 1, 0.5, 100)])
+        data = struct.pack('!I', len(compact) | message.COMPACT_FRAME_FLAG) + compact + self.pack_message(b'message 2')
+
+        splitter = Splitter()
+        messages = yield from splitter._process(data)
+
+        self.assertEqual(len(messages), 2)
+        self.assertIsInstance(messages[0], message.CompactFrame)
+        self.assertEqual(messages[0].data, compact)
+        self.assertEqual(messages[1], b'message 2')
+
+    @async_test
+    def test_empty_frames(self):
+        data = self.pack_message(b'') + struct.pack('!I', message.COMPACT_FRAME_FLAG) + self.pack_message(b'message 3')
+
+        splitter = Splitter()
+        first_batch = yield from splitter._process(data[:6])
+        second_batch = yield from splitter._process(data[6:])
+
+        self.assertEqual(first_batch, [b''])
+        self.assertEqual(len(second_batch), 2)
+        self.assertIsInstance(second_batch[0], message.CompactFrame)
+        self.assertEqual(second_batch[0].data, b'')
+        self.assertEqual(second_batch[1], b'message 3')
+
+
+class TestParser(AsyncTestCase):
+    @async_test
+    def test_parses_protocol_messages(self):
+        container = protocol.Message()
+        container.type = protocol.Message.PLAY_PATTERN
+        container.play_pattern.identifier = 'pattern'
+
+        parser = Parser()
+        result = yield from parser._process([container.SerializeToString()])
+
+        self.assertEqual(result, [container])
+
+    @async_test
+    def test_parses_splitter_buffer_slices(self):
+        container = protocol.Message()
+        container.type = protocol.Message.PLAY_PATTERN
+        container.play_pattern.identifier = 'pattern'
+        data = container.SerializeToString()
+
+        parser = Parser()
+        result = yield from parser._process([memoryview(bytearray(data))])
+
+        self.assertEqual(result, [container])
+
+    @async_test
+    def test_drops_messages_without_type(self):
+        parser = Parser()
+        result = yield from parser._process([b''])
+
+        self.assertEqual(result, [])
+
+    @async_test
+    def test_parses_compact_frames(self):
+        compact = message.pack_compact_vibrations([(4, 1, 0.5, 100), (5, 2, 1, 80)])
+
+        parser = Parser()
+        result = yield from parser._process([message.CompactFrame(compact)])
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].type, message.COMPACT_VIBRATIONS)
+        vibrations = result[0].vibrations
+        self.assertEqual([(v.target_region, v.actor_index, v.priority) for v in vibrations], [(4, 1, 100), (5, 2, 80)])
+        self.assertAlmostEqual(vibrations[0].intensity, 0.5, delta=1 / message.COMPACT_INTENSITY_SCALE)
+        self.assertEqual(vibrations[1].intensity, 1)
+
+
+class TestTypeFilter(AsyncTestCase):
+    def vibration_message(self, actor, intensity):
+        message = protocol.Message()
+        message.type = protocol.Message.VIBRATION
+        message.vibration.target_region = protocol.Vibration.Region.Value("LEFT_HAND")
+        message.vibration.actor_index = actor
+        message.vibration.intensity = intensity
+        return message
+
+    def vibration_batch_message(self, actors, intensities, priorities=None):
+        message = protocol.Message()
+        message.type = protocol.Message.VIBRATION_BATCH
+        batch = message.vibration_batch
+        batch.target_regions.extend([protocol.Vibration.Region.Value("LEFT_HAND")] * len(actors))
+        batch.actor_indices.extend(actors)
+        batch.intensities.extend(intensities)
+        if priorities is not None:
+            batch.priorities.extend(priorities)
+        return message
+
+    @async_test
+    def test_filters_by_type(self):
+        load_pattern = protocol.Message()
+        load_pattern.type = protocol.Message.LOAD_PATTERN
+
+        filter = TypeFilter(protocol.Message.LOAD_PATTERN)
+        result = yield from filter._process([self.vibration_message(1, 0.5), load_pattern])
+
+        self.assertEqual(list(result), [load_pattern.load_pattern])
+
+    @async_test
+    def test_unpacks_vibration_batches(self):
+        filter = TypeFilter(protocol.Message.VIBRATION)
+        messages = [self.vibration_message(1, 0.5), self.vibration_batch_message([2, 3], [0.25, 1], [80, 90])]
+
+        result = list((yield from filter._process(messages)))
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0].actor_index, 1)
+        self.assertEqual([v.actor_index for v in result[1:]], [2, 3])
+        self.assertEqual([v.intensity for v in result[1:]], [0.25, 1])
+        self.assertEqual([v.priority for v in result[1:]], [80, 90])
+        self.assertEqual(result[1].target_region, protocol.Vibration.Region.Value("LEFT_HAND"))
+
+    @async_test
+    def test_unpacks_compact_vibrations(self):
+        filter = TypeFilter(protocol.Message.VIBRATION)
+        record = message.VibrationRecord(4, 1, 0.5, 100)
+
+        result = list((yield from filter._process([message.CompactVibrations(message.COMPACT_VIBRATIONS, [record])])))
+
+        self.assertEqual(result, [record])
+
+    @async_test
+    def test_ignores_compact_vibrations_for_other_types(self):
+        filter = TypeFilter(protocol.Message.PLAY_PATTERN)
+        record = message.VibrationRecord(4, 1, 0.5, 100)
+
+        result = list((yield from filter._process([message.CompactVibrations(message.COMPACT_VIBRATIONS, [record])])))
+
+        self.assertEqual(result, [])
+
+    @async_test
+    def test_batch_priorities_default(self):
+        filter = TypeFilter(protocol.Message.VIBRATION)
+
+        result = list((yield from filter._process([self.vibration_batch_message([2, 3], [0.25, 1])])))
+
+        self.assertEqual([v.priority for v in result], [100, 100])
+
+    @async_test
+    def test_drops_malformed_batches(self):
+        logger = TestLogger(console=False, capture=True)
+        filter = TypeFilter(protocol.Message.VIBRATION, logger=logger)
+        messages = [self.vibration_batch_message([2, 3], [0.25, 1], [80]),
+                    self.vibration_batch_message([2, 3], [0.25]),
+                    self.vibration_message(1, 0.5)]
+
+        result = list((yield from filter._process(messages)))
+
+        self.assertEqual([v.actor_index for v in result], [1])
+        self.assertEqual(len(logger.log), 2)
+
+
 class TestDeprecatedFilter(AsyncTestCase):
     def wrapped_vibration_message(self, actor, intensity, priority=100, region="LEFT_HAND"):
         vibration = protocol.Vibration()
@@ -104,3 +294,91 @@ class TestDeprecatedFilter(AsyncTestCase):
 
         self.assertEqual(len(result), 2)
 
+
+class TestCoalescer(AsyncTestCase):
+    class MemoryElement(Element):
+        def __init__(self, downstream=None, logger=None):
+            super().__init__(downstream=downstream, logger=logger)
+            self.batches = []
+
+        @asyncio.coroutine
+        def _process(self, data):
+            self.batches.append(list(data))
+            return data
+
+    def vibration_message(self, actor, intensity, priority=100, region="LEFT_HAND"):
+        return message.VibrationRecord(protocol.Vibration.Region.Value(region), actor, intensity, priority)
+
+    def setUp(self):
+        super().setUp()
+        self.memory = self.MemoryElement()
+
+    @async_test
+    def test_holds_back_until_flush(self):
+        coalescer = Coalescer() >> self.memory
+
+        yield from coalescer.process([self.vibration_message(1, 0.5)])
+        self.assertEqual(self.memory.batches, [])
+
+        yield from coalescer.flush()
+        self.assertEqual(self.memory.batches, [[self.vibration_message(1, 0.5)]])
+
+    @async_test
+    def test_last_writer_wins(self):
+        coalescer = Coalescer() >> self.memory
+
+        yield from coalescer.process([self.vibration_message(1, 0.5), self.vibration_message(2, 0.5)])
+        yield from coalescer.process([self.vibration_message(1, 0.7), self.vibration_message(1, 0.5, priority=80)])
+        yield from coalescer.flush()
+
+        self.assertEqual(len(self.memory.batches), 1)
+        self.assertCountEqual(self.memory.batches[0], [self.vibration_message(1, 0.7), self.vibration_message(2, 0.5), self.vibration_message(1, 0.5, priority=80)])
+        self.assertEqual(coalescer.received_counter, 4)
+        self.assertEqual(coalescer.dropped_counter, 1)
+
+    @async_test
+    def test_empty_flush_is_not_passed_on(self):
+        coalescer = Coalescer() >> self.memory
+
+        yield from coalescer.flush()
+
+        self.assertEqual(self.memory.batches, [])
+
+    @async_test
+    def test_flushes_periodically(self):
+        coalescer = Coalescer(frequency=100) >> self.memory
+        yield from coalescer.set_up()
+
+        yield from coalescer.process([self.vibration_message(1, 0.5)])
+        yield from asyncio.sleep(0.05)
+        yield from coalescer.process([self.vibration_message(1, 0.7)])
+        yield from asyncio.sleep(0.05)
+
+        yield from coalescer.tear_down()
+
+        self.assertEqual(self.memory.batches, [[self.vibration_message(1, 0.5)], [self.vibration_message(1, 0.7)]])
+
+    @async_test
+    def test_keeps_flushing_after_failure(self):
+        class FailingOnceElement(self.MemoryElement):
+            @asyncio.coroutine
+            def _process(self, data):
+                if not self.batches:
+                    self.batches.append(None)
+                    raise IOError("driver failed")
+                return (yield from super()._process(data))
+
+        memory = FailingOnceElement()
+        logger = TestLogger(console=False, capture=True)
+        coalescer = Coalescer(frequency=100, logger=logger) >> memory
+        yield from coalescer.set_up()
+
+        yield from coalescer.process([self.vibration_message(1, 0.5)])
+        yield from asyncio.sleep(0.05)
+        yield from coalescer.process([self.vibration_message(1, 0.7)])
+        yield from asyncio.sleep(0.05)
+
+        yield from coalescer.tear_down()
+
+        self.assertEqual(memory.batches, [None, [self.vibration_message(1, 0.7)]])
+        self.assertIn("driver failed", logger.log[0])
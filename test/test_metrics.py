@@ -0,0 +1,82 @@
+from utils import *
+
+from sensationdriver.metrics import Histogram
+from sensationdriver.metrics import Metrics
+from sensationdriver.metrics import format_snapshot
+
+
+class TestHistogram(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+
+        self.assertEqual(histogram.count, 0)
+        self.assertIsNone(histogram.mean)
+        self.assertIsNone(histogram.percentile(50))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram(precision_bits=5)
+        for microseconds in range(1, 11):
+            histogram.record(microseconds / 1000000)
+
+        self.assertAlmostEqual(histogram.percentile(50), 6 / 1000000)
+        self.assertAlmostEqual(histogram.percentile(100), 10 / 1000000)
+        self.assertAlmostEqual(histogram.mean, 5.5 / 1000000)
+
+    def test_relative_error_is_bounded(self):
+        histogram = Histogram(precision_bits=5)
+        values = [0.001 * 1.1 ** i for i in range(100)]
+        for value in values:
+            histogram.record(value)
+
+        for percent in [10, 50, 90, 99]:
+            exact = values[int(len(values) * percent / 100 + 0.5) - 1]
+            self.assertGreaterEqual(histogram.percentile(percent), exact)
+            self.assertLessEqual(histogram.percentile(percent), exact * (1 + 1 / 16))
+
+    def test_size_is_fixed(self):
+        histogram = Histogram(max_seconds=1)
+        size = len(histogram._counts)
+        histogram.record(5)
+        histogram.record(0.5)
+
+        self.assertEqual(len(histogram._counts), size)
+        self.assertEqual(histogram.percentile(100), 5)
+        self.assertEqual(histogram.max, 5)
+
+    def test_reset(self):
+        histogram = Histogram()
+        histogram.record(0.1)
+        histogram.reset()
+
+        self.assertEqual(histogram.count, 0)
+        self.assertEqual(sum(histogram._counts), 0)
+        self.assertIsNone(histogram.max)
+
+    def test_snapshot(self):
+        histogram = Histogram()
+        histogram.record(0.002)
+
+        snapshot = histogram.snapshot()
+
+        self.assertEqual(snapshot['count'], 1)
+        self.assertEqual(set(snapshot.keys()), {'count', 'min', 'max', 'mean', 'p50', 'p90', 'p99', 'p99.9'})
+        self.assertAlmostEqual(snapshot['p50'], 0.002, delta=0.002 / 16)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_record(self):
+        metrics = Metrics()
+        metrics.record(3, 2, 0.001)
+        metrics.record(1, 0, 0.002)
+
+        snapshot = metrics.snapshot()
+
+        self.assertEqual(snapshot['in'], 4)
+        self.assertEqual(snapshot['out'], 2)
+        self.assertEqual(snapshot['process_time']['count'], 2)
+        self.assertEqual(snapshot['queue_wait']['count'], 0)
+        self.assertIn("in 4, out 2", format_snapshot("Parser", snapshot))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,14 @@ from utils import *
 
 from sensationdriver.pattern import BezierPath
 from sensationdriver.pattern import Track
+from sensationdriver.pattern import SampleTable
+from sensationdriver.pattern import SampleTableCache
+from sensationdriver.pattern import Sequencer
+from sensationdriver.pattern import BezierSegments
+from sensationdriver.pattern import sample_bezier_paths
+from sensationdriver.pattern import solve_bezier_parameter
+from sensationdriver import pattern
+from sensationdriver.clock import Clock
 
 
 class Point(object):
@@ -244,5 +252,272 @@ class TestTrack(unittest.TestCase):
         self.assertAlmostEqual(value, 0.326737, delta=0.000001)
 
 
+class TestSampleTable(unittest.TestCase):
+    def setUp(self):
+        p0 = Point(0, 0.3)
+        c1 = Point(0.1325325, 0.3)
+        c2 = Point(0.2650649, 1.161977)
+        p3 = Point(0.3975974, 1.333954)
+        c4 = Point(0.8650649, 1.940549)
+        c5 = Point(1.332533, -0.5553294)
+        p6 = Point(1.8, 2)
+
+        self.keyframes = [Keyframe(p0, out_tangent_end=c1),
+                          Keyframe(p3, in_tangent_start=c2, out_tangent_end=c4),
+                          Keyframe(p6, in_tangent_start=c5)]
+
+    def test_matches_track(self):
+        table = SampleTable.from_keyframes(target_region='region', actor_index='actor_index', keyframes=self.keyframes, sampling_frequency=2.5, time_correct=False)
+        track = Track(target_region='region', actor_index='actor_index', keyframes=self.keyframes, priority=4)
+
+        expected_values = [track.value]
+        while not track.is_finished:
+            expected_values.append(track.advance(0.4))
+
+        self.assertEqual(len(table.samples), len(expected_values))
+        for sample, expected_value in zip(table.samples, expected_values):
+            self.assertAlmostEqual(sample, expected_value, delta=0.000001)
+
+    def test_ends_with_last_value(self):
+        table = SampleTable.from_keyframes(target_region='region', actor_index='actor_index', keyframes=self.keyframes, sampling_frequency=10)
+
+        self.assertAlmostEqual(table.samples[0], 0)
+        self.assertAlmostEqual(table.samples[-1], 1, delta=0.00001)
+        self.assertEqual(table.nbytes, len(table.samples) * 4)
+
+
+class TestSampleBezierPaths(unittest.TestCase):
+    def setUp(self):
+        self.paths = [
+            [Keyframe(Point(0, 0.3), out_tangent_end=Point(0.1325325, 0.3)),
+             Keyframe(Point(0.3975974, 1.333954), in_tangent_start=Point(0.2650649, 1.161977), out_tangent_end=Point(0.8650649, 1.940549)),
+             Keyframe(Point(1.8, 2), in_tangent_start=Point(1.332533, -0.5553294))],
+            [Keyframe(Point(0, 0), out_tangent_end=Point(0.6, 0)),
+             Keyframe(Point(1.8, 2), in_tangent_start=Point(1.2, -1.279795))],
+            [Keyframe(Point(0, 1), out_tangent_end=Point(0.1, 1)),
+             Keyframe(Point(0.5, 0), in_tangent_start=Point(0.4, 0))],
+            [Keyframe(Point(0, 0), out_tangent_end=Point(0.05, 0.8)),
+             Keyframe(Point(1, 1), in_tangent_start=Point(0.3, 0.2))]]
+
+    def expected_samples(self, keyframes, sampling_frequency):
+        # samples are taken at k * interval, not at accumulated intervals
+        interval = 1 / sampling_frequency
+        values = []
+        k = 0
+        while True:
+            track = Track(target_region='region', actor_index='actor_index', keyframes=keyframes, priority=4)
+            values.append(track.advance(k * interval))
+            if track.is_finished:
+                return values
+            k += 1
+
+    def assertSamples(self, use_numpy):
+        for sampling_frequency in [2.5, 10, 60]:
+            samples = sample_bezier_paths([BezierSegments(keyframes) for keyframes in self.paths], sampling_frequency, use_numpy=use_numpy, time_correct=False)
+
+            self.assertEqual(len(samples), len(self.paths))
+            for keyframes, path_samples in zip(self.paths, samples):
+                expected_values = self.expected_samples(keyframes, sampling_frequency)
+                self.assertEqual(len(path_samples), len(expected_values))
+                for sample, expected_value in zip(path_samples, expected_values):
+                    self.assertAlmostEqual(sample, expected_value, delta=0.000001)
+
+    def test_pure_python(self):
+        self.assertSamples(use_numpy=False)
+
+    @unittest.skipIf(pattern.numpy is None, "NumPy not installed")
+    def test_numpy(self):
+        self.assertSamples(use_numpy=True)
+
+    def expected_time_correct_samples(self, keyframes, sampling_frequency):
+        path = BezierPath(keyframes)
+        interval = 1 / sampling_frequency
+        values = []
+        k = 0
+        while k * interval <= keyframes[-1].control_point.time:
+            time = k * interval
+            end = 1
+            while time > keyframes[end].control_point.time:
+                end += 1
+            start, end = keyframes[end - 1], keyframes[end]
+            t = solve_bezier_parameter(time, start.control_point.time, start.out_tangent_end.time, end.in_tangent_start.time, end.control_point.time)
+            value = BezierPath.calculate_bezier_value(t, start.control_point, start.out_tangent_end, end.in_tangent_start, end.control_point)
+            values.append((value - path.min_value) / (path.max_value - path.min_value))
+            k += 1
+        values.append((keyframes[-1].control_point.value - path.min_value) / (path.max_value - path.min_value))
+        return values
+
+    def assertTimeCorrectSamples(self, use_numpy):
+        for sampling_frequency in [2.5, 10, 60]:
+            samples = sample_bezier_paths([BezierSegments(keyframes) for keyframes in self.paths], sampling_frequency, use_numpy=use_numpy)
+
+            for keyframes, path_samples in zip(self.paths, samples):
+                expected_values = self.expected_time_correct_samples(keyframes, sampling_frequency)
+                self.assertEqual(len(path_samples), len(expected_values))
+                for sample, expected_value in zip(path_samples, expected_values):
+                    self.assertAlmostEqual(sample, expected_value, delta=0.0001)
+
+    def test_time_correct_pure_python(self):
+        self.assertTimeCorrectSamples(use_numpy=False)
+
+    @unittest.skipIf(pattern.numpy is None, "NumPy not installed")
+    def test_time_correct_numpy(self):
+        self.assertTimeCorrectSamples(use_numpy=True)
+
+    def test_time_correct_equals_linear_for_evenly_spaced_handles(self):
+        keyframes = [Keyframe(Point(0, 0), out_tangent_end=Point(0.6, 0)),
+                     Keyframe(Point(1.8, 2), in_tangent_start=Point(1.2, -1.279795))]
+
+        linear = sample_bezier_paths([BezierSegments(keyframes)], 10, use_numpy=False, time_correct=False)[0]
+        time_correct = sample_bezier_paths([BezierSegments(keyframes)], 10, use_numpy=False)[0]
+
+        for expected_value, value in zip(linear, time_correct):
+            self.assertAlmostEqual(value, expected_value, delta=0.000001)
+
+    def test_solve_bezier_parameter(self):
+        for x0, x1, x2, x3 in [(0, 0.1325325, 0.2650649, 0.3975974), (0, 0.5, 0.5, 1), (0, 0, 1, 1), (0, 0.9, 0.1, 1)]:
+            for i in range(11):
+                x = x0 + (x3 - x0) * i / 10
+                t = solve_bezier_parameter(x, x0, x1, x2, x3)
+                self.assertGreaterEqual(t, 0)
+                self.assertLessEqual(t, 1)
+                self.assertAlmostEqual(BezierPath.calculate_bezier_value(t, Point(0, x0), Point(0, x1), Point(0, x2), Point(0, x3)), x, delta=0.000001)
+
+    def test_solve_bezier_parameter_steep_control_points(self):
+        for x0, x1, x2, x3 in [(0, 1, 1, 1), (0, 0, 0, 1), (1, 0, 0, 0), (0, 0.99, 0.01, 1)]:
+            for iterations in [0, 1, 2, 8]:
+                for i in range(11):
+                    x = x0 + (x3 - x0) * i / 10
+                    t = solve_bezier_parameter(x, x0, x1, x2, x3, iterations=iterations)
+                    self.assertGreaterEqual(t, 0)
+                    self.assertLessEqual(t, 1)
+                    self.assertAlmostEqual(BezierPath.calculate_bezier_value(t, Point(0, x0), Point(0, x1), Point(0, x2), Point(0, x3)), x, delta=0.000001)
+
+    def test_no_paths(self):
+        self.assertEqual(sample_bezier_paths([], 10), [])
+
+    def test_invalid_paths(self):
+        with self.assertRaises(ValueError):
+            BezierSegments(self.paths[0][:1])
+        with self.assertRaises(ValueError):
+            BezierSegments([Keyframe(Point(0, 1), out_tangent_end=Point(0.1, 1)), Keyframe(Point(1, 1), in_tangent_start=Point(0.9, 1))])
+
+
+class TestSampleTableCache(unittest.TestCase):
+    class Table(object):
+        def __init__(self, nbytes):
+            self.nbytes = nbytes
+
+    def setUp(self):
+        self.cache = SampleTableCache(max_bytes=100)
+
+    def test_get(self):
+        tables = [self.Table(10)]
+        self.assertTrue(self.cache.put('a', tables))
+
+        self.assertIs(self.cache.get('a'), tables)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.hit_counter, 1)
+        self.assertEqual(self.cache.miss_counter, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', [self.Table(40)])
+        self.cache.put('b', [self.Table(40)])
+        self.cache.get('a')
+        self.cache.put('c', [self.Table(40)])
+
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+        self.assertEqual(self.cache.nbytes, 80)
+        self.assertEqual(self.cache.eviction_counter, 1)
+
+    def test_replaces_entry(self):
+        self.cache.put('a', [self.Table(40)])
+        self.cache.put('a', [self.Table(30), self.Table(30)])
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.nbytes, 60)
+
+    def test_rejects_oversized_entry(self):
+        self.cache.put('a', [self.Table(40)])
+
+        self.assertFalse(self.cache.put('b', [self.Table(101)]))
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+
+
+class TestSequencer(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = Clock(100)
+        self.batches = []
+        self.sequencer = Sequencer(self.clock, self.emit)
+
+    def tearDown(self):
+        self.clock.stop()
+
+    @asyncio.coroutine
+    def emit(self, batch):
+        self.batches.append(batch)
+
+    @async_test
+    def test_merges_patterns_into_one_batch_per_tick(self):
+        first = self.sequencer.play('first', [('a', [0.1, 0.2, 0.3]), ('b', [0.5])], 80)
+        second = self.sequencer.play('second', [('c', [0.7, 0.8])], 90)
+
+        yield from asyncio.gather(first.finished, second.finished)
+
+        self.assertEqual(self.batches, [[('a', 0.1, 80), ('b', 0.5, 80), ('c', 0.7, 90)],
+                                        [('a', 0.2, 80), ('c', 0.8, 90)],
+                                        [('a', 0.3, 80)]])
+        self.assertEqual(len(self.sequencer), 0)
+        self.assertFalse(self.clock.is_running)
+
+    @async_test
+    def test_stop(self):
+        first = self.sequencer.play('first', [('a', [0.1] * 100)], 80)
+        second = self.sequencer.play('second', [('b', [0.2] * 10)], 90)
+        yield from asyncio.sleep(0.015)
+
+        self.assertEqual(self.sequencer.stop('first'), 1)
+        self.assertFalse(self.sequencer.is_playing('first'))
+        self.assertTrue(self.sequencer.is_playing('second'))
+        self.assertEqual(self.sequencer.stop('first'), 0)
+        yield from second.finished
+
+        self.assertTrue(first.finished.cancelled())
+        released = [batch for batch in self.batches if ('a', 0.0, 80) in batch]
+        self.assertEqual(len(released), 1)
+        self.assertTrue(all(target != 'a' for target, intensity, priority in self.batches[-1]))
+
+    @async_test
+    def test_loop_rewinds_cursors(self):
+        playback = self.sequencer.play('ambient', [('a', [0.1, 0.2, 0.3]), ('b', [0.5])], 80, loop=True)
+
+        for tick in range(7):
+            yield from self.sequencer._tick(tick)
+
+        self.assertEqual([[intensity for target, intensity, priority in batch] for batch in self.batches],
+                         [[0.1, 0.5], [0.2, 0.5], [0.3, 0.5], [0.1, 0.5], [0.2, 0.5], [0.3, 0.5], [0.1, 0.5]])
+        self.assertEqual(len(self.sequencer), 2)
+        self.assertEqual(self.sequencer._first_ticks, [6, 6])
+        self.assertFalse(playback.finished.done())
+
+        yield from self.sequencer._tick(20)       # skipped ticks
+
+        self.assertEqual(self.batches[-1], [('a', 0.3, 80), ('b', 0.5, 80)])
+
+        self.assertEqual(self.sequencer.stop('ambient'), 2)
+        self.assertTrue(playback.finished.cancelled())
+
+    @async_test
+    def test_empty_pattern_finishes_immediately(self):
+        playback = self.sequencer.play('empty', [], 80)
+
+        self.assertTrue(playback.finished.done())
+        self.assertFalse(self.clock.is_running)
+
+
 if __name__ == '__main__':
     unittest.main()
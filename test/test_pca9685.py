@@ -0,0 +1,217 @@
+from utils import *
+
+import contextlib
+
+from adafruit.pca9685 import Driver
+from adafruit import i2cdev
+from adafruit.i2cdev import FakeBus
+
+
+LED0_ON_L = 0x06
+LED0_OFF_L = 0x08
+
+
+class RecordingI2C(object):
+    """Records the writes of a driver. The next `failures` writeList calls fail like wirebus.I2C's"""
+
+    def __init__(self):
+        self.writes = []            # (register, [bytes])
+        self.batches = 0
+        self.failures = 0
+
+    def batch(self):
+        i2c = self
+
+        class Batch(object):
+            def __enter__(batch):
+                i2c.batches += 1
+            def __exit__(batch, type, value, traceback):
+                return False
+
+        return Batch()
+
+    def write8(self, reg, value):
+        pass
+
+    def writeList(self, reg, list):
+        if self.failures:
+            self.failures -= 1
+            return -1
+        self.writes.append((reg, list))
+
+
+def pwm_bytes(on, off):
+    on, off = int(on * 4095), int(off * 4095)
+    return [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+
+
+class TestRegisterCache(unittest.TestCase):
+    def setUp(self):
+        self.i2c = RecordingI2C()
+        self.driver = Driver(i2c=self.i2c)
+        self.i2c.writes = []        # the reset
+
+    def test_write_skipped_on_hit(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*3, pwm_bytes(0, 0.5))])
+
+    def test_only_off_written_if_on_unchanged(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.setPWM(3, 0, 0.25)
+
+        self.assertEqual(self.i2c.writes[1], (LED0_OFF_L + 4*3, pwm_bytes(0, 0.25)[2:]))
+
+    def test_set_all_invalidates(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.setAllPWM(0, 0.5)
+        self.i2c.writes = []
+
+        self.driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*3, pwm_bytes(0, 0.5))])
+
+    def test_counters(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.queuePWM(3, 0, 0.5)
+        self.driver.queuePWM(4, 0, 0.5)
+        self.driver.flush()
+
+        self.assertEqual(self.driver.cache_hits, 2)
+        self.assertEqual(self.driver.cache_misses, 2)
+
+    def test_failed_write_retried(self):
+        self.i2c.failures = 1
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*3, pwm_bytes(0, 0.5))])
+
+    def test_failed_off_write_retried(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.i2c.failures = 1
+        self.driver.setPWM(3, 0, 0.25)
+        self.driver.setPWM(3, 0, 0.25)
+
+        self.assertEqual(self.i2c.writes[1:], [(LED0_ON_L + 4*3, pwm_bytes(0, 0.25))])
+
+    def test_failed_burst_retried(self):
+        self.i2c.failures = 1
+        self.driver.queuePWM(3, 0, 0.5)
+        self.driver.queuePWM(4, 0, 0.5)
+        self.driver.flush()
+        self.driver.queuePWM(3, 0, 0.5)
+        self.driver.queuePWM(4, 0, 0.5)
+        self.driver.flush()
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*3, pwm_bytes(0, 0.5) * 2)])
+
+    def test_failed_batch_invalidates(self):
+        @contextlib.contextmanager
+        def failing_batch():
+            yield
+            raise IOError("transfer failed")        # like i2cdev sending the batched writes at its end
+        self.i2c.batch = failing_batch
+        self.driver.queuePWM(3, 0, 0.5)
+        self.assertEqual(self.driver.writePending(), -1)
+        del self.i2c.batch
+
+        self.driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*3, pwm_bytes(0, 0.5))] * 2)
+
+    def test_failed_rdwr_transfer_like_failed_smbus_write(self):
+        class FailingBus(FakeBus):
+            failures = 0
+            def _ioctl(self, data):
+                if self.failures:
+                    self.failures -= 1
+                    raise OSError(121, "Remote I/O error")
+                super()._ioctl(data)
+
+        bus = FailingBus()
+        driver = Driver(backend='rdwr', i2c=i2cdev.I2C(0x40, bus=bus), logger=TestLogger(console=False))
+        bus.failures = 1
+        driver.queuePWM(3, 0, 0.5)
+        self.assertEqual(driver.writePending(), -1)
+
+        driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(list(bus.registers[0x40][LED0_ON_L + 4*3:LED0_ON_L + 4*4]), pwm_bytes(0, 0.5))
+
+    def test_invalidate_cache(self):
+        self.driver.setPWM(3, 0, 0.5)
+        self.driver.invalidateCache()
+        self.driver.setPWM(3, 0, 0.5)
+
+        self.assertEqual(len(self.i2c.writes), 2)
+
+
+class TestBurstWrites(unittest.TestCase):
+    def driver(self, backend='smbus'):
+        self.i2c = RecordingI2C()
+        driver = Driver(backend=backend, i2c=self.i2c)
+        self.i2c.writes = []        # the reset
+        return driver
+
+    def queue(self, driver, channels, off=0.5):
+        for channel in channels:
+            driver.queuePWM(channel, 0, off)
+        driver.flush()
+
+    def test_adjacent_channels_in_one_write(self):
+        driver = self.driver()
+        self.queue(driver, [2, 3, 4])
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*2, pwm_bytes(0, 0.5) * 3)])
+        self.assertEqual(self.i2c.batches, 1)
+
+    def test_smbus_bursts_split_at_8_channels(self):
+        driver = self.driver('smbus')
+        self.queue(driver, range(16))
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L, pwm_bytes(0, 0.5) * 8), (LED0_ON_L + 4*8, pwm_bytes(0, 0.5) * 8)])
+
+    def test_rdwr_bursts_split_at_16_channels(self):
+        driver = self.driver('rdwr')
+        self.queue(driver, range(16))
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L, pwm_bytes(0, 0.5) * 16)])
+
+    def test_gaps_split_bursts(self):
+        driver = self.driver()
+        self.queue(driver, [1, 2, 5, 7])
+
+        self.assertEqual([(register, len(data)) for register, data in self.i2c.writes], [(LED0_ON_L + 4*1, 8), (LED0_ON_L + 4*5, 4), (LED0_ON_L + 4*7, 4)])
+
+    def test_unchanged_channels_split_bursts(self):
+        driver = self.driver()
+        self.queue(driver, [3])
+        self.i2c.writes = []
+
+        self.queue(driver, [2, 3, 4])
+
+        self.assertEqual([register for register, data in self.i2c.writes], [LED0_ON_L + 4*2, LED0_ON_L + 4*4])
+
+    def test_set_clears_queued_channel(self):
+        driver = self.driver()
+        driver.queuePWM(3, 0, 0.25)
+        driver.queuePWM(4, 0, 0.25)
+        driver.setPWM(3, 0, 0.5)
+        self.i2c.writes = []
+
+        driver.flush()
+
+        self.assertEqual(self.i2c.writes, [(LED0_ON_L + 4*4, pwm_bytes(0, 0.25))])
+
+    def test_flush_without_changes(self):
+        driver = self.driver()
+        self.queue(driver, [])
+
+        self.assertEqual(self.i2c.writes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
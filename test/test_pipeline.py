@@ -5,7 +5,10 @@ from utils import *
 from sensationdriver.pipeline import Element
 from sensationdriver.pipeline import Dispatcher
 from sensationdriver.pipeline import Parallelizer
+from sensationdriver.pipeline import Queue
 from sensationdriver.pipeline import TerminateProcessing
+from sensationdriver import pipeline
+from sensationdriver.metrics import Metrics
 
 class IncrementElement(Element):
     def __init__(self, downstream=None, logger=None):
@@ -28,6 +31,18 @@ class IncrementElement(Element):
         return number + 1
 
 
+class SynchronousIncrementElement(Element):
+    def __init__(self, downstream=None, logger=None):
+        super().__init__(downstream=downstream, logger=logger)
+        self.process_called_counter = 0
+        self.processed_number = None
+
+    def _process_single_sync(self, number):
+        self.process_called_counter += 1
+        self.processed_number = number
+        return number + 1
+
+
 class TestElement(AsyncTestCase):
     def test_chaining(self):
         first = Element()
@@ -253,6 +268,186 @@ class TestElement(AsyncTestCase):
         self.assertEqual(third.process_called_counter, 0)
 
 
+class TestSynchronousElement(AsyncTestCase):
+    def test_synchronous(self):
+        @asyncio.coroutine
+        def coroutine_target(data):
+            return data
+
+        self.assertTrue(Element().synchronous)
+        self.assertTrue(SynchronousIncrementElement().synchronous)
+        self.assertFalse(IncrementElement().synchronous)
+        self.assertTrue(Dispatcher(len).synchronous)
+        self.assertFalse(Dispatcher(coroutine_target).synchronous)
+
+    def test_process_sync(self):
+        element = SynchronousIncrementElement()
+        last = SynchronousIncrementElement()
+
+        self.assertEqual(list((element >> last).process_sync([1, 2])), [2, 3])
+        self.assertEqual(last.process_called_counter, 0)
+
+    @async_test
+    def test_mixed_chain(self):
+        first = SynchronousIncrementElement()
+        second = IncrementElement()
+        third = SynchronousIncrementElement()
+
+        yield from (first >> second >> third).process([1])
+
+        self.assertEqual(third.processed_number, 3)
+
+    @async_test
+    def test_coroutine_process_of_synchronous_element(self):
+        element = SynchronousIncrementElement()
+
+        result = yield from element._process([1, 2])
+
+        self.assertEqual(result, [2, 3])
+
+    @async_test
+    def test_coroutine_override_of_synchronous_element(self):
+        class AwaitingElement(SynchronousIncrementElement):
+            @asyncio.coroutine
+            def _process(self, data):
+                yield from asyncio.sleep(0)
+                return (yield from super()._process(data))
+
+        last = SynchronousIncrementElement()
+        chain = AwaitingElement() >> last
+
+        self.assertFalse(chain.synchronous)
+        yield from chain.process([1])
+
+        self.assertEqual(last.processed_number, 2)
+
+
+class TestMetrics(AsyncTestCase):
+    @async_test
+    def test_records_items_and_time(self):
+        class FilterElement(Element):
+            def _process_sync(self, data):
+                return filter(lambda number: number > 1, data)
+
+        first = IncrementElement()
+        second = FilterElement()
+        chain = pipeline.enable_metrics(first >> second >> Element())
+
+        yield from chain.process(iter([0, 1, 2]))
+
+        snapshots = pipeline.metrics_snapshot(chain)
+        self.assertEqual([element for element, snapshot in snapshots], list(chain))
+        self.assertEqual([(snapshot['in'], snapshot['out']) for element, snapshot in snapshots], [(3, 3), (3, 2), (2, 2)])
+        self.assertEqual(snapshots[0][1]['process_time']['count'], 1)
+
+    @async_test
+    def test_terminate_processing(self):
+        class TerminalElement(Element):
+            def _process_sync(self, data):
+                raise TerminateProcessing
+
+        element = TerminalElement()
+        element.metrics = Metrics()
+
+        yield from element.process([1, 2])
+
+        self.assertEqual((element.metrics.in_counter, element.metrics.out_counter), (2, 0))
+
+    @async_test
+    def test_compiled(self):
+        first = SynchronousIncrementElement()
+        second = IncrementElement()
+        chain = pipeline.compile(pipeline.enable_metrics(first >> second))
+
+        yield from chain.process([1, 2])
+
+        self.assertEqual(first.metrics.out_counter, 2)
+        self.assertEqual(second.metrics.out_counter, 2)
+
+    @async_test
+    def test_queue_wait(self):
+        queue = Queue()
+        queue >> Element()
+        queue.metrics = Metrics()
+        yield from queue.process([1])
+        yield from asyncio.sleep(0.01)
+
+        yield from queue.set_up()
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(queue.metrics.queue_wait.count, 1)
+        self.assertGreater(queue.metrics.queue_wait.max, 0.005)
+
+        yield from queue.tear_down()
+
+
+class TestCompile(AsyncTestCase):
+    @async_test
+    def test_mixed_chain(self):
+        first = SynchronousIncrementElement()
+        second = Element()
+        third = IncrementElement()
+        a = SynchronousIncrementElement()
+        b1 = IncrementElement()
+        b2 = SynchronousIncrementElement()
+
+        chain = pipeline.compile(first >> second >> third >> [a, b1 >> b2])
+        yield from chain.process([1, 2])
+
+        for element in [first, third, a, b1, b2]:
+            self.assertEqual(element.process_called_counter, 2)
+        self.assertEqual(a.processed_number, 4)
+        self.assertEqual(b2.processed_number, 5)
+
+    @async_test
+    def test_terminate_processing(self):
+        class TerminalElement(SynchronousIncrementElement):
+            def _process_sync(self, number):
+                raise TerminateProcessing
+
+        first = SynchronousIncrementElement()
+        third = SynchronousIncrementElement()
+
+        chain = pipeline.compile(first >> TerminalElement() >> third)
+        yield from chain.process([1])
+
+        self.assertEqual(first.process_called_counter, 1)
+        self.assertEqual(third.process_called_counter, 0)
+
+    @async_test
+    def test_process_must_not_return_none(self):
+        class NoneElement(Element):
+            def _process_single_sync(self, number):
+                return None
+
+        chain = pipeline.compile(Element() >> NoneElement() >> Element())
+
+        with self.assertRaises(AssertionError):
+            yield from chain.process([1])
+
+    @async_test
+    def test_elements_calling_successors_use_compiled_process(self):
+        last = SynchronousIncrementElement()
+        parallelizer = Parallelizer()
+        chain = pipeline.compile(Element() >> parallelizer >> last)
+
+        yield from chain.process([[1]])
+        yield from asyncio.wait(parallelizer._workers, loop=self.loop, timeout=2)
+
+        self.assertEqual(last.processed_number, 1)
+
+    @async_test
+    def test_dispatcher(self):
+        two_times = TestDispatcher.TwoTimes()
+        last = SynchronousIncrementElement()
+        chain = pipeline.compile(SynchronousIncrementElement() >> Dispatcher(two_times.calc) >> last)
+
+        yield from chain.process([2])
+
+        self.assertEqual(two_times.input_number, 3)
+        self.assertEqual(last.processed_number, 6)
+
+
 class TestDispatcher(AsyncTestCase):
     class TwoTimes:
         def __init__(self):
@@ -340,6 +535,92 @@ class TestParallelizer(AsyncTestCase):
         self.assertLess(duration, 0.1)
         self.assertFalse(recorder.execution_times)
 
+    @async_test
+    def test_worker_pool(self):
+        recorder = self.WaitingRecorder(0.1)
+
+        parallelizer = Parallelizer(workers=2)
+        chain = parallelizer >> recorder
+        yield from chain.set_up()
+
+        start = time.time()
+        yield from chain.process([[1], [2], [3], [4]])
+
+        self.assertEqual(len(parallelizer._pool), 2)
+        self.assertFalse(parallelizer._workers)
+
+        yield from parallelizer._queue.join()
+        duration = time.time() - start
+
+        self.assertEqual(len(recorder.execution_times), 4)
+        self.assertAlmostEqual(duration, 0.2, delta=0.05)
+
+        yield from chain.tear_down()
+        self.assertFalse(parallelizer._pool)
+
+    @async_test
+    def test_worker_pool_applies_backpressure(self):
+        recorder = self.WaitingRecorder(0.05)
+
+        parallelizer = Parallelizer(workers=1, capacity=1)
+        chain = parallelizer >> recorder
+
+        start = time.time()
+        yield from chain.process([[1], [2], [3]])
+        duration = time.time() - start
+
+        self.assertGreater(duration, 0.04)     # [3] only fits once [1] is done
+        yield from chain.tear_down()
+
+    @async_test
+    def test_worker_pool_drains_on_tear_down(self):
+        recorder = self.WaitingRecorder(0.01)
+
+        parallelizer = Parallelizer(workers=1, drain=True)
+        chain = parallelizer >> recorder
+        yield from chain.set_up()
+
+        yield from chain.process([[1], [2], [3]])
+        yield from chain.tear_down()
+
+        self.assertEqual(len(recorder.execution_times), 3)
+
+    @async_test
+    def test_worker_pool_cancels_on_tear_down(self):
+        recorder = self.WaitingRecorder(5)
+
+        parallelizer = Parallelizer(workers=1)
+        chain = parallelizer >> recorder
+        yield from chain.set_up()
+
+        yield from chain.process([[1], [2]])
+        start = time.time()
+        yield from chain.tear_down()
+        duration = time.time() - start
+
+        self.assertLess(duration, 0.1)
+        self.assertFalse(recorder.execution_times)
+        self.assertTrue(parallelizer._queue.empty())
+
+    @async_test
+    def test_worker_pool_exceptions_are_logged(self):
+        class ExceptionElement(Element):
+            def _process_sync(self, data):
+                if data == [1]:
+                    raise ValueError()
+                return data
+
+        logger = TestLogger(console=False, capture=True)
+        recorder = self.WaitingRecorder(0)
+        parallelizer = Parallelizer(workers=1, drain=True, logger=logger)
+        chain = parallelizer >> ExceptionElement() >> recorder
+
+        yield from chain.process([[1], [2]])
+        yield from chain.tear_down()
+
+        self.assertTrue(any("ValueError" in line for line in logger.log))
+        self.assertEqual(len(recorder.execution_times), 1)
+
     @async_test
     def test_exceptions_are_logged(self):
         class TestException(Exception):
@@ -361,5 +642,131 @@ class TestParallelizer(AsyncTestCase):
         self.assertTrue(any("raise TestException()" in line for line in logger.log))
 
 
+class TestQueue(AsyncTestCase):
+    class MemoryElement(Element):
+        def __init__(self, downstream=None, logger=None):
+            super().__init__(downstream=downstream, logger=logger)
+            self.batches = []
+
+        def _process_sync(self, data):
+            self.batches.append(list(data))
+            return data
+
+    def setUp(self):
+        super().setUp()
+        self.memory = self.MemoryElement()
+
+    def queue(self, **kwargs):
+        queue = Queue(**kwargs)
+        queue >> self.memory
+        return queue
+
+    @async_test
+    def test_passes_items_on_in_batches(self):
+        queue = self.queue()
+        yield from queue.set_up()
+
+        yield from queue.process([1, 2])
+        yield from queue.process([3])
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[1, 2, 3]])
+        self.assertEqual(queue.depth, 0)
+        self.assertEqual(queue.max_depth, 3)
+        self.assertEqual(queue.received_counter, 3)
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_block(self):
+        queue = self.queue(capacity=2)
+
+        producer = self.run_async(queue.process([1, 2, 3]))
+        yield from asyncio.sleep(0.01)
+
+        self.assertFalse(producer.done())
+        self.assertEqual(queue.depth, 2)
+        self.assertEqual(queue.blocked_counter, 1)
+
+        yield from queue.set_up()
+        yield from producer
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[1, 2], [3]])
+        self.assertEqual(queue.dropped_counter, 0)
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_drop_newest(self):
+        queue = self.queue(capacity=2, policy=Queue.DROP_NEWEST)
+
+        yield from queue.process([1, 2, 3])
+        yield from queue.set_up()
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[1, 2]])
+        self.assertEqual(queue.dropped_counter, 1)
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_drop_oldest(self):
+        queue = self.queue(capacity=2, policy=Queue.DROP_OLDEST)
+
+        yield from queue.process([1, 2, 3])
+        yield from queue.set_up()
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[2, 3]])
+        self.assertEqual(queue.dropped_counter, 1)
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_coalesce(self):
+        queue = self.queue(capacity=2, policy=Queue.COALESCE, key=lambda item: item[0])
+
+        yield from queue.process([('a', 1), ('b', 1), ('a', 2), ('c', 1)])
+        yield from queue.set_up()
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[('b', 1), ('c', 1)]])     # 'a' kept its place as oldest
+        self.assertEqual(queue.coalesced_counter, 1)
+        self.assertEqual(queue.dropped_counter, 1)
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_compiled(self):
+        queue = self.queue(capacity=2, policy=Queue.DROP_NEWEST)
+        pipeline.compile(Element() >> queue)
+        yield from queue.set_up()
+
+        yield from queue.process([1, 2, 3])
+        yield from asyncio.sleep(0.01)
+
+        self.assertEqual(self.memory.batches, [[1, 2]])
+
+        yield from queue.tear_down()
+
+    @async_test
+    def test_tear_down_releases_producer(self):
+        queue = self.queue(capacity=1)
+        producer = self.run_async(queue.process([1, 2]))
+        yield from asyncio.sleep(0.01)
+
+        yield from queue.tear_down()
+        yield from asyncio.wait_for(producer, 1)
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            Queue(policy='unknown')
+        with self.assertRaises(ValueError):
+            Queue(policy=Queue.COALESCE)
+        with self.assertRaises(ValueError):
+            Queue(capacity=0)
+
+
 if __name__ == '__main__':
     unittest.main()
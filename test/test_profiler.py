@@ -0,0 +1,213 @@
+from utils import *
+
+import os
+import time
+import tempfile
+
+from sensationdriver.profiler import Profiler
+from sensationdriver.profiler import BinaryProfiler
+from sensationdriver.profiler import Sampler
+from sensationdriver.profiler import read_profile
+from sensationdriver.profiler import convert
+from sensationdriver.message import VibrationRecord
+from sensationdriver.pipeline import Element
+from sensationdriver import protocol
+
+
+class TestBinaryProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'profile.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def vibration_message(self, actor_index, intensity):
+        message = protocol.Message()
+        message.type = protocol.Message.VIBRATION
+        message.vibration.target_region = protocol.Vibration.Region.Value("CHEST")
+        message.vibration.actor_index = actor_index
+        message.vibration.intensity = intensity
+        message.vibration.priority = 0
+        return message
+
+    def test_records_arguments(self):
+        profiler = BinaryProfiler()
+        profiler.log("set_intensity", 3, 0.5, 100, 0.75, 'direct')
+        profiler.save_data(self.path)
+
+        entries = list(read_profile(self.path))
+
+        self.assertEqual(len(entries), 1)
+        action, milliseconds, arguments = entries[0]
+        self.assertEqual(action, "set_intensity")
+        self.assertEqual(arguments, [3, 0.5, 100, 0.75, 'direct'])
+        self.assertIsInstance(arguments[0], int)
+        self.assertAlmostEqual(milliseconds, time.time() * 1000, delta=1000)
+
+    def test_unpacks_vibrations(self):
+        profiler = BinaryProfiler()
+        profiler.log("parse", self.vibration_message(3, 0.25))
+        profiler.log("process", VibrationRecord(1, 2, 0.5, 100))
+        profiler.save_data(self.path)
+
+        entries = list(read_profile(self.path))
+
+        self.assertEqual(entries[0][2], [VibrationRecord(protocol.Vibration.Region.Value("CHEST"), 3, 0.25, 0)])
+        self.assertEqual(entries[1][2], [VibrationRecord(1, 2, 0.5, 100)])
+
+    def test_other_objects_recorded_by_class_name(self):
+        profiler = BinaryProfiler()
+        profiler.log("parse", object())
+        profiler.save_data(self.path)
+
+        self.assertEqual(list(read_profile(self.path))[0][2], ['object'])
+
+    def test_drops_arguments_beyond_slots(self):
+        profiler = BinaryProfiler()
+        profiler.log("many", *range(BinaryProfiler.SLOTS + 2))
+        profiler.save_data(self.path)
+
+        self.assertEqual(list(read_profile(self.path))[0][2], list(range(BinaryProfiler.SLOTS)))
+
+    def test_ring_buffer_keeps_latest(self):
+        profiler = BinaryProfiler(capacity=3)
+        for index in range(5):
+            profiler.log("probe", index)
+        profiler.save_data(self.path)
+
+        self.assertEqual([arguments[0] for action, milliseconds, arguments in read_profile(self.path)], [2, 3, 4])
+        self.assertEqual(profiler.overwritten_counter, 2)
+
+    def test_streams_when_full(self):
+        profiler = BinaryProfiler(capacity=3, path=self.path)
+        for index in range(5):
+            profiler.log("probe", index)
+        self.assertEqual(len(list(read_profile(self.path))), 3)
+
+        profiler.log("other", 'text')
+        profiler.close()
+
+        entries = list(read_profile(self.path))
+        self.assertEqual([arguments[0] for action, milliseconds, arguments in entries], [0, 1, 2, 3, 4, 'text'])
+        self.assertEqual(entries[-1][0], "other")
+        self.assertEqual(profiler.overwritten_counter, 0)
+
+    def test_timestamps_increase(self):
+        profiler = BinaryProfiler(path=self.path)
+        for index in range(10):
+            profiler.log("probe", index)
+        profiler.close()
+
+        milliseconds = [entry[1] for entry in read_profile(self.path)]
+        self.assertEqual(milliseconds, sorted(milliseconds))
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 64)
+
+        with self.assertRaises(ValueError):
+            list(read_profile(self.path))
+
+    def test_convert_to_text_profile(self):
+        profiler = BinaryProfiler()
+        profiler.log("parse", self.vibration_message(3, 0.5))
+        profiler.log("set_pwm", 3, 0.5)
+        profiler.save_data(self.path)
+        text_path = os.path.join(self.directory.name, 'profile.txt')
+
+        convert(self.path, text_path)
+
+        with open(text_path) as f:
+            lines = f.read().split("\n")
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(lines[0], r"^parse;\d+\.\d+;target_region: CHEST;actor_index: 3;intensity: 0\.5;priority: 0;$")
+        self.assertRegex(lines[1], r"^set_pwm;\d+\.\d+;3;0\.5$")
+
+
+class TestSampler(unittest.TestCase):
+    def test_records_every_nth_entry(self):
+        profiler = Profiler(sampler=Sampler(every=3))
+        for index in range(7):
+            profiler.log("probe", index)
+
+        self.assertEqual([entry[2][0] for entry in profiler.entries], [2, 5])
+
+    def test_rates_per_action(self):
+        profiler = Profiler(sampler=Sampler(rates={ "set_pwm": 2, "parse": 0 }))
+        for index in range(4):
+            profiler.log("set_pwm", index)
+            profiler.log("parse", index)
+            profiler.log("process", index)
+
+        actions = [entry[0] for entry in profiler.entries]
+        self.assertEqual(actions.count("set_pwm"), 2)
+        self.assertEqual(actions.count("parse"), 0)
+        self.assertEqual(actions.count("process"), 4)
+
+    def test_budget_exhausted(self):
+        sampler = Sampler(budget=0.001, interval=60)        # 60 ms
+        profiler = Profiler(sampler=sampler)
+
+        self.assertTrue(sampler.admit())
+        time.sleep(0.07)
+        sampler.recorded()
+        profiler.log("probe")
+
+        self.assertEqual(profiler.entries, [])
+
+    def test_budget_renewed_every_interval(self):
+        sampler = Sampler(budget=0.5, interval=0.2)         # 100 ms
+
+        self.assertTrue(sampler.admit())
+        time.sleep(0.11)
+        sampler.recorded()
+        self.assertFalse(sampler.admit())
+
+        time.sleep(0.1)
+        self.assertTrue(sampler.admit())
+
+    def test_exhausted_until_interval_ends(self):
+        sampler = Sampler(budget=0.5, interval=0.2)         # 100 ms
+        self.assertFalse(sampler.exhausted)
+
+        sampler.admit()
+        time.sleep(0.11)
+        sampler.recorded()
+        self.assertTrue(sampler.exhausted)
+
+        time.sleep(0.15)
+        self.assertFalse(sampler.exhausted)
+
+    def test_elements_skip_logging_when_exhausted(self):
+        class RecordingProfiler(object):
+            def __init__(profiler, sampler):
+                profiler.sampler = sampler
+                profiler.actions = []
+            def log(profiler, action, *args):
+                profiler.actions.append(action)
+
+        sampler = Sampler(budget=0.5)
+        element = Element()
+        element.profiler = RecordingProfiler(sampler)
+
+        element._profile("recorded")
+        sampler.exhausted = True
+        element._profile("skipped")
+
+        self.assertEqual(element.profiler.actions, ["recorded"])
+
+    def test_binary_profiler(self):
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'profile.bin')
+        profiler = BinaryProfiler(sampler=Sampler(every=2))
+        for index in range(6):
+            profiler.log("probe", index)
+        profiler.save_data(path)
+
+        self.assertEqual([arguments[0] for action, milliseconds, arguments in read_profile(path)], [1, 3, 5])
+        directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
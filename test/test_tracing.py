@@ -0,0 +1,129 @@
+from utils import *
+
+import time
+
+from sensationdriver.tracing import Tracer
+from sensationdriver.message import Parser
+from sensationdriver.message import VibrationRecord
+from sensationdriver import protocol
+
+
+def vibration(actor_index, client_timestamp):
+    vibration = protocol.Vibration()
+    vibration.target_region = protocol.Vibration.Region.Value("LEFT_HAND")
+    vibration.actor_index = actor_index
+    vibration.intensity = 0.5
+    if client_timestamp is not None:
+        vibration.client_timestamp = client_timestamp
+    return vibration
+
+def microseconds_ago(seconds):
+    return int((time.time() - seconds) * 1000000)
+
+
+class TestTracer(unittest.TestCase):
+    def trace(self, tracer, vibration, driver):
+        tracer.received()
+        tracer.parsed(vibration)
+        tracer.dispatched(vibration, driver)
+        tracer.written(driver)
+
+    def test_records_all_hops(self):
+        tracer = Tracer()
+        driver = object()
+
+        self.trace(tracer, vibration(1, microseconds_ago(0.05)), driver)
+
+        for hop in Tracer.HOPS:
+            self.assertEqual(tracer.histograms[hop].count, 1)
+        self.assertGreaterEqual(tracer.histograms['network'].max, 0.045)
+        self.assertGreaterEqual(tracer.histograms['total'].max, tracer.histograms['network'].max)
+
+    def test_ignores_vibrations_without_timestamp(self):
+        tracer = Tracer()
+        driver = object()
+
+        self.trace(tracer, vibration(1, None), driver)
+        tracer.received()
+        tracer.dispatched(VibrationRecord(0, 1, 0.5, 100), driver)
+        tracer.written(driver)
+
+        self.assertEqual(tracer.histograms['total'].count, 0)
+
+    def test_completed_by_the_own_driver_only(self):
+        tracer = Tracer()
+        driver, other_driver = object(), object()
+        traced = vibration(1, microseconds_ago(0.01))
+
+        tracer.received()
+        tracer.parsed(traced)
+        tracer.dispatched(traced, driver)
+        tracer.written(other_driver)
+        self.assertEqual(tracer.histograms['total'].count, 0)
+
+        tracer.written(driver)
+        tracer.written(driver)
+        self.assertEqual(tracer.histograms['total'].count, 1)
+
+    def test_drops_oldest_open_trace(self):
+        tracer = Tracer(capacity=2)
+        driver = object()
+        vibrations = [vibration(index, microseconds_ago(0.01)) for index in range(3)]
+
+        tracer.received()
+        for traced in vibrations:
+            tracer.parsed(traced)
+        for traced in vibrations:
+            tracer.dispatched(traced, driver)
+        tracer.written(driver)
+
+        self.assertEqual(tracer.dropped_counter, 1)
+        self.assertEqual(tracer.histograms['total'].count, 2)
+
+    def test_clock_skew_counted(self):
+        tracer = Tracer()
+
+        self.trace(tracer, vibration(1, microseconds_ago(-1)), object())     # client clock one second ahead
+
+        self.assertEqual(tracer.skew_counter, 2)       # network and total
+        self.assertEqual(tracer.histograms['network'].max, 0)
+
+    def test_report(self):
+        tracer = Tracer()
+        self.trace(tracer, vibration(1, microseconds_ago(0.01)), object())
+
+        lines = tracer.report()
+
+        self.assertEqual(len(lines), len(Tracer.HOPS) + 1)
+        self.assertTrue(lines[0].startswith("latency network: count 1"))
+
+    def test_reset(self):
+        tracer = Tracer()
+        self.trace(tracer, vibration(1, microseconds_ago(0.01)), object())
+
+        tracer.reset()
+
+        self.assertEqual(tracer.snapshot()['total']['count'], 0)
+
+
+class TestParserTracing(unittest.TestCase):
+    def test_parser_stamps_vibrations(self):
+        tracer = Tracer()
+        parser = Parser()
+        parser.tracer = tracer
+        driver = object()
+
+        message = protocol.Message()
+        message.type = protocol.Message.VIBRATION
+        message.vibration.CopyFrom(vibration(2, microseconds_ago(0.01)))
+
+        tracer.received()
+        result = parser.process_sync([message.SerializeToString()])
+        tracer.dispatched(result[0].vibration, driver)
+        tracer.written(driver)
+
+        self.assertEqual(tracer.histograms['parse'].count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()